@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2013 Astroman Technologies LLC
+# All rights reserved.
+"""Match constants shared by the models and the log parser
+
+Kept free of any Django imports so that the parser and goonpugd can use
+them without loading the ORM.
+
+"""
+
+STATUS_UNKNOWN = 0
+STATUS_PENDING = 1
+STATUS_LIVE = 2
+STATUS_COMPLETE = 3
+STATUS_CANCELLED = 4
+STATUS = (
+    (STATUS_UNKNOWN, 'Unknown'),
+    (STATUS_PENDING, 'Pending'),
+    (STATUS_LIVE, 'Live'),
+    (STATUS_COMPLETE, 'Complete'),
+    (STATUS_CANCELLED, 'Cancelled'),
+)
+
+TEAM_OTHER = 0
+TEAM_A = 1
+TEAM_B = 2
+TEAM = (
+    (TEAM_OTHER, 'Other'),
+    (TEAM_A, 'Team A'),
+    (TEAM_B, 'Team B'),
+)
+
+SIDE_OTHER = 0
+SIDE_CT = 1
+SIDE_T = 2
+SIDE = (
+    (SIDE_OTHER, 'Other'),
+    (SIDE_CT, 'CT'),
+    (SIDE_T, 'T'),
+)
+
+SIDES = {
+    'CT': SIDE_CT,
+    'TERRORIST': SIDE_T
+}
+
+WIN_TYPE_NORMAL = 0
+WIN_TYPE_DEFUSED = 1
+WIN_TYPE_EXPLODED = 2
+WIN_TYPE_SAVED = 3
+WIN_TYPE = (
+    (WIN_TYPE_NORMAL, 'Normal'),
+    (WIN_TYPE_DEFUSED, 'Bomb was defused'),
+    (WIN_TYPE_EXPLODED, 'Bomb was exploded'),
+    (WIN_TYPE_SAVED, 'Bomb site was saved')
+)
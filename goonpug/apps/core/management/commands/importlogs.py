@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2013 Peter Rowlands
+# All rights reserved.
+
+from __future__ import division, absolute_import
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from optparse import make_option
+
+from goonpug.libs.goonpugd import open_sink
+from goonpug.libs.importer import import_logs
+from goonpug.libs.outbox import Outbox, OutboxSender
+from goonpug.libs.replay import MatchCounter
+from goonpug.libs.sinks import SINKS
+
+
+class Command(BaseCommand):
+    args = 'PATH...'
+    help = 'Import matches from a tree of historical srcds L*.log files'
+    option_list = BaseCommand.option_list + (
+        make_option('-j', '--jobs', dest='jobs', action='store',
+                    default=None, help='number of parser processes '
+                    '(defaults to the number of CPUs)'),
+        make_option('--batch-size', dest='batch_size', action='store',
+                    default=50, help='number of queued rounds or matches '
+                    'to submit per API request'),
+        make_option('--sink', dest='sink', action='store', type='choice',
+                    choices=SINKS, default='outbox',
+                    help='where to send the matches found: outbox (queued '
+                    'on disk, then POSTed to the API), http (POSTed right '
+                    'away), file (appended to --sink-file as JSON lines) or '
+                    'db (stored directly in the database)'),
+        make_option('--sink-file', dest='sink_file', action='store',
+                    default='-', help='file for --sink=file (default '
+                    'stdout)'),
+        make_option('--outbox', dest='outbox', action='store',
+                    help='directory to queue matches in until the API '
+                    'accepts them (default: the GOONPUGD_OUTBOX_DIR '
+                    'setting)'),
+        make_option('--dry-run', action='store_true', dest='dry_run',
+                    help='parse the logs and count matches without '
+                    'submitting them'),
+    )
+
+    def handle(self, *args, **options):
+        if not args:
+            raise CommandError('at least one log file or directory is '
+                               'required')
+        verbose = int(options['verbosity']) > 1
+        if options['jobs']:
+            jobs = int(options['jobs'])
+        else:
+            jobs = None
+        if options['dry_run']:
+            sink = MatchCounter()
+        else:
+            sink = open_sink(options, {
+                'api_url': settings.GOONPUG_API_URL,
+                'outbox': settings.GOONPUGD_OUTBOX_DIR,
+            })
+        try:
+            totals = import_logs(args, sink, processes=jobs,
+                                 verbose=verbose)
+        except IOError as e:
+            raise CommandError(e)
+        if totals['elapsed']:
+            rate = totals['lines'] / totals['elapsed']
+        else:
+            rate = 0
+        self.stdout.write('importlogs: parsed %d lines from %d files (%d '
+                          'servers) in %.2fs (%d lines/sec)' % (
+                              totals['lines'], totals['files'],
+                              totals['servers'], totals['elapsed'], rate))
+        self.stdout.write('importlogs: %d matches found, %d skipped' % (
+            totals['matches'], totals['skipped']))
+        if not isinstance(sink, Outbox) or not totals['matches']:
+            return
+        outbox = sink
+        sender = OutboxSender(outbox, settings.GOONPUG_API_URL,
+                              batch_size=int(options['batch_size']))
+        sender.start()
+        try:
+            while sender.drain(60.0):
+                self.stdout.write('importlogs: %d entries waiting to be '
+                                  'submitted' % len(outbox))
+        except KeyboardInterrupt:
+            self.stdout.write('importlogs: %d entries left in the outbox' %
+                              len(outbox))
+        sender.stop()
+        self.stdout.write('importlogs: submitted %d entries, %d refused' % (
+            sender.sent, sender.failed))
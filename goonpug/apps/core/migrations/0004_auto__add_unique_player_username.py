@@ -0,0 +1,325 @@
+# -*- coding: utf-8 -*-
+import datetime
+from south.db import db
+from south.v2 import SchemaMigration
+from django.db import models
+
+
+class Migration(SchemaMigration):
+
+    def forwards(self, orm):
+        # Adding unique constraint on 'Player', fields ['username']
+        db.create_unique(u'core_player', ['username'])
+
+
+    def backwards(self, orm):
+        # Removing unique constraint on 'Player', fields ['username']
+        db.delete_unique(u'core_player', ['username'])
+
+
+    models = {
+        u'auth.group': {
+            'Meta': {'object_name': 'Group'},
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'name': ('django.db.models.fields.CharField', [], {'unique': 'True', 'max_length': '80'}),
+            'permissions': ('django.db.models.fields.related.ManyToManyField', [], {'to': u"orm['auth.Permission']", 'symmetrical': 'False', 'blank': 'True'})
+        },
+        u'auth.permission': {
+            'Meta': {'ordering': "(u'content_type__app_label', u'content_type__model', u'codename')", 'unique_together': "((u'content_type', u'codename'),)", 'object_name': 'Permission'},
+            'codename': ('django.db.models.fields.CharField', [], {'max_length': '100'}),
+            'content_type': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['contenttypes.ContentType']"}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'name': ('django.db.models.fields.CharField', [], {'max_length': '50'})
+        },
+        u'contenttypes.contenttype': {
+            'Meta': {'ordering': "('name',)", 'unique_together': "(('app_label', 'model'),)", 'object_name': 'ContentType', 'db_table': "'django_content_type'"},
+            'app_label': ('django.db.models.fields.CharField', [], {'max_length': '100'}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'model': ('django.db.models.fields.CharField', [], {'max_length': '100'}),
+            'name': ('django.db.models.fields.CharField', [], {'max_length': '100'})
+        },
+        u'core.match': {
+            'Meta': {'unique_together': "(('server', 'start_time'),)", 'object_name': 'Match'},
+            'config_knife_round': ('django.db.models.fields.BooleanField', [], {'default': 'False'}),
+            'config_ot': ('django.db.models.fields.BooleanField', [], {'default': 'True'}),
+            'config_password': ('django.db.models.fields.CharField', [], {'max_length': '64', 'blank': 'True'}),
+            'current_map': ('django.db.models.fields.IntegerField', [], {'default': '0'}),
+            'fingerprint': ('django.db.models.fields.CharField', [], {'max_length': '40', 'blank': 'True'}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'map_mode': ('django.db.models.fields.IntegerField', [], {'default': '0'}),
+            'name': ('django.db.models.fields.CharField', [], {'max_length': '64', 'blank': 'True'}),
+            'paused': ('django.db.models.fields.BooleanField', [], {'default': 'False'}),
+            'ruleset': ('django.db.models.fields.IntegerField', [], {'default': '1'}),
+            'score_a': ('django.db.models.fields.IntegerField', [], {'default': '0'}),
+            'score_b': ('django.db.models.fields.IntegerField', [], {'default': '0'}),
+            'season': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['core.Season']"}),
+            'server': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['core.Server']"}),
+            'start_time': ('django.db.models.fields.DateTimeField', [], {}),
+            'status': ('django.db.models.fields.IntegerField', [], {'default': '1'}),
+            'team_a': ('django.db.models.fields.related.ForeignKey', [], {'blank': 'True', 'related_name': "'match_team_a'", 'null': 'True', 'to': u"orm['core.Team']"}),
+            'team_b': ('django.db.models.fields.related.ForeignKey', [], {'blank': 'True', 'related_name': "'match_team_b'", 'null': 'True', 'to': u"orm['core.Team']"})
+        },
+        u'core.matchmap': {
+            'Meta': {'unique_together': "(('match', 'map_number'),)", 'object_name': 'MatchMap'},
+            'current_period': ('django.db.models.fields.IntegerField', [], {'default': '0'}),
+            'end_time': ('django.db.models.fields.DateTimeField', [], {'null': 'True', 'blank': 'True'}),
+            'has_demo': ('django.db.models.fields.BooleanField', [], {'default': 'False'}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'map_name': ('django.db.models.fields.CharField', [], {'default': "''", 'max_length': '64'}),
+            'map_number': ('django.db.models.fields.IntegerField', [], {}),
+            'match': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['core.Match']"}),
+            'score_1': ('django.db.models.fields.IntegerField', [], {'default': '0'}),
+            'score_2': ('django.db.models.fields.IntegerField', [], {'default': '0'}),
+            'sha1sum': ('django.db.models.fields.CharField', [], {'max_length': '40', 'blank': 'True'}),
+            'start_time': ('django.db.models.fields.DateTimeField', [], {'null': 'True', 'blank': 'True'}),
+            'zip_url': ('django.db.models.fields.CharField', [], {'default': "''", 'max_length': '256'})
+        },
+        u'core.matchmapscore': {
+            'Meta': {'object_name': 'MatchMapScore'},
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'match_map': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['core.MatchMap']"}),
+            'score1_half1': ('django.db.models.fields.IntegerField', [], {}),
+            'score1_half2': ('django.db.models.fields.IntegerField', [], {}),
+            'score2_half1': ('django.db.models.fields.IntegerField', [], {}),
+            'score2_half2': ('django.db.models.fields.IntegerField', [], {}),
+            'score_type': ('django.db.models.fields.IntegerField', [], {'default': '0'})
+        },
+        u'core.matchpayload': {
+            'Meta': {'object_name': 'MatchPayload'},
+            'data': ('django.db.models.fields.TextField', [], {}),
+            'fingerprint': ('django.db.models.fields.CharField', [], {'max_length': '40', 'db_index': 'True'}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'kind': ('django.db.models.fields.CharField', [], {'max_length': '8'}),
+            'match': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['core.Match']"}),
+            'received': ('django.db.models.fields.DateTimeField', [], {'default': 'datetime.datetime.now'})
+        },
+        u'core.player': {
+            'Meta': {'object_name': 'Player'},
+            'avatar': ('django.db.models.fields.CharField', [], {'default': "''", 'max_length': '256'}),
+            'avatarfull': ('django.db.models.fields.CharField', [], {'default': "''", 'max_length': '256'}),
+            'avatarmedium': ('django.db.models.fields.CharField', [], {'default': "''", 'max_length': '256'}),
+            'date_joined': ('django.db.models.fields.DateTimeField', [], {'default': 'datetime.datetime.now'}),
+            'email': ('django.db.models.fields.EmailField', [], {'max_length': '75', 'blank': 'True'}),
+            'fullname': ('django.db.models.fields.CharField', [], {'max_length': '128'}),
+            'groups': ('django.db.models.fields.related.ManyToManyField', [], {'to': u"orm['auth.Group']", 'symmetrical': 'False', 'blank': 'True'}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'is_active': ('django.db.models.fields.BooleanField', [], {'default': 'True'}),
+            'is_banned': ('django.db.models.fields.BooleanField', [], {'default': 'False'}),
+            'is_staff': ('django.db.models.fields.BooleanField', [], {'default': 'False'}),
+            'is_superuser': ('django.db.models.fields.BooleanField', [], {'default': 'False'}),
+            'last_login': ('django.db.models.fields.DateTimeField', [], {'default': 'datetime.datetime.now'}),
+            'password': ('django.db.models.fields.CharField', [], {'max_length': '128'}),
+            'profileurl': ('django.db.models.fields.CharField', [], {'default': "''", 'max_length': '256'}),
+            'rating': ('django.db.models.fields.FloatField', [], {'default': '25.0'}),
+            'rating_variance': ('django.db.models.fields.FloatField', [], {'default': '8.333'}),
+            'reputation': ('django.db.models.fields.IntegerField', [], {'default': '0'}),
+            'steamid': ('django.db.models.fields.BigIntegerField', [], {'unique': 'True'}),
+            'user_permissions': ('django.db.models.fields.related.ManyToManyField', [], {'to': u"orm['auth.Permission']", 'symmetrical': 'False', 'blank': 'True'}),
+            'username': ('django.db.models.fields.CharField', [], {'unique': 'True', 'max_length': '64'})
+        },
+        u'core.playerban': {
+            'Meta': {'object_name': 'PlayerBan'},
+            'end': ('django.db.models.fields.DateField', [], {}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'link': ('django.db.models.fields.CharField', [], {'max_length': '256'}),
+            'player': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['core.Player']"}),
+            'reason': ('django.db.models.fields.CharField', [], {'max_length': '256'}),
+            'start': ('django.db.models.fields.DateField', [], {})
+        },
+        u'core.playerip': {
+            'Meta': {'unique_together': "(('player', 'ip'),)", 'object_name': 'PlayerIp'},
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'ip': ('django.db.models.fields.CharField', [], {'max_length': '16'}),
+            'player': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['core.Player']"})
+        },
+        u'core.playerkill': {
+            'Meta': {'unique_together': "(('round', 'killer', 'victim'),)", 'object_name': 'PlayerKill'},
+            'headshot': ('django.db.models.fields.BooleanField', [], {'default': 'False'}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'killer': ('django.db.models.fields.related.ForeignKey', [], {'related_name': "'playerkill_player_killer'", 'to': u"orm['core.Player']"}),
+            'killer_team': ('django.db.models.fields.IntegerField', [], {'default': '0'}),
+            'match': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['core.Match']"}),
+            'match_map': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['core.MatchMap']"}),
+            'round': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['core.Round']"}),
+            'victim': ('django.db.models.fields.related.ForeignKey', [], {'related_name': "'playerkill_player_victim'", 'to': u"orm['core.Player']"}),
+            'victim_team': ('django.db.models.fields.IntegerField', [], {'default': '0'}),
+            'weapon': ('django.db.models.fields.CharField', [], {'max_length': '64', 'blank': 'True'})
+        },
+        u'core.playermatch': {
+            'Meta': {'unique_together': "(('match_map', 'player'),)", 'object_name': 'PlayerMatch'},
+            'assists': ('django.db.models.fields.IntegerField', [], {'default': '0'}),
+            'clutch_v1': ('django.db.models.fields.IntegerField', [], {'default': '0'}),
+            'clutch_v2': ('django.db.models.fields.IntegerField', [], {'default': '0'}),
+            'clutch_v3': ('django.db.models.fields.IntegerField', [], {'default': '0'}),
+            'clutch_v4': ('django.db.models.fields.IntegerField', [], {'default': '0'}),
+            'clutch_v5': ('django.db.models.fields.IntegerField', [], {'default': '0'}),
+            'current_side': ('django.db.models.fields.IntegerField', [], {'default': '0'}),
+            'damage': ('django.db.models.fields.FloatField', [], {'default': '0.0'}),
+            'deaths': ('django.db.models.fields.IntegerField', [], {'default': '0'}),
+            'defuses': ('django.db.models.fields.IntegerField', [], {'default': '0'}),
+            'first_side': ('django.db.models.fields.IntegerField', [], {'default': '0'}),
+            'hsp': ('django.db.models.fields.FloatField', [], {'default': '0.0'}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'k1': ('django.db.models.fields.IntegerField', [], {'default': '0'}),
+            'k2': ('django.db.models.fields.IntegerField', [], {'default': '0'}),
+            'k3': ('django.db.models.fields.IntegerField', [], {'default': '0'}),
+            'k4': ('django.db.models.fields.IntegerField', [], {'default': '0'}),
+            'k5': ('django.db.models.fields.IntegerField', [], {'default': '0'}),
+            'kills': ('django.db.models.fields.IntegerField', [], {'default': '0'}),
+            'match': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['core.Match']"}),
+            'match_map': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['core.MatchMap']"}),
+            'plants': ('django.db.models.fields.IntegerField', [], {'default': '0'}),
+            'player': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['core.Player']"}),
+            'rounds_lost': ('django.db.models.fields.IntegerField', [], {'default': '0'}),
+            'rounds_tied': ('django.db.models.fields.IntegerField', [], {'default': '0'}),
+            'rounds_won': ('django.db.models.fields.IntegerField', [], {'default': '0'}),
+            'rws': ('django.db.models.fields.FloatField', [], {'default': '0.0'}),
+            'score': ('django.db.models.fields.IntegerField', [], {'default': '0'}),
+            'team': ('django.db.models.fields.IntegerField', [], {'default': '0'}),
+            'tks': ('django.db.models.fields.IntegerField', [], {'default': '0'})
+        },
+        u'core.playermatchweapons': {
+            'Meta': {'unique_together': "(('match_map', 'player', 'weapon'),)", 'object_name': 'PlayerMatchWeapons'},
+            'damage': ('django.db.models.fields.IntegerField', [], {'default': '0'}),
+            'deaths': ('django.db.models.fields.IntegerField', [], {'default': '0'}),
+            'headshots': ('django.db.models.fields.IntegerField', [], {'default': '0'}),
+            'hits': ('django.db.models.fields.IntegerField', [], {'default': '0'}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'kills': ('django.db.models.fields.IntegerField', [], {'default': '0'}),
+            'match': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['core.Match']"}),
+            'match_map': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['core.MatchMap']"}),
+            'player': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['core.Player']"}),
+            'weapon': ('django.db.models.fields.CharField', [], {'max_length': '64'})
+        },
+        u'core.playerround': {
+            'Meta': {'unique_together': "(('round', 'player'),)", 'object_name': 'PlayerRound'},
+            'assists': ('django.db.models.fields.IntegerField', [], {'default': '0'}),
+            'clutch_v1': ('django.db.models.fields.IntegerField', [], {'default': '0'}),
+            'clutch_v2': ('django.db.models.fields.IntegerField', [], {'default': '0'}),
+            'clutch_v3': ('django.db.models.fields.IntegerField', [], {'default': '0'}),
+            'clutch_v4': ('django.db.models.fields.IntegerField', [], {'default': '0'}),
+            'clutch_v5': ('django.db.models.fields.IntegerField', [], {'default': '0'}),
+            'current_side': ('django.db.models.fields.IntegerField', [], {'default': '0'}),
+            'damage': ('django.db.models.fields.IntegerField', [], {'default': '0'}),
+            'deaths': ('django.db.models.fields.IntegerField', [], {'default': '0'}),
+            'defuses': ('django.db.models.fields.IntegerField', [], {'default': '0'}),
+            'first_side': ('django.db.models.fields.IntegerField', [], {'default': '0'}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'k1': ('django.db.models.fields.IntegerField', [], {'default': '0'}),
+            'k2': ('django.db.models.fields.IntegerField', [], {'default': '0'}),
+            'k3': ('django.db.models.fields.IntegerField', [], {'default': '0'}),
+            'k4': ('django.db.models.fields.IntegerField', [], {'default': '0'}),
+            'k5': ('django.db.models.fields.IntegerField', [], {'default': '0'}),
+            'kills': ('django.db.models.fields.IntegerField', [], {'default': '0'}),
+            'plants': ('django.db.models.fields.IntegerField', [], {'default': '0'}),
+            'player': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['core.Player']"}),
+            'round': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['core.Round']"}),
+            'rws': ('django.db.models.fields.FloatField', [], {'default': '0.0'}),
+            'tks': ('django.db.models.fields.IntegerField', [], {'default': '0'})
+        },
+        u'core.playerseason': {
+            'Meta': {'unique_together': "(('player', 'season'),)", 'object_name': 'PlayerSeason'},
+            'assists': ('django.db.models.fields.IntegerField', [], {'default': '0'}),
+            'clutch_v1': ('django.db.models.fields.IntegerField', [], {'default': '0'}),
+            'clutch_v2': ('django.db.models.fields.IntegerField', [], {'default': '0'}),
+            'clutch_v3': ('django.db.models.fields.IntegerField', [], {'default': '0'}),
+            'clutch_v4': ('django.db.models.fields.IntegerField', [], {'default': '0'}),
+            'clutch_v5': ('django.db.models.fields.IntegerField', [], {'default': '0'}),
+            'damage': ('django.db.models.fields.FloatField', [], {'default': '0'}),
+            'deaths': ('django.db.models.fields.IntegerField', [], {'default': '0'}),
+            'defuses': ('django.db.models.fields.IntegerField', [], {'default': '0'}),
+            'hsp': ('django.db.models.fields.FloatField', [], {'default': '0.0'}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'k1': ('django.db.models.fields.IntegerField', [], {'default': '0'}),
+            'k2': ('django.db.models.fields.IntegerField', [], {'default': '0'}),
+            'k3': ('django.db.models.fields.IntegerField', [], {'default': '0'}),
+            'k4': ('django.db.models.fields.IntegerField', [], {'default': '0'}),
+            'k5': ('django.db.models.fields.IntegerField', [], {'default': '0'}),
+            'kills': ('django.db.models.fields.IntegerField', [], {'default': '0'}),
+            'matches_lost': ('django.db.models.fields.IntegerField', [], {'default': '0'}),
+            'matches_tied': ('django.db.models.fields.IntegerField', [], {'default': '0'}),
+            'matches_won': ('django.db.models.fields.IntegerField', [], {'default': '0'}),
+            'plants': ('django.db.models.fields.IntegerField', [], {'default': '0'}),
+            'player': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['core.Player']"}),
+            'rounds_lost': ('django.db.models.fields.IntegerField', [], {'default': '0'}),
+            'rounds_tied': ('django.db.models.fields.IntegerField', [], {'default': '0'}),
+            'rounds_won': ('django.db.models.fields.IntegerField', [], {'default': '0'}),
+            'rws': ('django.db.models.fields.FloatField', [], {'default': '0.0'}),
+            'score': ('django.db.models.fields.IntegerField', [], {'default': '0'}),
+            'season': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['core.Season']"}),
+            'tks': ('django.db.models.fields.IntegerField', [], {'default': '0'})
+        },
+        u'core.playerseasonweapons': {
+            'Meta': {'unique_together': "(('player', 'season', 'weapon'),)", 'object_name': 'PlayerSeasonWeapons'},
+            'damage': ('django.db.models.fields.IntegerField', [], {'default': '0'}),
+            'deaths': ('django.db.models.fields.IntegerField', [], {'default': '0'}),
+            'headshots': ('django.db.models.fields.IntegerField', [], {'default': '0'}),
+            'hits': ('django.db.models.fields.IntegerField', [], {'default': '0'}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'kills': ('django.db.models.fields.IntegerField', [], {'default': '0'}),
+            'player': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['core.Player']"}),
+            'season': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['core.Season']"}),
+            'weapon': ('django.db.models.fields.CharField', [], {'max_length': '64'})
+        },
+        u'core.round': {
+            'Meta': {'unique_together': "(('match_map', 'round_number'),)", 'object_name': 'Round'},
+            'backup_file_name': ('django.db.models.fields.CharField', [], {'max_length': '256', 'blank': 'True'}),
+            'bomb_defused': ('django.db.models.fields.BooleanField', [], {'default': 'False'}),
+            'bomb_exploded': ('django.db.models.fields.BooleanField', [], {'default': 'False'}),
+            'bomb_planted': ('django.db.models.fields.BooleanField', [], {'default': 'False'}),
+            'ct_win': ('django.db.models.fields.BooleanField', [], {'default': 'False'}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'match': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['core.Match']"}),
+            'match_map': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['core.MatchMap']"}),
+            'round_number': ('django.db.models.fields.IntegerField', [], {'default': '0'}),
+            'score_a': ('django.db.models.fields.IntegerField', [], {'default': '0'}),
+            'score_b': ('django.db.models.fields.IntegerField', [], {'default': '0'}),
+            't_win': ('django.db.models.fields.BooleanField', [], {'default': 'False'}),
+            'team_win': ('django.db.models.fields.IntegerField', [], {'default': '0'}),
+            'win_type': ('django.db.models.fields.IntegerField', [], {'default': '0'})
+        },
+        u'core.season': {
+            'Meta': {'object_name': 'Season'},
+            'end': ('django.db.models.fields.DateField', [], {}),
+            'event': ('django.db.models.fields.CharField', [], {'max_length': '64'}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'is_active': ('django.db.models.fields.BooleanField', [], {'default': 'False'}),
+            'link': ('django.db.models.fields.CharField', [], {'max_length': '128'}),
+            'logo': ('django.db.models.fields.CharField', [], {'max_length': '256'}),
+            'name': ('django.db.models.fields.CharField', [], {'max_length': '64'}),
+            'start': ('django.db.models.fields.DateField', [], {})
+        },
+        u'core.server': {
+            'Meta': {'unique_together': "(('ip', 'port'),)", 'object_name': 'Server'},
+            'gotv_ip': ('django.db.models.fields.CharField', [], {'max_length': '16', 'blank': 'True'}),
+            'gotv_port': ('django.db.models.fields.IntegerField', [], {'default': '27020'}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'ip': ('django.db.models.fields.CharField', [], {'max_length': '16'}),
+            'name': ('django.db.models.fields.CharField', [], {'max_length': '128', 'blank': 'True'}),
+            'port': ('django.db.models.fields.IntegerField', [], {'default': '27015'}),
+            'rcon': ('django.db.models.fields.CharField', [], {'max_length': '64', 'blank': 'True'})
+        },
+        u'core.statsdelta': {
+            'Meta': {'object_name': 'StatsDelta'},
+            'amounts': ('django.db.models.fields.TextField', [], {}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'kind': ('django.db.models.fields.CharField', [], {'max_length': '8'}),
+            'match_map': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['core.MatchMap']"}),
+            'target_id': ('django.db.models.fields.IntegerField', [], {})
+        },
+        u'core.team': {
+            'Meta': {'object_name': 'Team'},
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'link': ('django.db.models.fields.CharField', [], {'max_length': '128'}),
+            'name': ('django.db.models.fields.CharField', [], {'max_length': '128'}),
+            'shorthandle': ('django.db.models.fields.CharField', [], {'max_length': '64'})
+        },
+        u'core.teamseason': {
+            'Meta': {'object_name': 'TeamSeason'},
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'season': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['core.Season']"}),
+            'team': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['core.Team']"})
+        }
+    }
+
+    complete_apps = ['core']
\ No newline at end of file
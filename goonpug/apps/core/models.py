@@ -4,31 +4,38 @@
 
 from __future__ import division
 
+import base64
+import collections
+import json
+import threading
+import zlib
+
 from skills import GaussianRating
 from skills.trueskill import TrueSkillGameInfo
 
-from django.db import models
+from django.db import IntegrityError, models, transaction
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
 from django.contrib.auth.models import AbstractBaseUser, PermissionsMixin, \
     UserManager
 from django.utils import timezone
 
 from srcds.objects import SteamId
 
+from goonpug.libs.payloads import encode_payload, expand_payload, \
+    payload_fingerprint
+
+from . import constants
+
 
 class Match(models.Model):
 
-    STATUS_UNKNOWN = 0
-    STATUS_PENDING = 1
-    STATUS_LIVE = 2
-    STATUS_COMPLETE = 3
-    STATUS_CANCELLED = 4
-    STATUS = (
-        (STATUS_UNKNOWN, 'Unknown'),
-        (STATUS_PENDING, 'Pending'),
-        (STATUS_LIVE, 'Live'),
-        (STATUS_COMPLETE, 'Complete'),
-        (STATUS_CANCELLED, 'Cancelled'),
-    )
+    STATUS_UNKNOWN = constants.STATUS_UNKNOWN
+    STATUS_PENDING = constants.STATUS_PENDING
+    STATUS_LIVE = constants.STATUS_LIVE
+    STATUS_COMPLETE = constants.STATUS_COMPLETE
+    STATUS_CANCELLED = constants.STATUS_CANCELLED
+    STATUS = constants.STATUS
 
     RULESET_CUSTOM = 0
     RULESET_ESEA = 1
@@ -48,28 +55,17 @@ class Match(models.Model):
         (MAP_MODE_BO3, 'Best of 3'),
     )
 
-    TEAM_OTHER = 0
-    TEAM_A = 1
-    TEAM_B = 2
-    TEAM = (
-        (TEAM_OTHER, 'Other'),
-        (TEAM_A, 'Team A'),
-        (TEAM_B, 'Team B'),
-    )
+    TEAM_OTHER = constants.TEAM_OTHER
+    TEAM_A = constants.TEAM_A
+    TEAM_B = constants.TEAM_B
+    TEAM = constants.TEAM
 
-    SIDE_OTHER = 0
-    SIDE_CT = 1
-    SIDE_T = 2
-    SIDE = (
-        (SIDE_OTHER, 'Other'),
-        (SIDE_CT, 'CT'),
-        (SIDE_T, 'T'),
-    )
+    SIDE_OTHER = constants.SIDE_OTHER
+    SIDE_CT = constants.SIDE_CT
+    SIDE_T = constants.SIDE_T
+    SIDE = constants.SIDE
 
-    SIDES = {
-        'CT': SIDE_CT,
-        'TERRORIST': SIDE_T
-    }
+    SIDES = constants.SIDES
 
     name = models.CharField(max_length=64, blank=True)
     server = models.ForeignKey('Server')
@@ -89,6 +85,8 @@ class Match(models.Model):
     map_mode = models.IntegerField(choices=MAP_MODE, default=MAP_MODE_BO1)
     current_map = models.IntegerField(default=0)
     start_time = models.DateTimeField()
+    # payload_fingerprint() of the match payload the stats came from
+    fingerprint = models.CharField(max_length=40, blank=True)
 
     class Meta:
         unique_together = (('server', 'start_time',),)
@@ -130,13 +128,120 @@ class MatchMapScore(models.Model):
     score2_half2 = models.IntegerField()
 
 
+class MatchPayloadManager(models.Manager):
+
+    def store(self, match, kind, payload):
+        """Save payload (a match or round payload) for match
+
+        If an identical payload is already stored for match, that one is
+        returned instead.
+
+        """
+        fingerprint = payload_fingerprint(payload)
+        try:
+            return self.filter(match=match, kind=kind,
+                               fingerprint=fingerprint)[0]
+        except IndexError:
+            pass
+        match_payload = self.model(match=match, kind=kind,
+                                   fingerprint=fingerprint)
+        match_payload.set_payload(payload)
+        match_payload.save()
+        return match_payload
+
+
+class MatchPayload(models.Model):
+
+    """A raw match or round payload, stored once for the tasks to load
+
+    The payload is kept in the compact format, zlib compressed and base64
+    encoded since Django 1.5 has no BinaryField. Round payloads are kept
+    too, since the match payload for streamed rounds has none of its own.
+
+    """
+
+    KIND_MATCH = 'match'
+    KIND_ROUND = 'round'
+    KIND = (
+        (KIND_MATCH, 'Match'),
+        (KIND_ROUND, 'Round'),
+    )
+
+    match = models.ForeignKey('Match')
+    kind = models.CharField(max_length=8, choices=KIND)
+    fingerprint = models.CharField(max_length=40, db_index=True)
+    received = models.DateTimeField(default=timezone.now)
+    data = models.TextField()
+
+    objects = MatchPayloadManager()
+
+    def set_payload(self, payload):
+        self.data = base64.b64encode(zlib.compress(
+            encode_payload(self.kind, payload)))
+
+    def get_payload(self):
+        return expand_payload(json.loads(zlib.decompress(
+            base64.b64decode(self.data))))
+
+
+def steamid64(steamid):
+    """Return steamid (a 64 bit id or a STEAM_X:Y:Z string) as an int"""
+    try:
+        return int(steamid)
+    except ValueError:
+        return SteamId(steamid).id64()
+
+
+class PlayerIdCache(object):
+
+    """Thread safe LRU map of 64 bit steamids to Player pks
+
+    Only pks of committed players belong in here, since nothing is
+    evicted when a transaction which created a player rolls back.
+
+    """
+
+    def __init__(self, size=4096):
+        self.size = size
+        self._ids = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._ids)
+
+    def get(self, steamid):
+        with self._lock:
+            pk = self._ids.pop(steamid, None)
+            if pk is not None:
+                self._ids[steamid] = pk
+            return pk
+
+    def update(self, ids):
+        with self._lock:
+            for steamid, pk in ids.items():
+                self._ids.pop(steamid, None)
+                self._ids[steamid] = pk
+            while len(self._ids) > self.size:
+                self._ids.popitem(last=False)
+
+    def discard(self, steamid):
+        with self._lock:
+            self._ids.pop(steamid, None)
+
+    def clear(self):
+        with self._lock:
+            self._ids.clear()
+
+
+# pks of the players seen in recent matches, shared by every ingestion in
+# this process
+player_ids = PlayerIdCache()
+
+
 class PlayerManager(UserManager):
 
     def get_or_create_from_steamid(self, steamid):
-        try:
-            steamid = int(steamid)
-        except ValueError:
-            steamid = SteamId(steamid).id64()
+        steamid = steamid64(steamid)
         try:
             player = self.get(username=unicode(steamid))
             return (player, False)
@@ -144,6 +249,49 @@ class PlayerManager(UserManager):
             player = self.create(username=unicode(steamid), steamid=steamid)
             return (player, True)
 
+    def resolve_steamids(self, steamids):
+        """Return a {steamid64: pk} map, creating any missing players
+
+        Players which aren't in player_ids are looked up with one query and
+        the ones which don't exist yet are created with one bulk insert.
+        This commits, so don't call it from a transaction which may still
+        be rolled back.
+
+        """
+        ids = {}
+        wanted = set()
+        for steamid in set(steamid64(steamid) for steamid in steamids):
+            pk = player_ids.get(steamid)
+            if pk is None:
+                wanted.add(steamid)
+            else:
+                ids[steamid] = pk
+        if not wanted:
+            return ids
+        try:
+            with transaction.commit_on_success():
+                found = self._player_ids(wanted)
+                missing = wanted.difference(found)
+                if missing:
+                    self.bulk_create([
+                        self.model(username=unicode(steamid), steamid=steamid)
+                        for steamid in missing])
+                    found.update(self._player_ids(missing))
+        except IntegrityError:
+            # another worker created some of the same players first
+            found = dict((steamid,
+                          self.get_or_create_from_steamid(steamid)[0].pk)
+                         for steamid in wanted)
+        player_ids.update(found)
+        ids.update(found)
+        return ids
+
+    def _player_ids(self, steamids):
+        usernames = [unicode(steamid) for steamid in steamids]
+        return dict((int(username), pk) for username, pk in
+                    self.filter(username__in=usernames).values_list(
+                        'username', 'pk'))
+
 
 class Player(AbstractBaseUser, PermissionsMixin):
 
@@ -195,6 +343,11 @@ class Player(AbstractBaseUser, PermissionsMixin):
         return SteamId.id64_to_str(self.steamid)
 
 
+@receiver(post_delete, sender=Player)
+def forget_player_id(sender, instance, **kwargs):
+    player_ids.discard(instance.steamid)
+
+
 class PlayerBan(models.Model):
 
     player = models.ForeignKey('Player')
@@ -366,16 +519,11 @@ class PlayerSeasonWeapons(models.Model):
 
 class Round(models.Model):
 
-    WIN_TYPE_NORMAL = 0
-    WIN_TYPE_DEFUSED = 1
-    WIN_TYPE_EXPLODED = 2
-    WIN_TYPE_SAVED = 3
-    WIN_TYPE = (
-        (WIN_TYPE_NORMAL, 'Normal'),
-        (WIN_TYPE_DEFUSED, 'Bomb was defused'),
-        (WIN_TYPE_EXPLODED, 'Bomb was exploded'),
-        (WIN_TYPE_SAVED, 'Bomb site was saved')
-    )
+    WIN_TYPE_NORMAL = constants.WIN_TYPE_NORMAL
+    WIN_TYPE_DEFUSED = constants.WIN_TYPE_DEFUSED
+    WIN_TYPE_EXPLODED = constants.WIN_TYPE_EXPLODED
+    WIN_TYPE_SAVED = constants.WIN_TYPE_SAVED
+    WIN_TYPE = constants.WIN_TYPE
 
     match = models.ForeignKey('Match')
     match_map = models.ForeignKey('MatchMap')
@@ -431,6 +579,40 @@ class Server(models.Model):
         unique_together = (('ip', 'port'),)
 
 
+class StatsDelta(models.Model):
+
+    """What processing a match map added to a running total
+
+    Season stats, season weapon stats and player ratings are running
+    totals. Each amount a match map adds to one of them is recorded here,
+    so processing the match again can take off exactly what the last run
+    added before adding the new amounts.
+
+    """
+
+    KIND_SEASON = 'season'
+    KIND_WEAPONS = 'weapons'
+    KIND_RATING = 'rating'
+    KIND = (
+        (KIND_SEASON, 'PlayerSeason'),
+        (KIND_WEAPONS, 'PlayerSeasonWeapons'),
+        (KIND_RATING, 'Player rating'),
+    )
+
+    match_map = models.ForeignKey('MatchMap')
+    kind = models.CharField(max_length=8, choices=KIND)
+    # pk of the PlayerSeason, PlayerSeasonWeapons or Player
+    target_id = models.IntegerField()
+    # JSON {field: amount added}
+    amounts = models.TextField()
+
+    def get_amounts(self):
+        return json.loads(self.amounts)
+
+    def set_amounts(self, amounts):
+        self.amounts = json.dumps(amounts)
+
+
 class Team(models.Model):
 
     name = models.CharField(max_length=128)
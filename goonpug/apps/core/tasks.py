@@ -4,313 +4,506 @@
 
 from __future__ import absolute_import, division
 
+import collections
 import requests
 import skills
 from skills.trueskill import TrueSkillGameInfo
 
 from celery import task
+from celery.exceptions import MaxRetriesExceededError
 from celery.utils.log import get_task_logger
 
 from django.conf import settings
-from django.db.models import Sum
+from django.db import transaction
+from django.db.models import F, Sum
 
-from .models import Match, MatchMap, Player, PlayerKill, \
+from .models import Match, MatchMap, MatchPayload, Player, PlayerKill, \
     PlayerMatchWeapons, PlayerMatch, PlayerRound, PlayerSeason, \
-    PlayerSeasonWeapons, Round
+    PlayerSeasonWeapons, Round, StatsDelta, steamid64
 from .gpskill import GpSkillCalculator
 
 
 logger = get_task_logger(__name__)
 
 
-@task()
-def deserialize_pug_match(match, data):
+def queue_task(parent, task, *args):
+    """Queue task, or run it right away if parent is being run eagerly
+
+    So a match deserialized in process (see DatabaseSink) has its stats
+    updated before it returns, without going through the broker.
+
+    """
+    if parent.request.is_eager:
+        task.apply(args=args)
+    else:
+        task.delay(*args)
+
+
+def load_payload(payload_id):
+    """Return the MatchPayload for payload_id, or None if it is gone
+
+    Payloads are deleted along with their match, if the parser discards it.
+
+    """
+    try:
+        return MatchPayload.objects.select_related('match').get(
+            pk=payload_id)
+    except MatchPayload.DoesNotExist:
+        logger.warning('Payload %d is gone, its match was discarded' %
+                       payload_id)
+        return None
+
+
+@task(default_retry_delay=10, max_retries=30)
+def deserialize_pug_match(payload_id):
+    match_payload = load_payload(payload_id)
+    if match_payload is None:
+        return
+    match = match_payload.match
+    if match.fingerprint == match_payload.fingerprint:
+        logger.info('Match %d is already up to date' % match.pk)
+        return
+    data = match_payload.get_payload()
+    # If the rounds were streamed in separately, wait until they have all
+    # been stored before computing anything from them
+    streamed_rounds = data.get('streamed_rounds', 0)
+    if streamed_rounds and \
+            Round.objects.filter(match=match).count() < streamed_rounds:
+        # run eagerly, the rounds were sent (and stored) before the match,
+        # so waiting would only block the caller
+        if not deserialize_pug_match.request.is_eager:
+            logger.info('Match %d is still waiting for rounds' % match.pk)
+            try:
+                deserialize_pug_match.retry(args=[payload_id])
+            except MaxRetriesExceededError:
+                pass
+        # ratings and season stats from part of a match would be wrong, so
+        # it is set aside until the payload is delivered again
+        logger.warning('Match %d: only got %d of %d rounds, cancelling it' %
+                       (match.pk, Round.objects.filter(match=match).count(),
+                        streamed_rounds))
+        match.status = Match.STATUS_CANCELLED
+        match.save()
+        return
     logger.info('Deserializing match %d' % match.pk)
-    for i, map_data in enumerate(data['match_maps']):
+    if not store_pug_match(match, data, match_payload.fingerprint):
+        logger.info('Match %d is already up to date' % match.pk)
+        return
+    logger.info('Done: Match %d status = STATUS_COMPLETE' % match.pk)
+    queue_task(deserialize_pug_match, update_match_stats, match.pk)
+
+
+@task()
+def deserialize_pug_round(payload_id):
+    match_payload = load_payload(payload_id)
+    if match_payload is None:
+        return
+    match = match_payload.match
+    data = match_payload.get_payload()
+    logger.info('Deserializing match %d round %d' % (
+        match.pk, data['round']['round_number']))
+    players = Player.objects.resolve_steamids(round_steamids([data['round']]))
+    with transaction.commit_on_success():
         match_map, created = MatchMap.objects.get_or_create(
             match=match,
-            map_number=i
+            map_number=data['map_number']
         )
-        match_map.map_name = map_data['map_name']
-        match_map.score_1 = map_data['score_1']
-        match_map.score_2 = map_data['score_2']
-        match_map.current_period = map_data['current_period']
-        # this can be parsed from map_data, but for pugs we only have
-        # one map per match so this works too
-        match_map.start_time = match.start_time
-        match_map.save()
-        for round_data in map_data['rounds']:
-            deserialize_round(match, match_map, round_data)
-        for steamid, weapon_data in map_data['player_match_weapons'].items():
-            deserialize_weapons(match, match_map, steamid, weapon_data)
-    update_match_stats.delay(match)
-    logger.info('Done: Match %d status = STATUS_COMPLETE' % match.pk)
-    match.status = Match.STATUS_COMPLETE
-    match.save()
+        if created:
+            match_map.map_name = data['map_name']
+            match_map.start_time = match.start_time
+            match_map.save()
+        store_rounds(match, match_map, [data['round']], players)
 
 
-def deserialize_round(match, match_map, data):
-    round, created = Round.objects.get_or_create(
-        match=match,
-        match_map=match_map,
-        round_number=data['round_number']
-    )
-    round.bomb_planted = data['bomb_planted']
-    round.bomb_defused = data['bomb_defused']
-    round.bomb_exploded = data['bomb_exploded']
-    round.ct_win = data['ct_win']
-    round.t_win = data['t_win']
-    if data['bomb_defused']:
-        round.win_type = Round.WIN_TYPE_DEFUSED
-    elif data['bomb_exploded']:
-        round.win_type = Round.WIN_TYPE_EXPLODED
-    if data['round_number'] <= 15:
-        period = 1
-    elif data['round_number'] <= 30:
-        period = 2
-    else:
-        period = 3 + ((data['round_number'] - 31) // 3)
-    if data['ct_win']:
-        if period % 2:
-            round.team_win = Match.TEAM_A
-        else:
-            round.team_win = Match.TEAM_B
-    elif data['t_win']:
-        if period % 2:
-            round.team_win = Match.TEAM_B
-        else:
-            round.team_win = Match.TEAM_A
-    round.score_a = data['score_a']
-    round.score_b = data['score_b']
-    round.save()
-    for steamid, player_round in data['player_rounds'].items():
-        deserialize_player_round(round, steamid, player_round, period)
-    for kill_data in data['kills']:
-        deserialize_kill(round, kill_data)
-
-
-def deserialize_player_round(round, steamid, data, period):
-    player, created = Player.objects.get_or_create_from_steamid(steamid)
-    player_round, created = PlayerRound.objects.get_or_create(round=round,
-                                                              player=player)
-    if period % 2:
-        player_round.first_side = player_round.current_side
-    else:
-        if data['current_side'] == Match.SIDE_CT:
-            player_round.first_side = Match.SIDE_T
-        elif data['current_side'] == Match.SIDE_T:
-            player_round.first_side = Match.SIDE_CT
-    player_round.current_side = data['current_side']
-    player_round.kills = data['kills']
-    player_round.assists = data['assists']
-    player_round.deaths = data['deaths']
-    player_round.defuses = data['defuses']
-    player_round.plants = data['plants']
-    player_round.tks = data['tks']
-    player_round.clutch_v1 = data['clutch_v1']
-    player_round.clutch_v2 = data['clutch_v2']
-    player_round.clutch_v3 = data['clutch_v3']
-    player_round.clutch_v4 = data['clutch_v4']
-    player_round.clutch_v5 = data['clutch_v5']
-    player_round.k1 = data['k1']
-    player_round.k2 = data['k2']
-    player_round.k3 = data['k3']
-    player_round.k4 = data['k4']
-    player_round.k5 = data['k5']
-    player_round.damage = data['damage']
-    if 'rws' in data:
-        player_round.rws = data['rws']
-    else:
-        player_round.rws = 0
-    player_round.save()
-
-
-def deserialize_kill(round, data):
-    killer, created = Player.objects.get_or_create_from_steamid(data['killer'])
-    victim, created = Player.objects.get_or_create_from_steamid(data['victim'])
-    kill, created = PlayerKill.objects.get_or_create(
-        match=round.match, match_map=round.match_map, round=round,
-        killer=killer, victim=victim)
-    kill.killer_team = Match.SIDES[data['killer_team']]
-    kill.victim_team = Match.SIDES[data['victim_team']]
-    kill.headshot = data['headshot']
-    kill.weapon = data['weapon']
-    kill.save()
-
-
-def deserialize_weapons(match, match_map, steamid, data):
-    player, created = Player.objects.get_or_create_from_steamid(steamid)
-    for weapon, stats in data.items():
-        match_weapon, created = PlayerMatchWeapons.objects.get_or_create(
-            match=match, match_map=match_map, player=player, weapon=weapon)
-        match_weapon.headshots = stats['headshots']
-        match_weapon.hits = stats['hits']
-        match_weapon.damage = stats['damage']
-        match_weapon.kills = stats['kills']
-        match_weapon.deaths = stats['deaths']
-        match_weapon.save()
+PLAYER_ROUND_STATS = ('kills', 'assists', 'deaths', 'defuses', 'plants',
+                      'tks', 'clutch_v1', 'clutch_v2', 'clutch_v3',
+                      'clutch_v4', 'clutch_v5', 'k1', 'k2', 'k3', 'k4', 'k5',
+                      'damage')
 
+WEAPON_STATS = ('headshots', 'hits', 'damage', 'kills', 'deaths')
 
-@task()
-def update_match_stats(match):
-    match_maps = MatchMap.objects.filter(match=match)
-    for match_map in match_maps:
-        rounds = Round.objects.filter(match_map=match_map)
-        for round in rounds:
-            player_rounds = PlayerRound.objects.filter(round=round).order_by(
-                'round')
-            for player_round in player_rounds:
-                player_match, created = PlayerMatch.objects.get_or_create(
-                    match=match, match_map=match_map,
-                    player=player_round.player)
-                player_match.first_side = player_round.first_side
-                player_match.current_side = player_round.current_side
-                player_match.kills += player_round.kills
-                player_match.assists += player_round.assists
-                player_match.deaths += player_round.deaths
-                player_match.defuses += player_round.defuses
-                player_match.plants += player_round.plants
-                player_match.tks += player_round.tks
-                player_match.clutch_v1 += player_round.clutch_v1
-                player_match.clutch_v2 += player_round.clutch_v2
-                player_match.clutch_v3 += player_round.clutch_v3
-                player_match.clutch_v4 += player_round.clutch_v4
-                player_match.clutch_v5 += player_round.clutch_v5
-                player_match.k1 += player_round.k1
-                player_match.k2 += player_round.k2
-                player_match.k3 += player_round.k3
-                player_match.k4 += player_round.k4
-                player_match.k5 += player_round.k5
-                player_match.damage += player_round.damage
-                player_match.rws += player_round.rws
-                if player_round.current_side == Match.SIDE_CT:
-                    if round.ct_win:
-                        player_match.rounds_won += 1
-                    elif round.t_win:
-                        player_match.rounds_lost += 1
-                    else:
-                        player_match.rounds_tied += 1
-                elif player_round.current_side == Match.SIDE_T:
-                    if round.t_win:
-                        player_match.rounds_won += 1
-                    elif round.ct_win:
-                        player_match.rounds_lost += 1
-                    else:
-                        player_match.rounds_tied += 1
-                headshots = PlayerMatchWeapons.objects.filter(
-                    match_map=match_map,
-                    player=player_match.player
-                ).aggregate(Sum('headshots'))['headshots__sum']
-                hits = PlayerMatchWeapons.objects.filter(
-                    match_map=match_map,
-                    player=player_match.player
-                ).aggregate(Sum('hits'))['hits__sum']
-                if headshots is None:
-                    headshots = 0
-                if hits is None:
-                    hits = 0
-                if hits == 0:
-                    player_match.hsp = 0.0
-                else:
-                    player_match.hsp = headshots / hits
-                player_match.save()
-        update_season_weapons.delay(match_map)
-        update_rating.delay(match_map)
-    update_season_stats.delay(match)
+SEASON_STATS = PLAYER_ROUND_STATS + ('rws', 'rounds_won', 'rounds_lost',
+                                     'rounds_tied')
 
 
-@task
-def update_season_weapons(match_map):
-    match_weapons = PlayerMatchWeapons.objects.filter(match_map=match_map)
-    for match_weapon in match_weapons:
-        season_weapon, created = PlayerSeasonWeapons.objects.get_or_create(
-            player=match_weapon.player, season=match_map.match.season,
-            weapon=match_weapon.weapon)
-        season_weapon.headshots += match_weapon.headshots
-        season_weapon.hits += match_weapon.hits
-        season_weapon.damage += match_weapon.damage
-        season_weapon.kills += match_weapon.kills
-        season_weapon.deaths += match_weapon.deaths
-        season_weapon.save()
+def store_pug_match(match, data, fingerprint=''):
+    """Store a match payload's maps, rounds and weapon stats
 
+    Players are resolved up front, then everything else is written in one
+    transaction, with bulk inserts, and the match is marked complete at the
+    end of it. Anything stored for the match before is replaced.
 
-@task
-def update_season_stats(match):
-    season = match.season
-    match_maps = MatchMap.objects.filter(match=match)
+    fingerprint is the payload's payload_fingerprint(). Returns False,
+    without storing anything, if the match was already stored from that
+    same payload.
+
+    """
+    steamids = set()
+    for map_data in data['match_maps']:
+        steamids.update(round_steamids(map_data['rounds']))
+        steamids.update(map_data['player_match_weapons'])
+    players = Player.objects.resolve_steamids(steamids)
+    with transaction.commit_on_success():
+        # workers storing payloads for the same match take turns
+        match = Match.objects.select_for_update().get(pk=match.pk)
+        if fingerprint and match.fingerprint == fingerprint:
+            return False
+        for i, map_data in enumerate(data['match_maps']):
+            match_map, created = MatchMap.objects.get_or_create(
+                match=match,
+                map_number=i
+            )
+            match_map.map_name = map_data['map_name']
+            match_map.score_1 = map_data['score_1']
+            match_map.score_2 = map_data['score_2']
+            match_map.current_period = map_data['current_period']
+            # this can be parsed from map_data, but for pugs we only have
+            # one map per match so this works too
+            match_map.start_time = match.start_time
+            match_map.save()
+            store_rounds(match, match_map, map_data['rounds'], players)
+            store_weapons(match, match_map, map_data['player_match_weapons'],
+                          players)
+        match.status = Match.STATUS_COMPLETE
+        match.fingerprint = fingerprint
+        match.save()
+    return True
+
+
+def round_steamids(rounds_data):
+    """Return the steamids of every player in rounds"""
+    steamids = set()
+    for data in rounds_data:
+        steamids.update(data['player_rounds'])
+        for kill_data in data['kills']:
+            steamids.add(kill_data['killer'])
+            steamids.add(kill_data['victim'])
+    return steamids
+
+
+def get_round_period(round_number):
+    if round_number <= 15:
+        return 1
+    elif round_number <= 30:
+        return 2
+    return 3 + ((round_number - 31) // 3)
+
+
+def store_rounds(match, match_map, rounds_data, players):
+    """Store rounds with their player rounds and kills, in bulk
+
+    Rounds already stored with the same numbers are replaced. players maps
+    64 bit steamids to Player pks, see PlayerManager.resolve_steamids.
+
+    """
+    if not rounds_data:
+        return
+    numbers = [data['round_number'] for data in rounds_data]
+    Round.objects.filter(match_map=match_map,
+                         round_number__in=numbers).delete()
+    rounds = []
+    for data in rounds_data:
+        round = Round(match=match, match_map=match_map,
+                      round_number=data['round_number'],
+                      bomb_planted=data['bomb_planted'],
+                      bomb_defused=data['bomb_defused'],
+                      bomb_exploded=data['bomb_exploded'],
+                      ct_win=data['ct_win'], t_win=data['t_win'],
+                      score_a=data['score_a'], score_b=data['score_b'])
+        if data['bomb_defused']:
+            round.win_type = Round.WIN_TYPE_DEFUSED
+        elif data['bomb_exploded']:
+            round.win_type = Round.WIN_TYPE_EXPLODED
+        period = get_round_period(data['round_number'])
+        if data['ct_win']:
+            if period % 2:
+                round.team_win = Match.TEAM_A
+            else:
+                round.team_win = Match.TEAM_B
+        elif data['t_win']:
+            if period % 2:
+                round.team_win = Match.TEAM_B
+            else:
+                round.team_win = Match.TEAM_A
+        rounds.append(round)
+    Round.objects.bulk_create(rounds)
+    # bulk_create doesn't set pks
+    round_ids = dict(Round.objects.filter(
+        match_map=match_map, round_number__in=numbers
+    ).values_list('round_number', 'pk'))
+
+    player_rounds = []
+    kills = []
+    for data in rounds_data:
+        round_id = round_ids[data['round_number']]
+        period = get_round_period(data['round_number'])
+        for steamid, stats in data['player_rounds'].items():
+            player_round = PlayerRound(
+                round_id=round_id, player_id=players[steamid64(steamid)],
+                current_side=stats['current_side'],
+                rws=stats.get('rws', 0))
+            for field in PLAYER_ROUND_STATS:
+                setattr(player_round, field, stats[field])
+            # first_side is only filled in from the second half on, where
+            # it is the other side to current_side
+            if not period % 2:
+                if stats['current_side'] == Match.SIDE_CT:
+                    player_round.first_side = Match.SIDE_T
+                elif stats['current_side'] == Match.SIDE_T:
+                    player_round.first_side = Match.SIDE_CT
+            player_rounds.append(player_round)
+        # a killer and victim pair is unique within a round, the last kill
+        # wins as it did with get_or_create
+        round_kills = collections.OrderedDict()
+        for kill_data in data['kills']:
+            killer_id = players[steamid64(kill_data['killer'])]
+            victim_id = players[steamid64(kill_data['victim'])]
+            round_kills[killer_id, victim_id] = PlayerKill(
+                match=match, match_map=match_map, round_id=round_id,
+                killer_id=killer_id, victim_id=victim_id,
+                killer_team=Match.SIDES.get(kill_data['killer_team'],
+                                            Match.SIDE_OTHER),
+                victim_team=Match.SIDES.get(kill_data['victim_team'],
+                                            Match.SIDE_OTHER),
+                headshot=kill_data['headshot'],
+                weapon=kill_data['weapon'])
+        kills.extend(round_kills.values())
+    PlayerRound.objects.bulk_create(player_rounds)
+    PlayerKill.objects.bulk_create(kills)
+
+
+def store_weapons(match, match_map, weapons_data, players):
+    """Replace a match map's per player weapon stats, in bulk"""
+    PlayerMatchWeapons.objects.filter(match_map=match_map).delete()
+    weapons = []
+    for steamid, player_weapons in weapons_data.items():
+        player_id = players[steamid64(steamid)]
+        for weapon, stats in player_weapons.items():
+            match_weapon = PlayerMatchWeapons(
+                match=match, match_map=match_map, player_id=player_id,
+                weapon=weapon)
+            for field in WEAPON_STATS:
+                setattr(match_weapon, field, stats[field])
+            weapons.append(match_weapon)
+    PlayerMatchWeapons.objects.bulk_create(weapons)
+
+
+@task()
+def update_match_stats(match_id):
+    match = Match.objects.get(pk=match_id)
+    match_maps = list(MatchMap.objects.filter(match=match))
+    with transaction.commit_on_success():
+        # player matches are built from scratch, so that running this again
+        # doesn't add the rounds in twice
+        PlayerMatch.objects.filter(match=match).delete()
+        for match_map in match_maps:
+            update_player_matches(match, match_map)
     for match_map in match_maps:
-        player_matches = PlayerMatch.objects.filter(match_map=match_map)
-        for player_match in player_matches:
-            if player_match.first_side == 0:
-                pr = PlayerRound.objects.filter(
-                    player=player_match.player,
-                    round__match_map=player_match.match_map
-                )[0]
-                if pr.round.get_period() % 2:
-                    player_match.first_side = pr.current_side
+        queue_task(update_match_stats, update_season_weapons, match_map.pk)
+        queue_task(update_match_stats, update_rating, match_map.pk)
+    queue_task(update_match_stats, update_season_stats, match.pk)
+
+
+def update_player_matches(match, match_map):
+    rounds = Round.objects.filter(match_map=match_map)
+    for round in rounds:
+        player_rounds = PlayerRound.objects.filter(round=round).order_by(
+            'round')
+        for player_round in player_rounds:
+            player_match, created = PlayerMatch.objects.get_or_create(
+                match=match, match_map=match_map,
+                player=player_round.player)
+            player_match.first_side = player_round.first_side
+            player_match.current_side = player_round.current_side
+            player_match.kills += player_round.kills
+            player_match.assists += player_round.assists
+            player_match.deaths += player_round.deaths
+            player_match.defuses += player_round.defuses
+            player_match.plants += player_round.plants
+            player_match.tks += player_round.tks
+            player_match.clutch_v1 += player_round.clutch_v1
+            player_match.clutch_v2 += player_round.clutch_v2
+            player_match.clutch_v3 += player_round.clutch_v3
+            player_match.clutch_v4 += player_round.clutch_v4
+            player_match.clutch_v5 += player_round.clutch_v5
+            player_match.k1 += player_round.k1
+            player_match.k2 += player_round.k2
+            player_match.k3 += player_round.k3
+            player_match.k4 += player_round.k4
+            player_match.k5 += player_round.k5
+            player_match.damage += player_round.damage
+            player_match.rws += player_round.rws
+            if player_round.current_side == Match.SIDE_CT:
+                if round.ct_win:
+                    player_match.rounds_won += 1
+                elif round.t_win:
+                    player_match.rounds_lost += 1
                 else:
-                    if pr.current_side == Match.SIDE_T:
-                        player_match.first_side = Match.SIDE_CT
-                    elif pr.current_side == Match.SIDE_CT:
-                        player_match.first_side = Match.SIDE_T
-                player_match.save()
-            player_season, created = PlayerSeason.objects.get_or_create(
-                player=player_match.player, season=season)
-            player_season.kills += player_match.kills
-            player_season.assists += player_match.assists
-            player_season.deaths += player_match.deaths
-            player_season.score = player_match.score
-            player_season.defuses += player_match.defuses
-            player_season.plants += player_match.plants
-            player_season.tks += player_match.tks
-            player_season.clutch_v1 += player_match.clutch_v1
-            player_season.clutch_v2 += player_match.clutch_v2
-            player_season.clutch_v3 += player_match.clutch_v3
-            player_season.clutch_v4 += player_match.clutch_v4
-            player_season.clutch_v5 += player_match.clutch_v5
-            player_season.k1 += player_match.k1
-            player_season.k2 += player_match.k2
-            player_season.k3 += player_match.k3
-            player_season.k4 += player_match.k4
-            player_season.k5 += player_match.k5
-            player_season.damage += player_match.damage
-            player_season.rws += player_match.rws
-            player_season.rounds_won += player_match.rounds_won
-            player_season.rounds_lost += player_match.rounds_lost
-            player_season.rounds_tied += player_match.rounds_tied
-            if match_map.score_1 > match_map.score_2:
-                if player_match.first_side == Match.SIDE_CT:
-                    player_season.matches_won += 1
-                elif player_match.first_side == Match.SIDE_T:
-                    player_season.matches_lost += 1
-            elif match_map.score_1 < match_map.score_2:
-                if player_match.first_side == Match.SIDE_CT:
-                    player_season.matches_lost += 1
-                elif player_match.first_side == Match.SIDE_T:
-                    player_season.matches_won += 1
-            else:
-                player_season.matches_tied += 1
-            headshots = PlayerSeasonWeapons.objects.filter(
-                season=season,
-                player=player_season.player
+                    player_match.rounds_tied += 1
+            elif player_round.current_side == Match.SIDE_T:
+                if round.t_win:
+                    player_match.rounds_won += 1
+                elif round.ct_win:
+                    player_match.rounds_lost += 1
+                else:
+                    player_match.rounds_tied += 1
+            headshots = PlayerMatchWeapons.objects.filter(
+                match_map=match_map,
+                player=player_match.player
             ).aggregate(Sum('headshots'))['headshots__sum']
-            hits = PlayerSeasonWeapons.objects.filter(
-                season=season,
-                player=player_season.player
+            hits = PlayerMatchWeapons.objects.filter(
+                match_map=match_map,
+                player=player_match.player
             ).aggregate(Sum('hits'))['hits__sum']
             if headshots is None:
                 headshots = 0
             if hits is None:
                 hits = 0
             if hits == 0:
-                player_season.hsp = 0.0
+                player_match.hsp = 0.0
+            else:
+                player_match.hsp = headshots / hits
+            player_match.save()
+
+
+def add_amounts(model, pk, amounts, sign=1):
+    """Add (or with sign=-1, take off) amounts to the fields of a row
+
+    The arithmetic is done by the database, so concurrent updates of the
+    same row for other matches are never lost.
+
+    """
+    model.objects.filter(pk=pk).update(**dict(
+        (field, F(field) + sign * amount)
+        for field, amount in amounts.items()))
+
+
+def add_delta(match_map, kind, obj, amounts):
+    """Add amounts to obj and return the StatsDelta which records it"""
+    add_amounts(type(obj), obj.pk, amounts)
+    delta = StatsDelta(match_map=match_map, kind=kind, target_id=obj.pk)
+    delta.set_amounts(amounts)
+    return delta
+
+
+def revert_deltas(match_map, kind, model):
+    """Take off whatever was added for match_map before, and forget it"""
+    deltas = StatsDelta.objects.filter(match_map=match_map, kind=kind)
+    for delta in deltas:
+        add_amounts(model, delta.target_id, delta.get_amounts(), -1)
+    deltas.delete()
+
+
+def lock_match_map(match_map_id):
+    """Return the MatchMap for match_map_id, locked until the transaction ends
+
+    Stats for one match map are applied by one worker at a time, since
+    each run first takes off what the last one added.
+
+    """
+    return MatchMap.objects.select_for_update().select_related(
+        'match').get(pk=match_map_id)
+
+
+@task
+def update_season_weapons(match_map_id):
+    with transaction.commit_on_success():
+        match_map = lock_match_map(match_map_id)
+        revert_deltas(match_map, StatsDelta.KIND_WEAPONS,
+                      PlayerSeasonWeapons)
+        match_weapons = PlayerMatchWeapons.objects.filter(
+            match_map=match_map)
+        deltas = []
+        for match_weapon in match_weapons:
+            season_weapon, created = \
+                PlayerSeasonWeapons.objects.get_or_create(
+                    player=match_weapon.player,
+                    season=match_map.match.season,
+                    weapon=match_weapon.weapon)
+            amounts = dict((field, getattr(match_weapon, field))
+                           for field in WEAPON_STATS)
+            deltas.append(add_delta(match_map, StatsDelta.KIND_WEAPONS,
+                                    season_weapon, amounts))
+        StatsDelta.objects.bulk_create(deltas)
+
+
+@task
+def update_season_stats(match_id):
+    match = Match.objects.select_related('season').get(pk=match_id)
+    season = match.season
+    with transaction.commit_on_success():
+        for match_map in MatchMap.objects.filter(match=match):
+            update_season_stats_for_map(season, lock_match_map(match_map.pk))
+
+
+def update_season_stats_for_map(season, match_map):
+    revert_deltas(match_map, StatsDelta.KIND_SEASON, PlayerSeason)
+    deltas = []
+    player_matches = PlayerMatch.objects.filter(match_map=match_map)
+    for player_match in player_matches:
+        if player_match.first_side == 0:
+            pr = PlayerRound.objects.filter(
+                player=player_match.player,
+                round__match_map=player_match.match_map
+            )[0]
+            if pr.round.get_period() % 2:
+                player_match.first_side = pr.current_side
             else:
-                player_season.hsp = headshots / hits
-            player_season.save()
+                if pr.current_side == Match.SIDE_T:
+                    player_match.first_side = Match.SIDE_CT
+                elif pr.current_side == Match.SIDE_CT:
+                    player_match.first_side = Match.SIDE_T
+            player_match.save()
+        player_season, created = PlayerSeason.objects.get_or_create(
+            player=player_match.player, season=season)
+        amounts = dict((field, getattr(player_match, field))
+                       for field in SEASON_STATS)
+        if match_map.score_1 > match_map.score_2:
+            if player_match.first_side == Match.SIDE_CT:
+                amounts['matches_won'] = 1
+            elif player_match.first_side == Match.SIDE_T:
+                amounts['matches_lost'] = 1
+        elif match_map.score_1 < match_map.score_2:
+            if player_match.first_side == Match.SIDE_CT:
+                amounts['matches_lost'] = 1
+            elif player_match.first_side == Match.SIDE_T:
+                amounts['matches_won'] = 1
+        else:
+            amounts['matches_tied'] = 1
+        deltas.append(add_delta(match_map, StatsDelta.KIND_SEASON,
+                                player_season, amounts))
+        headshots = PlayerSeasonWeapons.objects.filter(
+            season=season,
+            player=player_season.player
+        ).aggregate(Sum('headshots'))['headshots__sum']
+        hits = PlayerSeasonWeapons.objects.filter(
+            season=season,
+            player=player_season.player
+        ).aggregate(Sum('hits'))['hits__sum']
+        if headshots is None:
+            headshots = 0
+        if hits is None:
+            hits = 0
+        if hits == 0:
+            hsp = 0.0
+        else:
+            hsp = headshots / hits
+        PlayerSeason.objects.filter(pk=player_season.pk).update(
+            score=player_match.score, hsp=hsp)
+    StatsDelta.objects.bulk_create(deltas)
 
 
 @task
-def update_rating(match_map):
+def update_rating(match_map_id):
+    with transaction.commit_on_success():
+        match_map = lock_match_map(match_map_id)
+        # rate the match map again from the ratings its players had before
+        # it (as long as they have played nothing since)
+        revert_deltas(match_map, StatsDelta.KIND_RATING, Player)
+        update_rating_for_map(match_map)
+
+
+def update_rating_for_map(match_map):
     logger.info('Updating ratings for match_map %d' % match_map.pk)
     cts = PlayerMatch.objects.filter(
         match_map=match_map, first_side=Match.SIDE_CT
@@ -365,21 +558,29 @@ def update_rating(match_map):
     calc = GpSkillCalculator()
     game_info = TrueSkillGameInfo()
     new_ratings = calc.new_ratings(teams, game_info)
+    deltas = []
     for team in [cts, ts]:
         for pm in team:
             player = pm.player
             old_skill = player.get_conservative_rating()
             rating = new_ratings.rating_by_id(player.pk)
+            amounts = {
+                'rating': rating.mean - player.rating,
+                'rating_variance': rating.stdev - player.rating_variance,
+            }
+            deltas.append(add_delta(match_map, StatsDelta.KIND_RATING,
+                                    player, amounts))
             player.rating = rating.mean
             player.rating_variance = rating.stdev
-            player.save()
             new_skill = player.get_conservative_rating()
             logger.info('Player %s: %f -> %f (%+f)' % (
                 player.fullname, old_skill, new_skill, new_skill - old_skill))
+    StatsDelta.objects.bulk_create(deltas)
 
 
 @task
-def update_steam_details(player):
+def update_steam_details(player_id):
+    player = Player.objects.get(pk=player_id)
     url = 'http://api.steampowered.com/ISteamUser/GetPlayerSummaries/v0002/'
     payload = {'key': settings.STEAM_API_KEY, 'steamids': player.username}
     r = requests.get(url, params=payload)
@@ -399,5 +600,5 @@ def update_steam_details(player):
 
 @task
 def update_steam_details_all():
-    for p in Player.objects.all():
-        update_steam_details.delay(p)
+    for player_id in Player.objects.values_list('pk', flat=True):
+        update_steam_details.delay(player_id)
@@ -14,3 +14,836 @@ class SimpleTest(TestCase):
         Tests that 1 + 1 always equals 2.
         """
         self.assertEqual(1 + 1, 2)
+
+
+class GoonPugParserTest(TestCase):
+
+    def setUp(self):
+        from goonpug.libs.logs import GoonPugParser
+        self.parser = GoonPugParser()
+        self.parser.parse_line(
+            'L 10/05/2013 - 20:00:00: Log file started (file '
+            '"logs/L192_168_1_10_27015_201310052000_000.log") '
+            '(game "/home/csgo") (version "5432")')
+
+    def start_match(self):
+        self.parser.parse_line(
+            'L 10/05/2013 - 20:00:00: Started map "de_dust2" '
+            '(CRC "-12345")')
+        self.parser.parse_line(
+            'L 10/05/2013 - 20:00:00: GoonPUG triggered "Start_Match"')
+
+    def test_abandoned_match_discarded(self):
+        """Restarting a match discards the rounds streamed for it"""
+        from goonpug.libs.importer import MatchCollector
+        self.parser.sink = collector = MatchCollector()
+        self.parser.current_server = {'ip': '192.168.1.10', 'port': 27015}
+        self.start_match()
+        start_time = self.parser.current_match['start_time']
+        self.parser.rounds_sent.add((0, 1))
+        self.parser.parse_line(
+            'L 10/05/2013 - 20:10:00: GoonPUG triggered "Start_Match"')
+        self.assertEqual(collector.entries, [('match', {
+            'server': {'ip': '192.168.1.10', 'port': 27015},
+            'start_time': start_time,
+            'discard': True,
+        })])
+        self.assertEqual(self.parser.rounds_sent, set())
+        self.assertNotEqual(self.parser.current_match['start_time'],
+                            start_time)
+
+    def test_keyword_dispatch(self):
+        """Lines are parsed as the event type their keyword names"""
+        from srcds.events import generic
+        from goonpug.libs.logs import GoonPugAttackEvent
+        self.start_match()
+        lines = [
+            ('L 10/05/2013 - 20:00:01: "P0<2><STEAM_1:0:1000><CT>" '
+             '[1 2 3] attacked "P5<7><STEAM_1:1:1005><TERRORIST>" '
+             '[4 5 6] with "ak47" (damage "20") (damage_armor "3") '
+             '(health "80") (armor "90") (hitgroup "chest")',
+             GoonPugAttackEvent),
+            ('L 10/05/2013 - 20:00:02: Team "CT" scored "1" with "5" '
+             'players', generic.RoundEndTeamEvent),
+            ('L 10/05/2013 - 20:00:02: Team "CT" triggered '
+             '"SFUI_Notice_CTs_Win"', generic.TeamActionEvent),
+            ('L 10/05/2013 - 20:00:03: World triggered "Round_Start"',
+             generic.WorldActionEvent),
+            ('L 10/05/2013 - 20:00:04: "P0<2><STEAM_1:0:1000><CT>" '
+             'triggered "Got_The_Bomb"', generic.PlayerActionEvent),
+            ('L 10/05/2013 - 20:00:05: "P0<2><STEAM_1:0:1000><CT>" '
+             'disconnected (reason "Disconnect")',
+             generic.DisconnectionEvent),
+        ]
+        for line, cls in lines:
+            self.assertEqual(self.parser.parse_line(line), cls)
+
+    def test_idle_dispatch(self):
+        """Only team and connection tracking happens outside a match"""
+        from srcds.events import csgo
+        attack = ('L 10/05/2013 - 20:00:01: "P0<2><STEAM_1:0:1000><CT>" '
+                  '[1 2 3] attacked "P5<7><STEAM_1:1:1005><TERRORIST>" '
+                  '[4 5 6] with "ak47" (damage "20") (damage_armor "3") '
+                  '(health "80") (armor "90") (hitgroup "chest")')
+        self.assertEqual(self.parser.parse_line(attack), None)
+        self.assertEqual(self.parser.parse_line(
+            'L 10/05/2013 - 20:00:01: "P0<2><STEAM_1:0:1000>" switched '
+            'from team <Unassigned> to <CT>'), csgo.SwitchTeamEvent)
+        self.assertEqual(len(self.parser.cts), 1)
+        self.start_match()
+        self.assertNotEqual(self.parser.parse_line(attack), None)
+
+    def test_unhandled_lines(self):
+        """Lines which match no handled event are rejected"""
+        for line in [
+                'L 10/05/2013 - 20:00:01: "P0<2><STEAM_1:0:1000><CT>" '
+                'say "killed it"',
+                'L 10/05/2013 - 20:00:01: "P0<2><STEAM_1:0:1000><CT>" '
+                'purchased "ak47"',
+                'garbage',
+                '']:
+            self.assertEqual(self.parser.parse_line(line), None)
+
+    def test_decode_timestamp(self):
+        """Cached timestamp decoding matches strptime"""
+        import datetime
+        from goonpug.libs.logs import decode_timestamp
+        for timestamp in ['10/05/2013 - 20:00:01', '10/05/2013 - 23:59:59',
+                          '10/06/2013 - 00:00:00']:
+            self.assertEqual(decode_timestamp(timestamp),
+                             datetime.datetime.strptime(
+                                 timestamp, '%m/%d/%Y - %H:%M:%S'))
+
+    def test_seen_players_bounded(self):
+        """Only the most recently seen players are remembered"""
+        self.parser.max_seen_players = 2
+        for i in range(3):
+            self.parser.parse_line(
+                'L 10/05/2013 - 20:00:01: "P%d<%d><STEAM_1:0:%d><>" '
+                'entered the game' % (i, i, i))
+        self.parser.parse_line(
+            'L 10/05/2013 - 20:00:02: "P1<1><STEAM_1:0:1><>" '
+            'entered the game')
+        self.assertEqual(
+            [player['name'] for player in self.parser.seen_players.values()],
+            ['P2', 'P1'])
+
+
+class PayloadFormatTest(TestCase):
+
+    def setUp(self):
+        from .models import player_ids
+        player_ids.clear()
+
+    def round_payload(self):
+        from .constants import SIDE_CT, SIDE_T
+        player_round = {
+            'current_side': SIDE_T, 'kills': 1, 'assists': 0, 'deaths': 0,
+            'defuses': 0, 'plants': 1, 'tks': 0, 'clutch_v1': 0,
+            'clutch_v2': 0, 'clutch_v3': 0, 'clutch_v4': 0, 'clutch_v5': 0,
+            'k1': 1, 'k2': 0, 'k3': 0, 'k4': 0, 'k5': 0, 'damage': 100,
+            'rws': 100.0,
+        }
+        victim_round = dict(player_round, current_side=SIDE_CT, kills=0,
+                            deaths=1, plants=0, k1=0, damage=0, rws=0.0)
+        return {
+            'server': {'ip': '192.168.1.10', 'port': 27015},
+            'start_time': '2013-10-06T01:00:00Z',
+            'map_number': 0,
+            'map_name': 'de_dust2',
+            'round': {
+                'round_number': 1, 'score_a': 0, 'score_b': 1,
+                'bomb_planted': True, 'bomb_defused': False,
+                'bomb_exploded': True, 'ct_win': False, 't_win': True,
+                'player_rounds': {
+                    76561197960267728: player_round,
+                    76561197960267729: victim_round,
+                },
+                'kills': [{
+                    'killer': 76561197960267728, 'killer_team': 'TERRORIST',
+                    'victim': 76561197960267729, 'victim_team': 'CT',
+                    'weapon': 'ak47', 'headshot': True,
+                }, {
+                    # a suicide after switching to spectator
+                    'killer': 76561197960267729, 'killer_team': 'Spectator',
+                    'victim': 76561197960267729, 'victim_team': '',
+                    'weapon': 'world', 'headshot': False,
+                }],
+            },
+        }
+
+    def test_compact_round_trip(self):
+        """Compact payloads expand back to the plain payload"""
+        from goonpug.libs.payloads import compact_payload, expand_payload
+        payload = self.round_payload()
+        self.assertEqual(expand_payload(compact_payload('round', payload)),
+                         payload)
+        self.assertEqual(expand_payload(payload), payload)
+
+    def test_post_gzipped_compact_round(self):
+        """The API accepts gzipped compact payloads"""
+        from goonpug.libs.payloads import encode_payload, gzip_body
+        from .models import Match, MatchPayload, PlayerKill, PlayerRound
+        body = gzip_body('[%s]' % encode_payload('round',
+                                                 self.round_payload()))
+        r = self.client.post('/api/pugmatch/round/', body,
+                             content_type='application/json',
+                             HTTP_CONTENT_ENCODING='gzip')
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(PlayerRound.objects.count(), 2)
+        self.assertEqual(
+            sorted(PlayerKill.objects.values_list('weapon', 'killer_team')),
+            [('ak47', Match.SIDE_T), ('world', Match.SIDE_OTHER)])
+        # streamed match payloads have no rounds, so the round payload is
+        # the only copy of its round and is kept
+        self.assertEqual(MatchPayload.objects.get().get_payload(),
+                         self.round_payload())
+        r = self.client.post('/api/pugmatch/round/', body[:-8],
+                             content_type='application/json',
+                             HTTP_CONTENT_ENCODING='gzip')
+        self.assertEqual(r.status_code, 400)
+
+
+class MatchIngestTest(TestCase):
+
+    def setUp(self):
+        # cached pks don't survive the rollback after each test
+        from .models import player_ids
+        player_ids.clear()
+
+    def match_payload(self, rounds=30, players=10):
+        from .constants import SIDE_CT, SIDE_T
+        steamids = [76561197960267728 + i for i in range(players)]
+        round_list = []
+        for n in range(1, rounds + 1):
+            player_rounds = {}
+            for i, steamid in enumerate(steamids):
+                player_rounds[steamid] = {
+                    'current_side': SIDE_T if i % 2 else SIDE_CT,
+                    'kills': 1, 'assists': 0,
+                    'deaths': 1, 'defuses': 0, 'plants': 0, 'tks': 0,
+                    'clutch_v1': 0, 'clutch_v2': 0, 'clutch_v3': 0,
+                    'clutch_v4': 0, 'clutch_v5': 0, 'k1': 1, 'k2': 0,
+                    'k3': 0, 'k4': 0, 'k5': 0, 'damage': 100, 'rws': 10.0,
+                }
+            kills = [{
+                'killer': steamids[i], 'killer_team': 'CT',
+                'victim': steamids[i + 1], 'victim_team': 'TERRORIST',
+                'weapon': 'ak47', 'headshot': False,
+            } for i in range(0, players, 2)]
+            round_list.append({
+                'round_number': n, 'score_a': n, 'score_b': 0,
+                'bomb_planted': False, 'bomb_defused': False,
+                'bomb_exploded': False, 'ct_win': True, 't_win': False,
+                'player_rounds': player_rounds, 'kills': kills,
+            })
+        weapon = {'headshots': 1, 'hits': 10, 'damage': 500, 'kills': 3,
+                  'deaths': 0}
+        return {
+            'server': {'ip': '192.168.1.10', 'port': 27015},
+            'start_time': '2013-10-06T01:00:00Z',
+            'match_maps': [{
+                'map_name': 'de_dust2', 'score_1': rounds, 'score_2': 0,
+                'current_period': 2, 'rounds': round_list,
+                'player_match_weapons': dict(
+                    (steamid, {'ak47': weapon, 'awp': weapon})
+                    for steamid in steamids),
+            }],
+        }
+
+    def test_bulk_ingest(self):
+        """A whole match is stored in a few dozen queries"""
+        from django.db import connection
+        from .models import PlayerKill, PlayerMatchWeapons, PlayerRound
+        from .tasks import store_pug_match
+        from .views import get_or_create_pug_match
+        data = self.match_payload()
+        match = get_or_create_pug_match(data)
+        connection.use_debug_cursor = True
+        try:
+            start = len(connection.queries)
+            store_pug_match(match, data)
+            queries = len(connection.queries) - start
+        finally:
+            connection.use_debug_cursor = False
+        self.assertLess(queries, 30)
+        self.assertEqual(PlayerRound.objects.count(), 300)
+        self.assertEqual(PlayerKill.objects.count(), 150)
+        self.assertEqual(PlayerMatchWeapons.objects.count(), 20)
+        # storing it again replaces what is there
+        store_pug_match(match, data)
+        self.assertEqual(PlayerRound.objects.count(), 300)
+        self.assertEqual(PlayerKill.objects.count(), 150)
+
+    def test_create_pug_match(self):
+        """Match payloads are stored once and queued by id"""
+        from .models import Match, MatchPayload, PlayerMatch, PlayerSeason
+        from .views import create_pug_match
+        data = self.match_payload()
+        match = create_pug_match(data, eager=True)
+        payload = MatchPayload.objects.get(match=match)
+        self.assertEqual(payload.kind, MatchPayload.KIND_MATCH)
+        self.assertEqual(payload.get_payload(), data)
+        self.assertEqual(Match.objects.get(pk=match.pk).status,
+                         Match.STATUS_COMPLETE)
+        self.assertEqual(PlayerMatch.objects.filter(match=match).count(), 10)
+        self.assertEqual(PlayerSeason.objects.count(), 10)
+
+    def test_missing_streamed_rounds(self):
+        """A match missing streamed rounds is cancelled, not rated"""
+        from celery.exceptions import MaxRetriesExceededError
+        from .models import Match, MatchPayload, PlayerMatch, PlayerSeason
+        from .tasks import deserialize_pug_match
+        from .views import create_pug_match, create_pug_round
+        data = self.match_payload(rounds=3)
+        rounds = data['match_maps'][0]['rounds']
+        data['match_maps'][0]['rounds'] = []
+        data['streamed_rounds'] = len(rounds)
+
+        def send_round(round_data):
+            create_pug_round({
+                'server': data['server'], 'start_time': data['start_time'],
+                'map_number': 0, 'map_name': 'de_dust2', 'round': round_data,
+            }, eager=True)
+
+        retries = []
+
+        def retry(args):
+            retries.append(args)
+            raise MaxRetriesExceededError()
+        deserialize_pug_match.retry = retry
+        try:
+            for round_data in rounds[:2]:
+                send_round(round_data)
+            match = create_pug_match(data, eager=True)
+            # eager runs fail right away instead of retrying
+            self.assertEqual(retries, [])
+            # a worker gives up after its last retry
+            payload = MatchPayload.objects.get(
+                match=match, kind=MatchPayload.KIND_MATCH)
+            deserialize_pug_match(payload.pk)
+            self.assertEqual(retries, [[payload.pk]])
+        finally:
+            del deserialize_pug_match.retry
+        self.assertEqual(Match.objects.get(pk=match.pk).status,
+                         Match.STATUS_CANCELLED)
+        self.assertEqual(PlayerMatch.objects.count(), 0)
+        self.assertEqual(PlayerSeason.objects.count(), 0)
+        # once the lost round turns up, delivering the match again works
+        send_round(rounds[2])
+        create_pug_match(data, eager=True)
+        self.assertEqual(Match.objects.get(pk=match.pk).status,
+                         Match.STATUS_COMPLETE)
+        self.assertEqual(PlayerSeason.objects.count(), 10)
+
+    def test_database_sink(self):
+        """The database sink updates stats without the celery broker"""
+        from celery import current_app
+        from goonpug.libs.sinks import DatabaseSink
+        from .models import Player, PlayerSeason
+        from . import tasks
+        queued = []
+        stats_tasks = [tasks.update_match_stats, tasks.update_season_stats,
+                       tasks.update_season_weapons, tasks.update_rating]
+        eager = current_app.conf.CELERY_ALWAYS_EAGER
+        current_app.conf.CELERY_ALWAYS_EAGER = False
+        for task in stats_tasks:
+            task.delay = lambda *args: queued.append(args)
+        try:
+            DatabaseSink().put('match', self.match_payload())
+        finally:
+            current_app.conf.CELERY_ALWAYS_EAGER = eager
+            for task in stats_tasks:
+                del task.delay
+        self.assertEqual(queued, [])
+        self.assertEqual(PlayerSeason.objects.count(), 10)
+        self.assertNotIn(25.0, Player.objects.values_list('rating',
+                                                          flat=True))
+
+    def test_reprocess_match(self):
+        """Processing a match again never counts it twice"""
+        from .models import (Player, PlayerSeason, PlayerSeasonWeapons,
+                             StatsDelta)
+        from .tasks import (update_rating, update_season_stats,
+                            update_season_weapons)
+        from .views import create_pug_match
+
+        def rows(queryset):
+            # ratings are put back by subtracting what was added, so they
+            # only match to within float rounding
+            return sorted(
+                tuple((k, round(v, 9) if isinstance(v, float) else v)
+                      for k, v in sorted(row.items()) if k != 'id')
+                for row in queryset.values())
+
+        def totals():
+            return (rows(PlayerSeason.objects.all()),
+                    rows(PlayerSeasonWeapons.objects.all()),
+                    rows(Player.objects.all()))
+
+        data = self.match_payload()
+        match = create_pug_match(data, eager=True)
+        first = totals()
+        # both teams were rated
+        self.assertEqual(StatsDelta.objects.filter(
+            kind=StatsDelta.KIND_RATING).count(), 10)
+        self.assertNotIn(25.0, Player.objects.values_list('rating',
+                                                          flat=True))
+        # redelivering the payload is a no-op
+        create_pug_match(self.match_payload(), eager=True)
+        self.assertEqual(totals(), first)
+        # and so is retrying any of the stats tasks
+        for match_map in match.matchmap_set.all():
+            update_season_weapons.apply(args=[match_map.pk])
+            update_rating.apply(args=[match_map.pk])
+        update_season_stats.apply(args=[match.pk])
+        self.assertEqual(totals(), first)
+        # a corrected payload replaces what the first one added
+        for round_data in data['match_maps'][0]['rounds']:
+            for player_round in round_data['player_rounds'].values():
+                player_round['kills'] = 2
+        create_pug_match(data, eager=True)
+        season = PlayerSeason.objects.all()
+        self.assertEqual(set(player_season.kills for player_season in season),
+                         set([60]))
+        self.assertEqual(totals()[1], first[1])
+        # and going back to the original puts everything back as it was
+        create_pug_match(self.match_payload(), eager=True)
+        self.assertEqual(totals(), first)
+
+    def test_resolve_steamids(self):
+        """Players are fetched and created in bulk, then cached"""
+        from .models import Player
+        existing, created = Player.objects.get_or_create_from_steamid(
+            'STEAM_1:0:1000')
+        steamids = [existing.steamid, str(existing.steamid + 1),
+                    existing.steamid + 2, 'STEAM_1:0:1000']
+        with self.assertNumQueries(3):
+            ids = Player.objects.resolve_steamids(steamids)
+        self.assertEqual(ids[existing.steamid], existing.pk)
+        self.assertEqual(
+            ids, dict(Player.objects.values_list('steamid', 'pk')))
+        with self.assertNumQueries(0):
+            self.assertEqual(Player.objects.resolve_steamids(steamids), ids)
+        existing.delete()
+        with self.assertNumQueries(3):
+            ids = Player.objects.resolve_steamids(steamids)
+        self.assertNotEqual(ids[existing.steamid], existing.pk)
+
+
+class LogFollowerTest(TestCase):
+
+    def test_rotation_and_resume(self):
+        """Followed logs are read across rotation and resumed exactly"""
+        import os
+        import shutil
+        import tempfile
+        from goonpug.libs.follow import LogFollower
+        from goonpug.libs.logs import GoonPugParser
+        from goonpug.libs.snapshot import SnapshotStore
+
+        def entered(i):
+            return ('L 10/05/2013 - 20:00:%02d: "P%d<%d><STEAM_1:0:%d><>" '
+                    'entered the game\n' % (i, i, i, i))
+
+        tmp = tempfile.mkdtemp()
+        try:
+            logs = os.path.join(tmp, 'logs')
+            os.mkdir(logs)
+            state = SnapshotStore(os.path.join(tmp, 'state'), max_age=None)
+            first = os.path.join(logs,
+                                 'L192_168_1_10_27015_201310052000_000.log')
+            with open(first, 'ab') as f:
+                f.write(entered(0) + entered(1) + entered(2)[:10])
+            follower = LogFollower(logs, GoonPugParser(), state)
+            follower.restore()
+            self.assertEqual(follower.poll(), 2)
+            follower.save()
+
+            with open(first, 'ab') as f:
+                f.write(entered(2)[10:])
+            second = os.path.join(logs,
+                                  'L192_168_1_10_27015_201310052100_000.log')
+            with open(second, 'ab') as f:
+                f.write(entered(3))
+            follower = LogFollower(logs, GoonPugParser(), state)
+            follower.restore()
+            self.assertEqual(follower.offset, len(entered(0) + entered(1)))
+            while follower.poll():
+                pass
+            self.assertEqual(follower.filename, os.path.basename(second))
+            self.assertEqual(
+                [p['name'] for p in follower.parser.seen_players.values()],
+                ['P0', 'P1', 'P2', 'P3'])
+        finally:
+            shutil.rmtree(tmp)
+
+
+class LogSpoolTest(TestCase):
+
+    def test_rotation_round_trip(self):
+        """Spooled lines read back in order across rotated gzip files"""
+        import shutil
+        import tempfile
+        import time
+        from goonpug.libs import spool as spool_module
+        from goonpug.libs.replay import read_lines
+        from goonpug.libs.spool import LogSpool
+
+        class Clock(object):
+            now = 1381003200.0
+
+            def time(self):
+                return self.now
+
+            def __getattr__(self, name):
+                return getattr(time, name)
+
+        clock = Clock()
+        address = ('192.168.1.10', 27015)
+        lines = ['L 10/05/2013 - 20:00:%02d: line %d' % (i % 60, i)
+                 for i in range(40)]
+        tmp = tempfile.mkdtemp()
+        spool_module.time = clock
+        try:
+            log_spool = LogSpool(tmp, max_age=60, buffer_size=1)
+            spool = log_spool.open(address)
+            for i, line in enumerate(lines[:30]):
+                if i and i % 10 == 0:
+                    clock.now += 61
+                spool.write(line + '\x00')
+            spool.close()
+            # a restart in the same second appends to the same file
+            spool = log_spool.open(address)
+            for line in lines[30:]:
+                spool.write(line)
+            # a daemon which dies now leaves every flushed line readable
+            spool.flush()
+            files = log_spool.files(address)
+            self.assertEqual(len(files), 3)
+            self.assertEqual(
+                [line for path in files for line in read_lines(path)],
+                lines)
+            self.assertEqual(log_spool.files(address, start=clock.now + 1),
+                             files[-1:])
+            self.assertEqual(log_spool.servers(), [address])
+            spool.close()
+        finally:
+            spool_module.time = time
+            shutil.rmtree(tmp)
+
+
+class SnapshotTest(TestCase):
+
+    def match_lines(self, rounds=4):
+        """Return the log lines of a short 5v5 match"""
+        lines = []
+
+        def log(msg):
+            n = len(lines)
+            lines.append('L 10/05/2013 - %02d:%02d:%02d: %s' % (
+                20 + n // 3600, n // 60 % 60, n % 60, msg))
+
+        def player(i):
+            team = 'CT' if i < 5 else 'TERRORIST'
+            return '"P%d<%d><STEAM_1:0:%d><%s>"' % (i, i + 2, 1000 + i, team)
+
+        log('Started map "de_dust2" (CRC "-12345")')
+        for i in range(10):
+            log('"P%d<%d><STEAM_1:0:%d><>" entered the game' % (
+                i, i + 2, 1000 + i))
+            log('"P%d<%d><STEAM_1:0:%d>" switched from team <Unassigned> '
+                'to <%s>' % (i, i + 2, 1000 + i,
+                             'CT' if i < 5 else 'TERRORIST'))
+        log('GoonPUG triggered "Start_Match"')
+        score = {'CT': 0, 'TERRORIST': 0}
+        for n in range(1, rounds + 1):
+            log('World triggered "Round_Start"')
+            if n % 2:
+                winner, pairs = 'CT', [(i, i + 5) for i in range(5)]
+                notice = 'SFUI_Notice_CTs_Win'
+            else:
+                winner, pairs = 'TERRORIST', [(i + 5, i) for i in range(5)]
+                notice = 'SFUI_Notice_Terrorists_Win'
+            for killer, victim in pairs:
+                log('%s [1 2 3] attacked %s [4 5 6] with "ak47" (damage '
+                    '"100") (damage_armor "3") (health "0") (armor "90") '
+                    '(hitgroup "head")' % (player(killer), player(victim)))
+                log('%s [1 2 3] killed %s [4 5 6] with "ak47" (headshot)' %
+                    (player(killer), player(victim)))
+            score[winner] += 1
+            log('Team "%s" triggered "%s" (CT "%d") (T "%d")' % (
+                winner, notice, score['CT'], score['TERRORIST']))
+            log('Team "CT" scored "%d" with "5" players' % score['CT'])
+            log('Team "TERRORIST" scored "%d" with "5" players' %
+                score['TERRORIST'])
+            log('World triggered "Round_End"')
+        log('GoonPUG triggered "End_Match"')
+        return lines
+
+    def parser(self):
+        from goonpug.libs.importer import MatchCollector
+        from goonpug.libs.logs import GoonPugParser
+        parser = GoonPugParser(sink=MatchCollector())
+        parser.current_server = {'ip': '192.168.1.10', 'port': 27015}
+        return parser
+
+    def test_resume_mid_match(self):
+        """A parser restored mid match sends what an uninterrupted one does"""
+        import shutil
+        import tempfile
+        from goonpug.libs.snapshot import SnapshotStore
+        lines = self.match_lines()
+        uninterrupted = self.parser()
+        for line in lines:
+            uninterrupted.parse_line(line)
+        self.assertEqual([kind for kind, payload
+                          in uninterrupted.sink.entries],
+                         ['round'] * 4 + ['match'])
+
+        tmp = tempfile.mkdtemp()
+        try:
+            store = SnapshotStore(tmp)
+            address = ('192.168.1.10', 27015)
+            before = self.parser()
+            for i, line in enumerate(lines):
+                before.parse_line(line)
+                if before.snapshot_due and before.match_live and \
+                        before.current_round['round_number'] == 3:
+                    store.save(address, before.snapshot())
+                    break
+            self.assertEqual(len(before.sink.entries), 2)
+            after = self.parser()
+            after.current_server = None
+            after.restore(store.load(address))
+            for line in lines[i + 1:]:
+                after.parse_line(line)
+        finally:
+            shutil.rmtree(tmp)
+        self.assertEqual(before.sink.entries + after.sink.entries,
+                         uninterrupted.sink.entries)
+
+
+class OutboxTest(TestCase):
+
+    class Session(object):
+        """Stands in for requests.Session, answering with canned codes"""
+
+        def __init__(self, outbox, codes):
+            self.outbox = outbox
+            self.codes = list(codes)
+            self.posts = []
+
+        def post(self, url, data=None, timeout=None, headers=None):
+            import json
+            import requests
+            from goonpug.libs.payloads import expand_payload, gunzip_body
+            # nothing is removed before the API has answered
+            self.posts.append((url, [expand_payload(p) for p in json.loads(
+                gunzip_body(data))], len(self.outbox)))
+            code = self.codes.pop(0)
+            if code is None:
+                raise requests.ConnectionError('connection refused')
+            r = requests.Response()
+            r.status_code = code
+            r._content = ''
+            return r
+
+    def setUp(self):
+        import tempfile
+        from goonpug.libs.outbox import Outbox
+        self.tmp = tempfile.mkdtemp()
+        self.outbox = Outbox(self.tmp)
+
+    def tearDown(self):
+        import shutil
+        shutil.rmtree(self.tmp)
+
+    def entry(self, n):
+        # discard payloads are queued as they are, which keeps these short
+        return {'start_time': n, 'discard': True}
+
+    def sender(self, codes, **kwargs):
+        from goonpug.libs.outbox import OutboxSender
+        sender = OutboxSender(self.outbox, 'http://api.test/api/', **kwargs)
+        sender.session = self.Session(self.outbox, codes)
+        return sender
+
+    def test_put_is_atomic(self):
+        """Entries are fsynced under a temporary name, then renamed"""
+        import os
+        synced = []
+        fsync, rename = os.fsync, os.rename
+
+        def fake_fsync(fd):
+            synced.append(os.listdir(self.tmp))
+            fsync(fd)
+
+        def crash(src, dst):
+            raise OSError('crashed')
+        os.fsync = fake_fsync
+        try:
+            name = self.outbox.put('match', self.entry(1))
+            os.rename = crash
+            with self.assertRaises(OSError):
+                self.outbox.put('match', self.entry(2))
+        finally:
+            os.fsync, os.rename = fsync, rename
+        self.assertEqual(sorted(synced[0]), ['.%s.tmp' % name, 'failed'])
+        # the entry interrupted before its rename is never seen
+        self.assertEqual(self.outbox.entries(), [name])
+
+    def test_batches(self):
+        """Consecutive entries of the same kind are sent together"""
+        for kind, n in [('round', 1), ('round', 2), ('match', 3),
+                        ('round', 4)]:
+            self.outbox.put(kind, self.entry(n))
+        sender = self.sender([200, 200, 200], batch_size=20)
+        while sender.send_batch():
+            pass
+        self.assertEqual(sender.session.posts, [
+            ('http://api.test/api/pugmatch/round/',
+             [self.entry(1), self.entry(2)], 4),
+            ('http://api.test/api/pugmatch/', [self.entry(3)], 2),
+            ('http://api.test/api/pugmatch/round/', [self.entry(4)], 1)])
+        self.assertEqual(len(self.outbox), 0)
+        self.assertEqual(sender.sent, 4)
+
+    def test_retry_with_backoff(self):
+        """Connection errors and 5xx responses keep the entries queued"""
+        self.outbox.put('match', self.entry(1))
+        sender = self.sender([None, 503, 500, 200], min_backoff=1.0,
+                             max_backoff=3.0)
+        backoff = []
+        for i in range(3):
+            self.assertFalse(sender.send_batch())
+            self.assertEqual(len(self.outbox), 1)
+            backoff.append(sender.retry_later())
+        self.assertEqual(backoff, [1.0, 2.0, 3.0])
+        self.assertTrue(sender.send_batch())
+        self.assertEqual(len(self.outbox), 0)
+
+    def test_refused_entries_set_aside(self):
+        """An entry the API refuses goes to failed/, the rest are sent"""
+        import os
+        names = [self.outbox.put('match', self.entry(n)) for n in range(2)]
+        # the batch is refused, then its entries are retried one by one
+        sender = self.sender([400, 200, 400])
+        self.assertTrue(sender.send_batch())
+        self.assertEqual([len(post[1]) for post in sender.session.posts],
+                         [2, 1, 1])
+        self.assertEqual(len(self.outbox), 0)
+        self.assertEqual(os.listdir(self.outbox.failed_path), [names[1]])
+        self.assertEqual((sender.sent, sender.failed), (1, 1))
+
+
+class ImporterTest(TestCase):
+
+    def test_merge_entries(self):
+        """Spooled server entries are merged oldest first, ties kept"""
+        import os
+        import shutil
+        import tempfile
+        from goonpug.libs.importer import merge_entries, write_entries
+        servers = [
+            [('round', {'start_time': 1, 'n': 1}),
+             ('match', {'start_time': 1}),
+             ('match', {'start_time': 4})],
+            [('match', {'start_time': 2}),
+             ('round', {'start_time': 4, 'n': 1}),
+             ('match', {'start_time': 4})],
+            [],
+        ]
+        tmp = tempfile.mkdtemp()
+        try:
+            spools = []
+            for i, entries in enumerate(servers):
+                spools.append(os.path.join(tmp, '%d.pickle' % i))
+                write_entries(entries, spools[-1])
+            self.assertEqual(list(merge_entries(spools)), [
+                servers[0][0], servers[0][1], servers[1][0], servers[0][2],
+                servers[1][1], servers[1][2]])
+        finally:
+            shutil.rmtree(tmp)
+
+
+class HttpLogServerTest(TestCase):
+
+    def test_post_batch(self):
+        """POSTed batches are dispatched per server and acknowledged"""
+        import json
+        import urllib2
+        from goonpug.libs.httplog import HttpLogServer
+        from goonpug.libs.payloads import gzip_body
+
+        class Dispatcher(object):
+            def __init__(self):
+                self.lines = []
+
+            def dispatch_batch(self, client_address, lines, timeout=None):
+                self.lines.extend((client_address, line) for line in lines)
+                return len(lines)
+
+        dispatcher = Dispatcher()
+        server = HttpLogServer(('127.0.0.1', 0), dispatcher)
+        server.start()
+        url = 'http://127.0.0.1:%d/logs' % server.server_address[1]
+        try:
+            r = urllib2.urlopen(urllib2.Request(
+                url, gzip_body('L one\nL two\x00\n\n'),
+                {'X-Server-Addr': '192.168.1.10:27015',
+                 'Content-Encoding': 'gzip'}))
+            self.assertEqual(json.loads(r.read()), {'accepted': 2})
+            self.assertEqual(dispatcher.lines,
+                             [(('192.168.1.10', 27015), 'L one'),
+                              (('192.168.1.10', 27015), 'L two')])
+            with self.assertRaises(urllib2.HTTPError) as cm:
+                urllib2.urlopen(urllib2.Request(url, 'L three'))
+            self.assertEqual(cm.exception.code, 400)
+        finally:
+            server.stop()
+
+    def test_token_and_allowed_servers(self):
+        """Batches without the token or from unknown servers are refused"""
+        import urllib2
+        from goonpug.libs import goonpugd
+        from goonpug.libs.httplog import HttpLogServer
+
+        class Dispatcher(object):
+            def __init__(self):
+                self.lines = []
+
+            def dispatch_batch(self, client_address, lines, timeout=None):
+                self.lines.extend((client_address, line) for line in lines)
+                return len(lines)
+
+        dispatcher = Dispatcher()
+        server = HttpLogServer(('127.0.0.1', 0), dispatcher, token='s3cret',
+                               allowed_servers=[('192.168.1.10', 27015)])
+        server.start()
+        url = 'http://127.0.0.1:%d/logs' % server.server_address[1]
+        try:
+            for headers in ({'X-Server-Addr': '192.168.1.10:27015'},
+                            {'X-Server-Addr': '192.168.1.10:27015',
+                             'X-GoonPUG-Token': 'wrong'},
+                            {'X-Server-Addr': '192.168.1.11:27015',
+                             'X-GoonPUG-Token': 's3cret'}):
+                with self.assertRaises(urllib2.HTTPError) as cm:
+                    urllib2.urlopen(urllib2.Request(url, 'L one', headers))
+                self.assertEqual(cm.exception.code, 403)
+            urllib2.urlopen(urllib2.Request(
+                url, 'L two', {'X-Server-Addr': '192.168.1.10:27015',
+                               'X-GoonPUG-Token': 's3cret'}))
+            self.assertEqual(dispatcher.lines,
+                             [(('192.168.1.10', 27015), 'L two')])
+        finally:
+            server.stop()
+        options = {'http_port': '8080', 'http_bind': '0.0.0.0',
+                   'http_token': None, 'http_servers': None}
+        with self.assertRaises(goonpugd.UsageError):
+            goonpugd.check_http_options(options)
+        options['http_token'] = 's3cret'
+        options['http_servers'] = '192.168.1.10:27015,192.168.1.11:27015'
+        self.assertEqual(goonpugd.check_http_options(options),
+                         set([('192.168.1.10', 27015),
+                              ('192.168.1.11', 27015)]))
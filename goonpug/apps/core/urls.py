@@ -20,6 +20,7 @@ urlpatterns = patterns(
     url(r'^stats/pug/(?P<year>\d{4})/(?P<month>\d{1,2})/$',
         'stats_pug'),
     url(r'^api/pugmatch/$', 'post_pug_match'),
+    url(r'^api/pugmatch/round/$', 'post_pug_round'),
 )
 
 urlpatterns += patterns(
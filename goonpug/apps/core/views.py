@@ -5,6 +5,7 @@
 from __future__ import absolute_import, division
 
 import copy
+import json
 import pytz
 
 from datetime import date, datetime
@@ -19,13 +20,15 @@ from django_tables2 import RequestConfig
 from rest_framework.decorators import api_view
 from rest_framework.views import APIView
 from rest_framework.response import Response
-from rest_framework import mixins, generics
+from rest_framework import mixins, generics, status
 from srcds.objects import SteamId
 
-from .models import Match, Player, PlayerSeason, Season, Server
+from goonpug.libs.payloads import expand_payload, gunzip_body
+
+from .models import Match, MatchPayload, Player, PlayerSeason, Season, Server
 from .tables import PlayerSeasonTable, PlayerSeasonLeaderboard
 from .serializers import MatchSerializer, PlayerSerializer
-from .tasks import deserialize_pug_match
+from .tasks import deserialize_pug_match, deserialize_pug_round
 
 
 def player_profile(request, player_id):
@@ -252,13 +255,13 @@ class PlayerDetail(APIView):
         return Response(serializer.data)
 
 
-@api_view(['POST'])
-def post_pug_match(request):
-    """Create a new match"""
-    data = request.DATA
+def get_or_create_pug_match(data):
+    """Look up (or create) the match a pug match or round payload is for"""
     server = None
-    timestamp = pytz.utc.localize(datetime.strptime(data['start_time'],
-                                  '%Y-%m-%dT%H:%M:%SZ'))
+    timestamp = data['start_time']
+    if not isinstance(timestamp, datetime):
+        timestamp = pytz.utc.localize(datetime.strptime(timestamp,
+                                      '%Y-%m-%dT%H:%M:%SZ'))
     try:
         server = Server.objects.get(ip=data['server']['ip'],
                                     port=data['server']['port'])
@@ -302,7 +305,119 @@ def post_pug_match(request):
         match.save()
         match.name = 'PUG Match %d' % match.id
         match.save()
+    return match
+
+
+def create_pug_match(data, eager=False):
+    """Create (or look up) the match for a pug match payload and queue it
+
+    A payload with discard set means the parser has given up on a match it
+    already streamed rounds for, so whatever we have for it is deleted.
+    Returns None in that case.
+
+    The payload is stored as a MatchPayload and only its id is queued, or
+    with eager set the match is deserialized right away. Delivering the
+    same payload again does nothing, while a different payload for a match
+    replaces everything stored and counted for it before.
+
+    """
+    match = get_or_create_pug_match(data)
+    if data.get('discard'):
+        if match.status != Match.STATUS_COMPLETE:
+            match.delete()
+        return None
+    if match.status == Match.STATUS_COMPLETE and not match.fingerprint:
+        # processed before fingerprints were kept, there's no telling what
+        # it would add twice
+        return match
+    payload = MatchPayload.objects.store(match, MatchPayload.KIND_MATCH, data)
+    if payload.fingerprint == match.fingerprint:
+        # already processed from this exact payload
+        return match
+    if eager:
+        deserialize_pug_match.apply(args=[payload.pk])
+    else:
+        deserialize_pug_match.delay(payload.pk)
+    return match
+
+
+def create_pug_round(data, eager=False):
+    """Queue a single streamed round for its (possibly new) match"""
+    match = get_or_create_pug_match(data)
+    if match.status == Match.STATUS_UNKNOWN:
+        match.status = Match.STATUS_LIVE
+        match.save()
     if match.status != Match.STATUS_COMPLETE:
-        deserialize_pug_match.delay(match, data)
-    serializer = MatchSerializer(match)
+        payload = MatchPayload.objects.store(match, MatchPayload.KIND_ROUND,
+                                             data)
+        if eager:
+            deserialize_pug_round.apply(args=[payload.pk])
+        else:
+            deserialize_pug_round.delay(payload.pk)
+    return match
+
+
+def get_payload_data(request):
+    """Return the payload(s) POSTed in a request, in the plain format
+
+    Bodies may be gzipped (with a Content-Encoding header saying so), and
+    each payload may be in the compact format the parser sends. Raises
+    ValueError if the body can't be decoded.
+
+    """
+    encoding = request.META.get('HTTP_CONTENT_ENCODING', 'identity')
+    if encoding == 'gzip':
+        data = json.loads(gunzip_body(request.body))
+    elif encoding == 'identity':
+        data = request.DATA
+    else:
+        raise ValueError('unsupported content encoding %s' % encoding)
+    if isinstance(data, list):
+        return [expand_payload(payload) for payload in data]
+    return expand_payload(data)
+
+
+@api_view(['POST'])
+def post_pug_match(request):
+    """Create a new match
+
+    Accepts either a single match or a list of matches, so that queued
+    matches can be delivered in batches. See get_payload_data for the
+    formats accepted.
+
+    """
+    try:
+        data = get_payload_data(request)
+        if isinstance(data, list):
+            matches = [create_pug_match(match_data) for match_data in data]
+            serializer = MatchSerializer(
+                [match for match in matches if match is not None], many=True)
+        else:
+            match = create_pug_match(data)
+            if match is None:
+                return Response({'detail': 'Match discarded'})
+            serializer = MatchSerializer(match)
+    except (IndexError, KeyError, TypeError, ValueError) as e:
+        return Response({'detail': 'Invalid match payload: %s' % e},
+                        status=status.HTTP_400_BAD_REQUEST)
     return Response(serializer.data)
+
+
+@api_view(['POST'])
+def post_pug_round(request):
+    """Add a finished round to a match which is still in progress
+
+    Accepts either a single round or a list of rounds. The match is
+    finalized later by a post_pug_match payload with the match level stats.
+
+    """
+    try:
+        data = get_payload_data(request)
+        if not isinstance(data, list):
+            data = [data]
+        for round_data in data:
+            create_pug_round(round_data)
+    except (IndexError, KeyError, TypeError, ValueError) as e:
+        return Response({'detail': 'Invalid round payload: %s' % e},
+                        status=status.HTTP_400_BAD_REQUEST)
+    return Response({'rounds': len(data)})
@@ -0,0 +1,802 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2013 Peter Rowlands
+# All rights reserved.
+"""goonpugd log receiver
+
+The receive loop only reads datagrams off the socket, strips the packet
+header and hands each log line to a per-server queue. Every game server gets
+its own worker thread which appends the raw line to that server's spool (if
+enabled) and then feeds it to that server's GoonPugParser, so a slow parse
+for one server never stalls receipt for the others. Finished rounds and
+matches go to the dispatcher's sink, normally an on-disk outbox which is
+delivered to the web tier by a separate sender thread. Batches of lines
+POSTed to an HttpLogServer (see httplog.py) go to the same workers, through
+dispatch_batch, which waits for room in a full queue instead of dropping.
+
+A server which goes quiet outside of a live match has its worker stopped
+after idle_ttl seconds. Its parser is checkpointed first, and the
+checkpoint is restored into a new parser if the server starts logging
+again.
+
+With a SnapshotStore, each parser's state is also written to disk at every
+round boundary and when its worker stops, and a restarted goonpugd resumes
+any match which was in progress from there.
+
+Every component keeps its own counters and returns them from stats(). Shard
+processes report their dispatcher's stats back to the parent process once a
+second over the same socket their datagrams arrive on.
+
+With more than one worker process, log sources are sharded across processes
+by their (ip, port) and the receive loop forwards each datagram to the
+owning shard process, where it is dispatched to a per-server worker as
+above.
+
+"""
+
+from __future__ import division, absolute_import
+
+import collections
+import errno
+import json
+import multiprocessing
+import os
+import Queue
+import select
+import socket
+import struct
+import threading
+import time
+import traceback
+import zlib
+
+from .logs import GoonPugParser
+from .metrics import LatencyHistogram
+
+
+class ServerWorker(threading.Thread):
+
+    """Log line queue and parser thread for a single game server"""
+
+    latency_sample = 16
+
+    def __init__(self, address, parser, queue_size=4096, spool=None,
+                 snapshots=None):
+        super(ServerWorker, self).__init__(
+            name='goonpugd-%s:%d' % (address[0], address[1]))
+        self.daemon = True
+        self.address = address
+        self.parser = parser
+        self.spool = spool
+        self.snapshots = snapshots
+        self.queue = Queue.Queue(queue_size)
+        self.received = 0
+        self.dropped = 0
+        self.parsed = 0
+        self.errors = 0
+        self.last_active = time.time()
+        # line counts and sampled parse_line latency by the event type each
+        # line was handled as, None for unmatched lines
+        self.events = collections.defaultdict(int)
+        self.latency = {}
+        self.lines_per_sec = 0.0
+        self._rate_parsed = 0
+        self._rate_time = time.time()
+        self._memory = None
+        self._memory_time = 0
+
+    def put(self, line):
+        """Queue a log line for parsing
+
+        Never blocks. Returns False (and counts the packet as dropped) if
+        this server's queue is full.
+
+        """
+        try:
+            self.queue.put_nowait(line)
+        except Queue.Full:
+            self.dropped += 1
+            return False
+        self.received += 1
+        self.last_active = time.time()
+        return True
+
+    def put_batch(self, lines, timeout=None):
+        """Queue log lines for parsing, waiting for room if necessary
+
+        Returns the number of lines queued, which is only less than
+        len(lines) if the queue stayed full for timeout seconds.
+
+        """
+        put = self.queue.put
+        n = 0
+        try:
+            for line in lines:
+                put(line, True, timeout)
+                n += 1
+        except Queue.Full:
+            pass
+        self.received += n
+        self.last_active = time.time()
+        return n
+
+    def stop(self):
+        self.queue.put(None)
+
+    def save_snapshot(self):
+        self.parser.snapshot_due = False
+        try:
+            self.snapshots.save(self.address, self.parser.snapshot())
+        except Exception:
+            self.errors += 1
+            traceback.print_exc()
+
+    def _update_rate(self, now):
+        elapsed = now - self._rate_time
+        if elapsed >= 1.0:
+            self.lines_per_sec = (self.parsed - self._rate_parsed) / elapsed
+            self._rate_parsed = self.parsed
+            self._rate_time = now
+
+    def run(self):
+        spool = self.spool
+        parser = self.parser
+        snapshots = self.snapshots
+        latency = self.latency
+        events = self.events
+        while True:
+            try:
+                line = self.queue.get(timeout=1.0)
+            except Queue.Empty:
+                if spool is not None:
+                    spool.maybe_flush()
+                self._update_rate(time.time())
+                continue
+            if line is None:
+                break
+            if spool is not None:
+                try:
+                    spool.write(line)
+                    spool.maybe_flush()
+                except Exception:
+                    self.errors += 1
+                    traceback.print_exc()
+            # only every latency_sample'th line is timed, timing every
+            # line costs nearly as much as parsing an idle line
+            timed = not self.parsed % self.latency_sample
+            if timed:
+                start = time.time()
+            try:
+                cls = parser.parse_line(line)
+            except Exception:
+                self.errors += 1
+                traceback.print_exc()
+                cls = None
+            events[cls] += 1
+            self.parsed += 1
+            if timed:
+                now = time.time()
+                histogram = latency.get(cls)
+                if histogram is None:
+                    histogram = latency[cls] = LatencyHistogram()
+                histogram.observe(now - start)
+                self._update_rate(now)
+            if snapshots is not None and parser.snapshot_due:
+                self.save_snapshot()
+        if spool is not None:
+            spool.close()
+        if snapshots is not None:
+            self.save_snapshot()
+
+    def is_idle(self, ttl, now=None):
+        """Return True if this worker can be stopped without losing state
+
+        That is, nothing has arrived for ttl seconds, everything received
+        has been parsed and no match is in progress.
+
+        """
+        if now is None:
+            now = time.time()
+        return now - self.last_active >= ttl and self.queue.empty() \
+            and not self.parser.match_live
+
+    def memory_stats(self, max_age=30.0):
+        """Return the parser's memory_stats(), at most max_age seconds old"""
+        now = time.time()
+        if self._memory is None or now - self._memory_time >= max_age:
+            self._memory = self.parser.memory_stats()
+            self._memory_time = now
+        return self._memory
+
+    def stats(self):
+        events = dict((cls.__name__, n)
+                      for cls, n in list(self.events.items())
+                      if cls is not None)
+        latency = dict((cls.__name__ if cls else 'unmatched',
+                        histogram.to_dict())
+                       for cls, histogram in list(self.latency.items()))
+        return {
+            'received': self.received,
+            'parsed': self.parsed,
+            'unmatched': self.events.get(None, 0),
+            'dropped': self.dropped,
+            'errors': self.errors,
+            'queue_depth': self.queue.qsize(),
+            'lines_per_sec': self.lines_per_sec,
+            'idle': time.time() - self.last_active,
+            'events': events,
+            'latency': latency,
+            'memory': self.memory_stats(),
+        }
+
+
+class LogDispatcher(object):
+
+    """Routes log lines to a ServerWorker per client address"""
+
+    def __init__(self, verbose=False, queue_size=4096, sink=None,
+                 spool=None, idle_ttl=0, snapshots=None):
+        self.verbose = verbose
+        self.queue_size = queue_size
+        self.sink = sink
+        self.spool = spool
+        self.idle_ttl = idle_ttl
+        self.snapshots = snapshots
+        self.workers = {}
+        self.checkpoints = {}
+        self.evicted = 0
+        # held while workers are created or evicted, since batches can be
+        # dispatched from other threads than the receive loop
+        self.lock = threading.Lock()
+
+    def new_parser(self, client_address):
+        parser = GoonPugParser(verbose=self.verbose, sink=self.sink)
+        checkpoint = self.checkpoints.pop(client_address, None)
+        if checkpoint is None and self.snapshots is not None:
+            checkpoint = self.snapshots.load(client_address)
+            if checkpoint is not None and checkpoint.get('match_live'):
+                print u'goonpugd: resuming match in progress on %s:%d' % \
+                    client_address
+        if checkpoint is not None:
+            parser.restore(checkpoint)
+        return parser
+
+    def get_worker(self, client_address):
+        worker = self.workers.get(client_address)
+        if worker is None:
+            with self.lock:
+                worker = self.workers.get(client_address)
+                if worker is None:
+                    worker = self.start_worker(client_address)
+        return worker
+
+    def start_worker(self, client_address):
+        print u'Got new connection from {}'.format(client_address[0])
+        if self.spool is not None:
+            spool = self.spool.open(client_address)
+        else:
+            spool = None
+        worker = ServerWorker(client_address,
+                              self.new_parser(client_address),
+                              self.queue_size, spool, self.snapshots)
+        worker.start()
+        self.workers[client_address] = worker
+        return worker
+
+    def dispatch(self, client_address, line):
+        return self.get_worker(client_address).put(line)
+
+    def dispatch_batch(self, client_address, lines, timeout=None):
+        """Queue a batch of lines, waiting for room instead of dropping
+
+        Safe to call from any thread. Returns the number of lines queued.
+
+        """
+        with self.lock:
+            worker = self.workers.get(client_address)
+            if worker is None:
+                worker = self.start_worker(client_address)
+            # so the worker can't be evicted before the batch is queued
+            worker.last_active = time.time()
+        return worker.put_batch(lines, timeout)
+
+    def service_actions(self):
+        if not self.idle_ttl:
+            return
+        now = time.time()
+        for address, worker in self.workers.items():
+            if worker.is_idle(self.idle_ttl, now):
+                with self.lock:
+                    if worker.is_idle(self.idle_ttl):
+                        self.evict(address)
+
+    def evict(self, client_address):
+        """Stop a server's worker, keeping a checkpoint of its parser"""
+        worker = self.workers.pop(client_address)
+        worker.stop()
+        worker.join()
+        self.checkpoints[client_address] = worker.parser.checkpoint()
+        self.evicted += 1
+        if self.verbose:
+            print u'goonpugd: evicted idle parser for %s:%d' % client_address
+
+    def stats(self):
+        servers = {}
+        for address, worker in self.workers.items():
+            servers['%s:%d' % address] = worker.stats()
+        return {
+            'servers': servers,
+            'parsers': len(servers),
+            'parser_bytes': sum(s['memory']['bytes']
+                                for s in servers.values()),
+            'lines_per_sec': sum(s['lines_per_sec']
+                                 for s in servers.values()),
+            'dropped': sum(s['dropped'] for s in servers.values()),
+            'queue_depth': sum(s['queue_depth'] for s in servers.values()),
+            'evicted': self.evicted,
+            'checkpoints': len(self.checkpoints),
+        }
+
+    def print_stats(self, prefix=u'goonpugd'):
+        stats = self.stats()
+        print u'%s: %d servers, %d queued, %d dropped, %d evicted' % (
+            prefix, len(stats['servers']), stats['queue_depth'],
+            stats['dropped'], stats['evicted'])
+        for server, s in sorted(stats['servers'].items()):
+            print u'  %s: received=%d parsed=%d lines/sec=%d queue_depth=%d ' \
+                u'dropped=%d errors=%d idle=%ds' % (
+                    server, s['received'], s['parsed'], s['lines_per_sec'],
+                    s['queue_depth'], s['dropped'], s['errors'], s['idle'])
+            m = s['memory']
+            print u'    parser: %dKB seen_players=%d player_rounds=%d ' \
+                u'player_match_weapons=%d' % (
+                    m['bytes'] // 1024, m['seen_players'],
+                    m['player_rounds'], m['player_match_weapons'])
+
+    def close(self):
+        for worker in self.workers.values():
+            worker.stop()
+        for worker in self.workers.values():
+            worker.join(5)
+
+
+def shard_index(client_address, num_shards):
+    """Return the shard which owns the given log source
+
+    Uses crc32 rather than hash() so that a given (ip, port) always maps to
+    the same shard, regardless of interpreter or process.
+
+    """
+    key = '%s:%d' % (client_address[0], client_address[1])
+    return (zlib.crc32(key) & 0xffffffff) % num_shards
+
+
+FRAME_HEADER = struct.Struct('!4sHH')
+
+
+def pack_frame(client_address, data):
+    """Frame a datagram with its source address for forwarding to a shard"""
+    return FRAME_HEADER.pack(socket.inet_aton(client_address[0]),
+                             client_address[1], len(data)) + data
+
+
+def unpack_frames(buf):
+    """Split complete frames off the front of buf
+
+    Returns a list of (client_address, data) tuples and whatever partial
+    frame is left over.
+
+    """
+    frames = []
+    offset = 0
+    size = len(buf)
+    header_size = FRAME_HEADER.size
+    while size - offset >= header_size:
+        ip, port, length = FRAME_HEADER.unpack_from(buf, offset)
+        end = offset + header_size + length
+        if end > size:
+            break
+        frames.append(((socket.inet_ntoa(ip), port),
+                       buf[offset + header_size:end]))
+        offset = end
+    return frames, buf[offset:]
+
+
+def run_shard(index, sock, verbose, queue_size, stats_interval, sink,
+              spool, idle_ttl, snapshots, report_interval=1.0):
+    """Shard process main loop"""
+    dispatcher = LogDispatcher(verbose=verbose, queue_size=queue_size,
+                               sink=sink, spool=spool, idle_ttl=idle_ttl,
+                               snapshots=snapshots)
+    prefix = u'goonpugd[%d]' % index
+    last_stats = last_report = time.time()
+    buf = ''
+    try:
+        while True:
+            readable, _, _ = select.select([sock], [], [], 1.0)
+            if readable:
+                chunk = sock.recv(262144)
+                if not chunk:
+                    break
+                frames, buf = unpack_frames(buf + chunk)
+                for client_address, data in frames:
+                    dispatcher.dispatch(client_address, data)
+            dispatcher.service_actions()
+            now = time.time()
+            if now - last_report >= report_interval:
+                last_report = now
+                sock.sendall(json.dumps(dispatcher.stats()) + '\n')
+            if stats_interval and now - last_stats >= stats_interval:
+                last_stats = now
+                dispatcher.print_stats(prefix)
+    except (KeyboardInterrupt, socket.error):
+        pass
+    finally:
+        dispatcher.close()
+
+
+class Shard(object):
+
+    """A worker process owning a subset of the game servers
+
+    The receive loop only appends datagrams to the shard's pending queue. A
+    sender thread writes them to the shard process in batches over a unix
+    stream socket, so nothing is pickled on the receive path and a dead
+    shard never blocks the receive loop.
+
+    """
+
+    max_batch = 256
+
+    def __init__(self, index, verbose=False, queue_size=4096,
+                 stats_interval=0, sink=None, spool=None, idle_ttl=0,
+                 snapshots=None):
+        self.index = index
+        self.verbose = verbose
+        self.queue_size = queue_size
+        self.stats_interval = stats_interval
+        self.sink = sink
+        self.spool = spool
+        self.idle_ttl = idle_ttl
+        self.snapshots = snapshots
+        self.pending = Queue.Queue(queue_size)
+        self.sock = None
+        self.process = None
+        self.sender = None
+        self.sources = set()
+        self.forwarded = 0
+        self.dropped = 0
+        self.restarts = 0
+        self.report = {}
+
+    def start(self):
+        sock, child_sock = socket.socketpair(socket.AF_UNIX,
+                                             socket.SOCK_STREAM)
+        self.process = multiprocessing.Process(
+            target=run_shard, name='goonpugd-shard-%d' % self.index,
+            args=(self.index, child_sock, self.verbose, self.queue_size,
+                  self.stats_interval, self.sink, self.spool,
+                  self.idle_ttl, self.snapshots))
+        self.process.daemon = True
+        self.process.start()
+        child_sock.close()
+        old_sock = self.sock
+        self.sock = sock
+        if old_sock is not None:
+            old_sock.close()
+        receiver = threading.Thread(
+            target=self._receive_reports, args=(sock,),
+            name='goonpugd-shard-%d-receiver' % self.index)
+        receiver.daemon = True
+        receiver.start()
+        if self.sender is None:
+            self.sender = threading.Thread(
+                target=self._send_forever,
+                name='goonpugd-shard-%d-sender' % self.index)
+            self.sender.daemon = True
+            self.sender.start()
+
+    def _send_forever(self):
+        pending = self.pending
+        while True:
+            frame = pending.get()
+            if frame is None:
+                break
+            batch = [frame]
+            try:
+                while len(batch) < self.max_batch:
+                    frame = pending.get_nowait()
+                    if frame is None:
+                        pending.put(None)
+                        break
+                    batch.append(frame)
+            except Queue.Empty:
+                pass
+            try:
+                self.sock.sendall(''.join(batch))
+                self.forwarded += len(batch)
+            except socket.error:
+                # the shard died, these are lost along with whatever it
+                # had queued. The restarted shard gets a new socket.
+                self.dropped += len(batch)
+        try:
+            self.sock.shutdown(socket.SHUT_WR)
+        except socket.error:
+            pass
+
+    def _receive_reports(self, sock):
+        """Keep the latest stats report sent by the shard process"""
+        buf = ''
+        while True:
+            try:
+                chunk = sock.recv(65536)
+            except socket.error:
+                break
+            if not chunk:
+                break
+            lines = (buf + chunk).split('\n')
+            buf = lines.pop()
+            if lines:
+                try:
+                    self.report = json.loads(lines[-1])
+                except ValueError:
+                    traceback.print_exc()
+
+    def put(self, client_address, data):
+        try:
+            self.pending.put_nowait(pack_frame(client_address, data))
+        except Queue.Full:
+            self.dropped += 1
+            return False
+        self.sources.add(client_address)
+        return True
+
+    def put_batch(self, client_address, lines, timeout=None):
+        """Queue lines for the shard process, waiting for room if needed
+
+        Returns the number of lines queued.
+
+        """
+        put = self.pending.put
+        n = 0
+        try:
+            for line in lines:
+                put(pack_frame(client_address, line), True, timeout)
+                n += 1
+        except Queue.Full:
+            pass
+        self.sources.add(client_address)
+        return n
+
+    def is_alive(self):
+        return self.process.is_alive()
+
+    def stop(self):
+        self.pending.put(None)
+
+    def join(self, timeout=None):
+        self.sender.join(timeout)
+        self.process.join(timeout)
+        if self.process.is_alive():
+            self.process.terminate()
+
+    def stats(self):
+        return {
+            'pid': self.process.pid,
+            'servers': len(self.sources),
+            'forwarded': self.forwarded,
+            'dropped': self.dropped,
+            'restarts': self.restarts,
+            'queue_depth': self.pending.qsize(),
+            'dispatcher': self.report,
+        }
+
+
+class ShardedDispatcher(object):
+
+    """Spreads log sources across worker processes
+
+    Each (ip, port) is always routed to the same shard, so every server's
+    GoonPugParser lives in exactly one process. A shard which dies is
+    restarted on its own without touching the others.
+
+    """
+
+    def __init__(self, num_shards, verbose=False, queue_size=4096,
+                 stats_interval=0, sink=None, spool=None, idle_ttl=0,
+                 snapshots=None):
+        self.closed = False
+        self.shards = [Shard(i, verbose, queue_size, stats_interval, sink,
+                             spool, idle_ttl, snapshots)
+                       for i in range(num_shards)]
+        for shard in self.shards:
+            shard.start()
+
+    def dispatch(self, client_address, data):
+        shard = self.shards[shard_index(client_address, len(self.shards))]
+        return shard.put(client_address, data)
+
+    def dispatch_batch(self, client_address, lines, timeout=None):
+        shard = self.shards[shard_index(client_address, len(self.shards))]
+        return shard.put_batch(client_address, lines, timeout)
+
+    def service_actions(self):
+        if self.closed:
+            return
+        for shard in self.shards:
+            if not shard.is_alive():
+                print u'goonpugd: shard %d (pid %d) exited with code %s, ' \
+                    u'restarting' % (shard.index, shard.process.pid,
+                                     shard.process.exitcode)
+                shard.restarts += 1
+                shard.start()
+
+    def stats(self):
+        shards = [shard.stats() for shard in self.shards]
+        return {
+            'shards': shards,
+            'parsers': sum(s['dispatcher'].get('parsers', 0)
+                           for s in shards),
+            'parser_bytes': sum(s['dispatcher'].get('parser_bytes', 0)
+                                for s in shards),
+            'lines_per_sec': sum(s['dispatcher'].get('lines_per_sec', 0)
+                                 for s in shards),
+            'forwarded': sum(s['forwarded'] for s in shards),
+            'dropped': sum(s['dropped'] for s in shards),
+            'queue_depth': sum(s['queue_depth'] for s in shards),
+        }
+
+    def print_stats(self, prefix=u'goonpugd'):
+        stats = self.stats()
+        print u'%s: %d shards, %d queued, %d dropped' % (
+            prefix, len(stats['shards']), stats['queue_depth'],
+            stats['dropped'])
+        for i, s in enumerate(stats['shards']):
+            print u'  shard %d (pid %d): servers=%d forwarded=%d ' \
+                u'queue_depth=%d dropped=%d restarts=%d' % (
+                    i, s['pid'], s['servers'], s['forwarded'],
+                    s['queue_depth'], s['dropped'], s['restarts'])
+
+    def close(self):
+        self.closed = True
+        for shard in self.shards:
+            shard.stop()
+        for shard in self.shards:
+            shard.join(5)
+
+
+def udp_socket_stats(sock):
+    """Return the kernel's receive queue and drop counters for a UDP socket
+
+    Read from /proc/net/udp{,6}, so this only works on Linux. Returns None
+    if the socket can't be found there.
+
+    """
+    inode = str(os.fstat(sock.fileno()).st_ino)
+    for path in ['/proc/net/udp', '/proc/net/udp6']:
+        try:
+            with open(path) as f:
+                lines = f.readlines()[1:]
+        except IOError:
+            continue
+        for line in lines:
+            fields = line.split()
+            if len(fields) > 12 and fields[9] == inode:
+                return {
+                    'rx_queue': int(fields[4].split(':')[1], 16),
+                    'drops': int(fields[12]),
+                }
+    return None
+
+
+class GoonPugLogServer(object):
+
+    """UDP HL log receiver which hands log lines to a dispatcher
+
+    The socket is non-blocking, and each wakeup drains every datagram
+    waiting on it (up to max_batch) before going back to poll().
+
+    """
+
+    max_packet_size = 65535
+    max_batch = 4096
+    # 4-byte 0xffffffff header, then 'R'. There is no documentation for this
+    # but I am guessing the 'R' stands for 'Remote'? Either way normal log
+    # entries are supposed to start with 'L', but the UDP packets start
+    # with 'RL'
+    header_size = 5
+
+    def __init__(self, address, dispatcher, stats_interval=0,
+                 rcvbuf=8 * 1024 * 1024):
+        self.dispatcher = dispatcher
+        self.stats_interval = stats_interval
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        if rcvbuf:
+            self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF,
+                                   rcvbuf)
+        # linux reports (and allocates) double what was asked for, and caps
+        # the request at net.core.rmem_max
+        self.rcvbuf = self.socket.getsockopt(socket.SOL_SOCKET,
+                                             socket.SO_RCVBUF)
+        self.socket.bind(address)
+        self.socket.setblocking(False)
+        self._last_service = time.time()
+        self._last_stats = time.time()
+        self.received = 0
+        self.recv_errors = 0
+        self.wakeups = 0
+
+    def serve_forever(self):
+        poll = select.poll()
+        poll.register(self.socket, select.POLLIN)
+        while True:
+            if poll.poll(1000):
+                self.wakeups += 1
+                self.receive_pending()
+            if time.time() - self._last_service >= 1.0:
+                self.service_actions()
+
+    def receive_pending(self):
+        """Dispatch every datagram waiting on the socket
+
+        Returns the number of datagrams received.
+
+        """
+        recvfrom = self.socket.recvfrom
+        dispatch = self.dispatcher.dispatch
+        max_packet_size = self.max_packet_size
+        header_size = self.header_size
+        n = 0
+        while n < self.max_batch:
+            try:
+                data, client_address = recvfrom(max_packet_size)
+            except socket.error as e:
+                if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    break
+                elif e.errno == errno.EINTR:
+                    continue
+                self.recv_errors += 1
+                print u'goonpugd: receive failed: %s' % e
+                break
+            n += 1
+            # srcds terminates each line with a NUL, which would otherwise
+            # end up in the last field of the line
+            if data[-1:] == '\x00':
+                dispatch(client_address, data[header_size:-1])
+            else:
+                dispatch(client_address, data[header_size:])
+        self.received += n
+        return n
+
+    def service_actions(self):
+        """Periodic housekeeping, run from the receive loop"""
+        now = time.time()
+        self._last_service = now
+        self.dispatcher.service_actions()
+        if self.stats_interval and \
+                now - self._last_stats >= self.stats_interval:
+            self._last_stats = now
+            self.print_stats()
+            self.dispatcher.print_stats()
+
+    def print_stats(self, prefix=u'goonpugd'):
+        stats = self.stats()
+        print u'%s: udp received=%d recv_errors=%d kernel_drops=%s' % (
+            prefix, stats['received'], stats['recv_errors'],
+            stats.get('kernel_drops', 'unknown'))
+
+    def stats(self):
+        stats = {
+            'received': self.received,
+            'recv_errors': self.recv_errors,
+            'wakeups': self.wakeups,
+            'rcvbuf': self.rcvbuf,
+        }
+        kernel = udp_socket_stats(self.socket)
+        if kernel is not None:
+            stats['kernel_rx_queue'] = kernel['rx_queue']
+            stats['kernel_drops'] = kernel['drops']
+        return stats
+
+    def server_close(self):
+        self.dispatcher.close()
+        self.socket.close()
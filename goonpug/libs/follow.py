@@ -0,0 +1,244 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2013 Peter Rowlands
+# All rights reserved.
+"""Log directory following
+
+For game servers running on our own hosts, goonpugd can read the srcds log
+files directly instead of relying on UDP logaddress delivery, which drops
+lines whenever the receiver falls behind. A LogFollower tails the newest
+L*.log file in a directory (polling, like tail -F) and moves on to the next
+one when srcds rotates its log, so nothing is lost: a parser which falls
+behind just reads further back in the file.
+
+The follower's cursor (the current file and the byte offset of the first
+line not yet parsed) is saved together with its parser's snapshot() in a
+SnapshotStore, at every round boundary and every save_interval seconds, so
+the two always agree. A restarted follower picks up at exactly the line
+after the last one its saved parser state had seen. Anything parsed after
+the last save is parsed (and submitted) again, which the API already
+ignores for rounds and matches it has stored.
+
+"""
+
+from __future__ import division, absolute_import
+
+import collections
+import fnmatch
+import os
+import re
+import threading
+import time
+import traceback
+import zlib
+
+
+LOG_PATTERN = 'L*.log'
+
+
+def follow_key(path):
+    """Return the snapshot key for a followed log directory"""
+    path = os.path.abspath(path)
+    name = re.sub(r'[^A-Za-z0-9_.-]', '_', os.path.basename(path))
+    return 'follow_%s_%08x' % (name, zlib.crc32(path) & 0xffffffff)
+
+
+class LogFollower(threading.Thread):
+
+    """Tails the srcds logs in one directory into a GoonPugParser"""
+
+    def __init__(self, path, parser, state=None, poll_interval=0.5,
+                 save_interval=10.0, chunk_size=1024 * 1024):
+        self.path = os.path.abspath(path)
+        super(LogFollower, self).__init__(name='goonpugd-follow-%s' %
+                                          os.path.basename(self.path))
+        self.daemon = True
+        self.parser = parser
+        self.state = state
+        self.key = follow_key(self.path)
+        self.poll_interval = poll_interval
+        self.save_interval = save_interval
+        self.chunk_size = chunk_size
+        # the file being read, and the offset of the first unparsed line
+        self.filename = None
+        self.offset = 0
+        self.parsed = 0
+        self.errors = 0
+        self.rotations = 0
+        self.events = collections.defaultdict(int)
+        self._saved_offset = None
+        self._last_save = time.time()
+        self._stop = threading.Event()
+
+    def log_files(self):
+        """Return the srcds log files in the directory, oldest first"""
+        return sorted(name for name in os.listdir(self.path)
+                      if fnmatch.fnmatch(name, LOG_PATTERN))
+
+    def restore(self):
+        """Resume from the saved cursor, or the start of the newest log"""
+        saved = None
+        if self.state is not None:
+            saved = self.state.load(self.key)
+        if saved is not None:
+            self.parser.restore(saved['parser'])
+            self.filename = saved['file']
+            self.offset = saved['offset']
+            self._saved_offset = (self.filename, self.offset)
+            print u'goonpugd: %s: resuming at %s:%d' % (
+                self.path, self.filename, self.offset)
+            if not os.path.exists(os.path.join(self.path, self.filename)):
+                print u'goonpugd: %s: %s is gone, skipping to the next ' \
+                    u'log' % (self.path, self.filename)
+                self.switch_file(self.next_file())
+        else:
+            files = self.log_files()
+            if files:
+                self.filename = files[-1]
+                self.offset = 0
+
+    def save(self):
+        """Save the cursor along with the parser's state"""
+        self.parser.snapshot_due = False
+        self._last_save = time.time()
+        if self.state is None or self.filename is None:
+            return
+        try:
+            self.state.save(self.key, {
+                'file': self.filename,
+                'offset': self.offset,
+                'parser': self.parser.snapshot(),
+            })
+            self._saved_offset = (self.filename, self.offset)
+        except Exception:
+            self.errors += 1
+            traceback.print_exc()
+
+    def next_file(self):
+        """Return the log file after the current one, or None"""
+        for name in self.log_files():
+            if self.filename is None or name > self.filename:
+                return name
+        return None
+
+    def switch_file(self, name):
+        self.filename = name
+        self.offset = 0
+
+    def read_available(self, final=False):
+        """Parse every complete line added to the current file
+
+        With final set, a trailing line without a newline is parsed too,
+        since nothing more will be written to the file. Returns the number
+        of lines parsed.
+
+        """
+        filename = os.path.join(self.path, self.filename)
+        try:
+            f = open(filename, 'rb')
+        except IOError as e:
+            print u'goonpugd: %s' % e
+            return 0
+        n = 0
+        try:
+            if os.fstat(f.fileno()).st_size < self.offset:
+                print u'goonpugd: %s was truncated, reading it from the ' \
+                    u'start' % filename
+                self.offset = 0
+            f.seek(self.offset)
+            while not self._stop.is_set():
+                data = f.read(self.chunk_size)
+                end = data.rfind('\n') + 1
+                if end:
+                    for line in data[:end - 1].split('\n'):
+                        n += 1
+                        self.parse_line(line, len(line) + 1)
+                elif len(data) == self.chunk_size:
+                    # no srcds log line is this long, don't wait for more
+                    n += 1
+                    self.parse_line(data, len(data))
+                    end = len(data)
+                if len(data) < self.chunk_size:
+                    if final and data[end:]:
+                        n += 1
+                        self.parse_line(data[end:], len(data) - end)
+                    break
+                f.seek(self.offset)
+        finally:
+            f.close()
+        return n
+
+    def parse_line(self, line, size):
+        try:
+            cls = self.parser.parse_line(line)
+        except Exception:
+            self.errors += 1
+            traceback.print_exc()
+            cls = None
+        self.events[cls] += 1
+        self.parsed += 1
+        self.offset += size
+        if self.parser.snapshot_due:
+            self.save()
+
+    def poll(self):
+        """Read whatever is new, following rotation, returns lines parsed"""
+        if self.filename is None:
+            self.switch_file(self.next_file())
+            if self.filename is None:
+                return 0
+        n = self.read_available()
+        if n:
+            return n
+        next_file = self.next_file()
+        if next_file is None:
+            return 0
+        # srcds has moved on to a new log, so whatever is left in the old
+        # one (possibly a last line without a newline) is final
+        n = self.read_available(final=True)
+        if self._stop.is_set():
+            return n
+        self.switch_file(next_file)
+        self.rotations += 1
+        if self.parser.verbose:
+            print u'goonpugd: %s: following %s' % (self.path, next_file)
+        return n + 1
+
+    def run(self):
+        self.restore()
+        while not self._stop.is_set():
+            try:
+                n = self.poll()
+            except Exception:
+                self.errors += 1
+                traceback.print_exc()
+                n = 0
+            if time.time() - self._last_save >= self.save_interval and \
+                    self._saved_offset != (self.filename, self.offset):
+                self.save()
+            if not n:
+                self._stop.wait(self.poll_interval)
+        self.save()
+
+    def stop(self):
+        self._stop.set()
+
+    def stats(self):
+        behind = 0
+        if self.filename is not None:
+            try:
+                behind = os.path.getsize(
+                    os.path.join(self.path, self.filename)) - self.offset
+            except OSError:
+                pass
+        return {
+            'file': self.filename,
+            'offset': self.offset,
+            'behind': behind,
+            'parsed': self.parsed,
+            'unmatched': self.events.get(None, 0),
+            'errors': self.errors,
+            'rotations': self.rotations,
+            'events': dict((cls.__name__, n)
+                           for cls, n in list(self.events.items())
+                           if cls is not None),
+        }
@@ -0,0 +1,358 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2013 Peter Rowlands
+# All rights reserved.
+"""goonpugd without Django
+
+Everything the goonpugd management command does lives here, so the daemon
+can also be run on a log host which has no Django settings (or no Django)::
+
+    python -m goonpug.libs.goonpugd [options] [PATH...]
+
+Run this way, the API URL comes from the GOONPUG_API_URL environment
+variable and the outbox, spool and snapshot directories default to the same
+var/ directories as the settings do (or to GOONPUGD_VAR_DIR, if that is
+set). The ORM is only loaded if --sink=db is used.
+
+"""
+
+from __future__ import division, absolute_import
+
+import os
+import sys
+import time
+
+from optparse import OptionParser, make_option
+
+from .daemon import GoonPugLogServer, LogDispatcher, ShardedDispatcher
+from .follow import LogFollower
+from .httplog import HttpLogServer, parse_server_addr
+from .logs import GoonPugParser
+from .metrics import MetricsServer
+from .outbox import Outbox, OutboxSender
+from .replay import LogReplay, MatchCounter
+from .sinks import SINKS, DatabaseSink, FileSink, HttpSink
+from .snapshot import SnapshotStore
+from .spool import LogSpool
+
+
+usage = '%prog [-s [PATH...]] [--follow DIR...] [--replay PATH...]'
+
+option_list = (
+    make_option('-p', '--port', dest='port', action='store',
+                default=27500, help='port to listen on'),
+    make_option('-s', action='store_true', dest='stdin',
+                help='read log entries from the given log files (plain, '
+                'gzip or bz2, globs allowed) or stdin instead of '
+                'listening on a network port'),
+    make_option('--follow', action='store_true', dest='follow',
+                help='follow the srcds logs in the given directories (like '
+                'tail -F) instead of listening on a network port; nothing '
+                'is lost and restarts resume where they left off'),
+    make_option('--poll-interval', dest='poll_interval', action='store',
+                default=0.5, help='with --follow, seconds between checks '
+                'for new log lines'),
+    make_option('--replay', action='store_true', dest='replay',
+                help='parse the given log files (or directories of log '
+                'files) as fast as possible and report throughput'),
+    make_option('--dry-run', action='store_true', dest='dry_run',
+                help='with --replay, count finished matches instead of '
+                'queueing them for submission'),
+    make_option('--http-port', dest='http_port', action='store',
+                default=0, help='also accept batches of log lines POSTed '
+                'over HTTP on this port'),
+    make_option('--http-bind', dest='http_bind', action='store',
+                default='127.0.0.1', help='address to accept HTTP log '
+                'batches on (default 127.0.0.1); any other address '
+                'requires --http-token'),
+    make_option('--http-token', dest='http_token', action='store',
+                help='require HTTP log batches to carry this token in an '
+                'X-GoonPUG-Token header'),
+    make_option('--http-servers', dest='http_servers', action='store',
+                help='comma separated ip:port list of the only game '
+                'servers to accept HTTP log batches for'),
+    make_option('--queue-size', dest='queue_size', action='store',
+                default=4096, help='maximum number of log packets '
+                'queued per game server before packets are dropped'),
+    make_option('--rcvbuf', dest='rcvbuf', action='store',
+                default=8 * 1024 * 1024, help='UDP socket receive buffer '
+                'size in bytes (capped by net.core.rmem_max)'),
+    make_option('--stats-interval', dest='stats_interval',
+                action='store', default=0, help='print queue depth and '
+                'dropped packet counters every N seconds'),
+    make_option('--idle-ttl', dest='idle_ttl', action='store',
+                default=900, help='drop the parser for a game server '
+                'which has sent nothing for N seconds outside of a '
+                'match (0 to keep parsers forever)'),
+    make_option('--metrics-port', dest='metrics_port', action='store',
+                default=0, help='serve runtime metrics as JSON on '
+                'http://127.0.0.1:PORT/metrics'),
+    make_option('-w', '--workers', dest='workers', action='store',
+                default=1, help='number of worker processes to shard '
+                'game servers across'),
+    make_option('--sink', dest='sink', action='store', type='choice',
+                choices=SINKS, default='outbox',
+                help='where to send finished rounds and matches: '
+                'outbox (queued on disk, then POSTed to the API), http '
+                '(POSTed right away), file (appended to --sink-file as '
+                'JSON lines) or db (stored directly in the database)'),
+    make_option('--sink-file', dest='sink_file', action='store',
+                default='-', help='file for --sink=file (default '
+                'stdout)'),
+    make_option('--outbox', dest='outbox', action='store',
+                help='directory to queue finished matches in until the '
+                'API accepts them'),
+    make_option('--spool', dest='spool', action='store',
+                help='directory to keep compressed copies of every '
+                'received log line in, per game server'),
+    make_option('--no-spool', dest='no_spool', action='store_true',
+                help='do not keep copies of received log lines'),
+    make_option('--snapshots', dest='snapshots', action='store',
+                help='directory to save parser state (and --follow read '
+                'positions) in at every round, so matches in progress '
+                'survive a restart'),
+    make_option('--no-snapshots', dest='no_snapshots', action='store_true',
+                help='do not save parser state'),
+)
+
+
+class UsageError(Exception):
+    pass
+
+
+def default_config():
+    """Return the settings goonpugd uses when run without Django"""
+    root = os.path.dirname(os.path.dirname(os.path.dirname(
+        os.path.abspath(__file__))))
+    var = os.environ.get('GOONPUGD_VAR_DIR', os.path.join(root, 'var'))
+    return {
+        'api_url': os.environ.get('GOONPUG_API_URL',
+                                  'http://localhost:8000/api'),
+        'outbox': os.path.join(var, 'outbox'),
+        'spool': os.path.join(var, 'spool'),
+        'snapshots': os.path.join(var, 'snapshots'),
+    }
+
+
+def open_sink(options, config):
+    if options['sink'] == 'http':
+        return HttpSink(config['api_url'])
+    elif options['sink'] == 'file':
+        return FileSink(options['sink_file'])
+    elif options['sink'] == 'db':
+        return DatabaseSink()
+    return Outbox(options['outbox'] or config['outbox'])
+
+
+def snapshot_dir(options, config):
+    if options['no_snapshots']:
+        return None
+    return options['snapshots'] or config['snapshots']
+
+
+def check_http_options(options):
+    """Check the --http-* options and return the --http-servers set"""
+    if not int(options['http_port']):
+        return None
+    if not options['http_token'] and \
+            options['http_bind'] not in ('127.0.0.1', 'localhost'):
+        raise UsageError('--http-bind %s requires --http-token, anyone '
+                         'who can reach it could send log lines for any '
+                         'server' % options['http_bind'])
+    if not options['http_servers']:
+        return None
+    try:
+        return set(parse_server_addr(value)
+                   for value in options['http_servers'].split(',')
+                   if value.strip())
+    except ValueError as e:
+        raise UsageError('--http-servers: %s' % e)
+
+
+def start_metrics(port, collect):
+    """Serve {'uptime': ..., **collect()} as JSON on localhost:port"""
+    started = time.time()
+
+    def collect_all():
+        metrics = collect()
+        metrics['uptime'] = time.time() - started
+        return metrics
+    metrics = MetricsServer(('127.0.0.1', port), collect_all)
+    metrics.start()
+    print u'goonpugd: Serving metrics on http://127.0.0.1:%d/metrics' % port
+    return metrics
+
+
+def run(args, options, config):
+    """Run goonpugd with parsed options
+
+    config holds api_url and the default outbox, spool and snapshot
+    directories (None to disable spooling or snapshots by default).
+    Raises UsageError for bad arguments and IOError for unreadable logs.
+
+    """
+    verbose = int(options.get('verbosity') or 1) > 1
+    http_servers = check_http_options(options)
+    if options['follow']:
+        if not args:
+            raise UsageError('--follow requires at least one directory')
+        for path in args:
+            if not os.path.isdir(path):
+                raise UsageError('%s is not a directory' % path)
+    if options['replay']:
+        if not args:
+            raise UsageError('--replay requires at least one path')
+        if options['dry_run']:
+            sink = MatchCounter()
+        else:
+            sink = open_sink(options, config)
+        replay = LogReplay(GoonPugParser(verbose=verbose, sink=sink))
+        replay.replay(args)
+        replay.print_summary()
+        return
+    sink = open_sink(options, config)
+    if isinstance(sink, Outbox):
+        sender = OutboxSender(sink, config['api_url'])
+        sender.start()
+    else:
+        sender = None
+    if options['stdin']:
+        paths = args or ['-']
+        reader = LogReplay(GoonPugParser(verbose=verbose, sink=sink))
+        if paths == ['-']:
+            print u'goonpugd: Reading from STDIN'
+        try:
+            reader.replay(paths)
+        except KeyboardInterrupt:
+            pass
+        except IOError:
+            if sender is not None:
+                sender.stop()
+            raise
+        reader.print_summary()
+        if sender is not None:
+            queued = sender.drain()
+            if queued:
+                print u'goonpugd: %d entries left in the outbox for the ' \
+                    u'next run' % queued
+            sender.stop()
+        return
+    if options['follow']:
+        follow_logs(args, options, config, sink, sender, verbose)
+        return
+    port = int(options['port'])
+    print u'goonpugd: Listening for HL log connections on port %d' % port
+    workers = int(options['workers'])
+    queue_size = int(options['queue_size'])
+    stats_interval = int(options['stats_interval'])
+    idle_ttl = int(options['idle_ttl'])
+    if options['no_spool']:
+        spool = None
+    else:
+        spool = options['spool'] or config['spool']
+    if spool:
+        print u'goonpugd: Spooling raw logs to %s' % spool
+        spool = LogSpool(spool)
+    snapshots = snapshot_dir(options, config)
+    if snapshots:
+        snapshots = SnapshotStore(snapshots)
+    if workers > 1:
+        print u'goonpugd: Sharding game servers across %d worker ' \
+            u'processes' % workers
+        dispatcher = ShardedDispatcher(workers, verbose=verbose,
+                                       queue_size=queue_size,
+                                       stats_interval=stats_interval,
+                                       sink=sink, spool=spool,
+                                       idle_ttl=idle_ttl,
+                                       snapshots=snapshots)
+    else:
+        dispatcher = LogDispatcher(verbose=verbose, queue_size=queue_size,
+                                   sink=sink, spool=spool,
+                                   idle_ttl=idle_ttl, snapshots=snapshots)
+    server = GoonPugLogServer(('0.0.0.0', port), dispatcher,
+                              stats_interval=stats_interval,
+                              rcvbuf=int(options['rcvbuf']))
+    print u'goonpugd: UDP receive buffer is %d bytes' % server.rcvbuf
+    http_port = int(options['http_port'])
+    if http_port:
+        http_server = HttpLogServer((options['http_bind'], http_port),
+                                    dispatcher, token=options['http_token'],
+                                    allowed_servers=http_servers)
+        http_server.start()
+        print u'goonpugd: Accepting HTTP log batches on %s:%d' % (
+            options['http_bind'], http_port)
+    else:
+        http_server = None
+    metrics_port = int(options['metrics_port'])
+    if metrics_port:
+        start_metrics(metrics_port, lambda: {
+            'udp': server.stats(),
+            'http': http_server.stats() if http_server else None,
+            'dispatcher': dispatcher.stats(),
+            'outbox': sender.stats() if sender else None,
+        })
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print u'goonpugd: exiting'
+        if http_server is not None:
+            http_server.stop()
+        server.server_close()
+        if sender is not None:
+            sender.stop()
+        sys.exit()
+
+
+def follow_logs(paths, options, config, sink, sender, verbose):
+    """Run a LogFollower for each log directory until interrupted"""
+    state = snapshot_dir(options, config)
+    if state:
+        state = SnapshotStore(state, max_age=None)
+    else:
+        print u'goonpugd: not saving read positions, a restart will start ' \
+            u'over from the newest logs'
+    followers = []
+    for path in paths:
+        print u'goonpugd: Following logs in %s' % path
+        follower = LogFollower(path, GoonPugParser(verbose=verbose, sink=sink),
+                               state,
+                               poll_interval=float(options['poll_interval']))
+        follower.start()
+        followers.append(follower)
+    metrics_port = int(options['metrics_port'])
+    if metrics_port:
+        start_metrics(metrics_port, lambda: {
+            'follow': dict((follower.path, follower.stats())
+                           for follower in followers),
+            'outbox': sender.stats() if sender else None,
+        })
+    try:
+        while any(follower.is_alive() for follower in followers):
+            time.sleep(1.0)
+    except KeyboardInterrupt:
+        print u'goonpugd: exiting'
+    for follower in followers:
+        follower.stop()
+    for follower in followers:
+        follower.join()
+    if sender is not None:
+        sender.stop()
+
+
+def main(argv=None):
+    parser = OptionParser(usage=usage, option_list=list(option_list))
+    parser.add_option('-v', '--verbosity', dest='verbosity', action='store',
+                      default='1', type='choice', choices=['0', '1', '2', '3'],
+                      help='verbosity level; 0=minimal output, 1=normal '
+                      'output, 2=verbose output, 3=very verbose output')
+    opts, args = parser.parse_args(argv)
+    try:
+        run(args, vars(opts), default_config())
+    except UsageError as e:
+        parser.error(str(e))
+    except IOError as e:
+        sys.stderr.write('goonpugd: %s\n' % e)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
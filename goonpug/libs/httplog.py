@@ -0,0 +1,221 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2013 Peter Rowlands
+# All rights reserved.
+"""HTTP batch log receiver
+
+Log relays (and srcds builds which can log over HTTP) POST batches of log
+lines to goonpugd instead of sending one UDP datagram per line::
+
+    POST /logs HTTP/1.1
+    X-Server-Addr: 192.168.1.10:27015
+    Content-Encoding: gzip        (optional)
+
+    L 10/05/2013 - 20:00:00: ...
+    L 10/05/2013 - 20:00:01: ...
+
+The game server is identified by the X-Server-Addr header (or a server=
+query parameter), and its lines go to the same per-server worker and
+GoonPugParser as lines received over UDP from that address. Since that
+identity is whatever the client says it is, anything but a listener on
+localhost should require an X-GoonPUG-Token, and can be limited to a list
+of known servers. Unlike UDP,
+nothing is dropped when a server's queue is full: the request waits for
+room, and if there still is none after queue_timeout seconds it gets a 503
+with the number of lines which were accepted, so the sender can retry the
+rest. A 200 means every line in the batch has been queued for parsing.
+
+Responses are JSON, {"accepted": N} on success and {"accepted": N,
+"detail": ...} otherwise.
+
+"""
+
+from __future__ import division, absolute_import
+
+import BaseHTTPServer
+import hmac
+import json
+import socket
+import SocketServer
+import threading
+import traceback
+import urlparse
+
+from .payloads import gunzip_body
+
+
+def _compare_digest(a, b):
+    """Compare two strings in time which only depends on their length"""
+    if len(a) != len(b):
+        return False
+    result = 0
+    for x, y in zip(a, b):
+        result |= ord(x) ^ ord(y)
+    return result == 0
+
+
+# hmac.compare_digest is new in 2.7.7
+compare_digest = getattr(hmac, 'compare_digest', _compare_digest)
+
+
+def parse_server_addr(value):
+    """Return the (ip, port) for an 'ip:port' server identity
+
+    Raises ValueError if value is not an IPv4 address and port.
+
+    """
+    ip, sep, port = value.strip().rpartition(':')
+    if not sep:
+        raise ValueError('expected ip:port, got %r' % value)
+    try:
+        socket.inet_aton(ip)
+    except socket.error:
+        raise ValueError('bad server address %r' % ip)
+    port = int(port)
+    if not 0 < port < 65536:
+        raise ValueError('bad server port %d' % port)
+    return (ip, port)
+
+
+class _LogHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+
+    def send_json(self, code, body, headers=()):
+        body = json.dumps(body)
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for header, value in headers:
+            self.send_header(header, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        server = self.server
+        server.requests += 1
+        try:
+            length = int(self.headers.get('Content-Length', ''))
+        except ValueError:
+            server.rejected += 1
+            self.send_json(411, {'accepted': 0,
+                                 'detail': 'Content-Length required'})
+            self.close_connection = 1
+            return
+        if length > server.max_body_size:
+            server.rejected += 1
+            self.send_json(413, {'accepted': 0,
+                                 'detail': 'body too large'})
+            self.close_connection = 1
+            return
+        body = self.rfile.read(length)
+        server.bytes += length
+        if server.token is not None and not compare_digest(
+                self.headers.get('X-GoonPUG-Token', ''), server.token):
+            server.rejected += 1
+            self.send_json(403, {'accepted': 0, 'detail': 'bad token'})
+            return
+        try:
+            client_address = self.server_addr()
+            encoding = self.headers.get('Content-Encoding', 'identity')
+            if encoding == 'gzip':
+                body = gunzip_body(body)
+            elif encoding != 'identity':
+                raise ValueError('unsupported content encoding %s' %
+                                 encoding)
+        except ValueError as e:
+            server.rejected += 1
+            self.send_json(400, {'accepted': 0, 'detail': str(e)})
+            return
+        if server.allowed_servers is not None and \
+                client_address not in server.allowed_servers:
+            server.rejected += 1
+            self.send_json(403, {'accepted': 0,
+                                 'detail': 'unknown server %s:%d' %
+                                 client_address})
+            return
+        # srcds terminates lines with a NUL when it sends them over UDP,
+        # relays may have passed that along
+        lines = [line.rstrip('\r\x00') for line in body.split('\n')]
+        lines = [line for line in lines if line]
+        try:
+            accepted = server.dispatcher.dispatch_batch(
+                client_address, lines, server.queue_timeout)
+        except Exception:
+            server.errors += 1
+            traceback.print_exc()
+            self.send_json(500, {'accepted': 0, 'detail': 'internal error'})
+            return
+        server.lines += accepted
+        if accepted < len(lines):
+            server.busy += 1
+            self.send_json(503, {'accepted': accepted,
+                                 'detail': 'queue full, retry the rest'},
+                           [('Retry-After', '1')])
+            return
+        self.send_json(200, {'accepted': accepted})
+
+    def server_addr(self):
+        value = self.headers.get('X-Server-Addr')
+        if value is None:
+            query = urlparse.parse_qs(urlparse.urlparse(self.path).query)
+            if 'server' not in query:
+                raise ValueError('X-Server-Addr header or server= query '
+                                 'parameter required')
+            value = query['server'][0]
+        return parse_server_addr(value)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class HttpLogServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+
+    """HTTP server which hands POSTed batches of log lines to a dispatcher
+
+    The dispatcher must have a thread safe dispatch_batch method, as
+    LogDispatcher and ShardedDispatcher do. If token is set, requests must
+    carry it in an X-GoonPUG-Token header, and if allowed_servers (a set of
+    (ip, port) tuples) is set, only those game servers are accepted.
+
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address, dispatcher, token=None, queue_timeout=10.0,
+                 max_body_size=16 * 1024 * 1024, allowed_servers=None):
+        BaseHTTPServer.HTTPServer.__init__(self, address, _LogHandler)
+        self.dispatcher = dispatcher
+        self.token = token
+        if allowed_servers is not None:
+            allowed_servers = frozenset(allowed_servers)
+        self.allowed_servers = allowed_servers
+        self.queue_timeout = queue_timeout
+        self.max_body_size = max_body_size
+        self.thread = None
+        self.requests = 0
+        self.lines = 0
+        self.bytes = 0
+        self.rejected = 0
+        self.busy = 0
+        self.errors = 0
+
+    def start(self):
+        self.thread = threading.Thread(target=self.serve_forever,
+                                       name='goonpugd-http')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def stats(self):
+        return {
+            'requests': self.requests,
+            'lines': self.lines,
+            'bytes': self.bytes,
+            'rejected': self.rejected,
+            'busy': self.busy,
+            'errors': self.errors,
+        }
@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2013 Peter Rowlands
+# All rights reserved.
+"""Bulk historical log import
+
+Log files are grouped by the game server which wrote them, and each group is
+parsed in order by its own GoonPugParser in a worker process, so a server's
+matches are never split across parsers while different servers are parsed in
+parallel. Each worker writes its server's matches, oldest first, to a
+temporary spool file instead of sending them back to the parent, and once
+every server is done the spools are merged by start time. So every match is
+queued in chronological order across all servers, as rating and season
+updates require, while only one entry per server is in memory at a time.
+
+"""
+
+from __future__ import division, absolute_import
+
+import cPickle as pickle
+import heapq
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+
+from .logs import GoonPugParser, parse_log_filename
+from .replay import LogReplay, expand_paths
+
+
+class MatchCollector(object):
+
+    """Sink which keeps everything it is given in memory"""
+
+    def __init__(self):
+        self.entries = []
+
+    def put(self, kind, payload):
+        self.entries.append((kind, payload))
+
+
+def group_log_files(paths):
+    """Group log files by the server which wrote them
+
+    Returns a list of (key, files) tuples, with each group's files in
+    chronological order. Files whose names do not identify a server are
+    grouped by the directory they are in.
+
+    """
+    groups = {}
+    for path in expand_paths(paths):
+        filename = os.path.basename(path)
+        if not filename.startswith('L'):
+            continue
+        server = parse_log_filename(filename)
+        if server:
+            key = '%s:%d' % server
+        else:
+            key = os.path.dirname(path)
+        groups.setdefault(key, []).append(path)
+    return [(group, sorted(files, key=os.path.basename))
+            for group, files in sorted(groups.items())]
+
+
+def write_entries(entries, filename):
+    """Write (kind, payload) entries to a spool file"""
+    with open(filename, 'wb') as f:
+        for entry in entries:
+            pickle.dump(entry, f, pickle.HIGHEST_PROTOCOL)
+
+
+def read_entries(filename):
+    """Yield the (kind, payload) entries from a spool file"""
+    with open(filename, 'rb') as f:
+        while True:
+            try:
+                yield pickle.load(f)
+            except EOFError:
+                return
+
+
+def merge_entries(filenames):
+    """Yield the entries from several sorted spool files, oldest first
+
+    Entries with the same start time (a match and its rounds) keep their
+    order, and ties between files go to the earlier file, so the result
+    only depends on the files' contents.
+
+    """
+    def keyed(i, filename):
+        for n, (kind, payload) in enumerate(read_entries(filename)):
+            yield (payload['start_time'], i, n, kind, payload)
+    streams = [keyed(i, filename) for i, filename in enumerate(filenames)]
+    for _, _, _, kind, payload in heapq.merge(*streams):
+        yield (kind, payload)
+
+
+def parse_server_logs(group):
+    """Parse one server's log files and spool the matches found
+
+    Runs in a pool worker. The entries are written to the group's spool
+    file in the order they are to be submitted in, oldest match first.
+
+    """
+    key, files, spool = group
+    collector = MatchCollector()
+    replay = LogReplay(GoonPugParser(sink=collector))
+    replay.replay(files)
+    # sort is stable, so each match's rounds stay ahead of the match itself
+    collector.entries.sort(key=lambda entry: entry[1]['start_time'])
+    write_entries(collector.entries, spool)
+    return {
+        'server': key,
+        'files': replay.files,
+        'lines': replay.lines,
+        'matches': replay.parser.matches_finished,
+        'skipped': replay.parser.matches_skipped,
+    }
+
+
+def import_logs(paths, sink, processes=None, verbose=False):
+    """Parse historical logs in a process pool and queue the matches found
+
+    Matches (and their rounds) are queued oldest first across all servers,
+    once every server's logs have been parsed.
+
+    """
+    start = time.time()
+    groups = group_log_files(paths)
+    tmp = tempfile.mkdtemp(prefix='importlogs-')
+    spools = [os.path.join(tmp, '%d.pickle' % i) for i in range(len(groups))]
+    pool = multiprocessing.Pool(processes)
+    totals = {'servers': len(groups), 'files': 0, 'lines': 0, 'matches': 0,
+              'skipped': 0}
+    try:
+        try:
+            jobs = [(key, files, spool)
+                    for (key, files), spool in zip(groups, spools)]
+            for result in pool.imap_unordered(parse_server_logs, jobs):
+                if verbose:
+                    print u'importlogs: %s: %d matches from %d files' % (
+                        result['server'], result['matches'], result['files'])
+                for k in ['files', 'lines', 'matches', 'skipped']:
+                    totals[k] += result[k]
+            pool.close()
+        except:
+            pool.terminate()
+            raise
+        finally:
+            pool.join()
+        for kind, payload in merge_entries(spools):
+            sink.put(kind, payload)
+    finally:
+        shutil.rmtree(tmp)
+    totals['elapsed'] = time.time() - start
+    return totals
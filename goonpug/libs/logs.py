@@ -4,26 +4,133 @@
 
 from __future__ import division, absolute_import
 
+import collections
 import copy
+import datetime
 import re
-import json
+import sys
 import pytz
-import requests
-
-from django.core.serializers.json import DjangoJSONEncoder
-from django.conf import settings
 
 import srcds.events.generic as generic_events
 import srcds.events.csgo as csgo_events
-from srcds.objects import BasePlayer
+from srcds.objects import BasePlayer, SteamId
+
+from ..apps.core import constants
+from .sinks import HttpSink
+
+
+LOG_FILENAME_RE = re.compile(r'.*L(?P<ip>\d+_\d+_\d+_\d+)_'
+                             r'(?P<port>\d+)_(?P<time>\d+)_000.log')
+
+
+def parse_log_filename(filename):
+    """Return the (ip, port) of the server which wrote a srcds log file
+
+    Returns None if the filename is not in the L<ip>_<port>_<time>_000.log
+    form our servers are configured to use.
+
+    """
+    m = LOG_FILENAME_RE.match(filename)
+    if m:
+        return (m.group('ip').replace('_', '.'), int(m.group('port')))
+    return None
+
 
-from ..apps.core.models import Match, Round
+_date_cache = {}
+_steam_id64_cache = {}
+
+
+def decode_timestamp(timestamp):
+    """Decode a 'mm/dd/yyyy - hh:mm:ss' log timestamp
+
+    Equivalent to the strptime in srcds' BaseEvent, but the date part only
+    changes once a day so it is decoded once and cached.
+
+    """
+    date = _date_cache.get(timestamp[:10])
+    if date is None:
+        if len(_date_cache) > 1024:
+            _date_cache.clear()
+        date = datetime.datetime.strptime(timestamp[:10], '%m/%d/%Y')
+        date = _date_cache[timestamp[:10]] = (date.year, date.month, date.day)
+    return datetime.datetime(date[0], date[1], date[2], int(timestamp[13:15]),
+                             int(timestamp[16:18]), int(timestamp[19:21]))
+
+
+def steam_id64(steam_id):
+    """Return the SteamID64 for a STEAM_X:Y:Z string, cached"""
+    id64 = _steam_id64_cache.get(steam_id)
+    if id64 is None:
+        if len(_steam_id64_cache) > 65536:
+            _steam_id64_cache.clear()
+        id64 = _steam_id64_cache[steam_id] = SteamId(steam_id).id64()
+    return id64
 
 
 class GoonPugPlayer(BasePlayer):
     pass
 
 
+class GoonPugAttackEvent(object):
+
+    """Lightweight CS:GO attack event
+
+    Matches the same lines as srcds' CsgoAttackEvent, but only decodes the
+    fields GoonPugParser.handle_attack uses, straight from the regex groups.
+
+    """
+
+    regex = csgo_events.CsgoAttackEvent.regex
+    groups = ('timestamp', 'player_steam_id', 'player_team',
+              'target_steam_id', 'target_team', 'weapon', 'damage', 'health',
+              'hitgroup')
+
+    @classmethod
+    def from_re_match(cls, match):
+        event = cls()
+        (event._timestamp, player_steam_id, event.player_team,
+         target_steam_id, event.target_team, event.weapon, damage, health,
+         event.hitgroup) = match.group(*cls.groups)
+        event.player_id = steam_id64(player_steam_id)
+        event.target_id = steam_id64(target_steam_id)
+        event.damage = int(damage)
+        event.health = int(health)
+        return event
+
+    @property
+    def timestamp(self):
+        return decode_timestamp(self._timestamp)
+
+
+class GoonPugKillEvent(object):
+
+    """Lightweight CS:GO kill event
+
+    Matches the same lines as srcds' CsgoKillEvent, but only decodes the
+    fields GoonPugParser.handle_kill uses, straight from the regex groups.
+
+    """
+
+    regex = csgo_events.CsgoKillEvent.regex
+    groups = ('timestamp', 'player_steam_id', 'player_team',
+              'target_steam_id', 'target_team', 'weapon')
+
+    @classmethod
+    def from_re_match(cls, match):
+        event = cls()
+        (event._timestamp, player_steam_id, event.player_team,
+         target_steam_id, event.target_team,
+         event.weapon) = match.group(*cls.groups)
+        event.player_id = steam_id64(player_steam_id)
+        event.target_id = steam_id64(target_steam_id)
+        event.headshot = match.string.endswith('(headshot)')
+        return event
+
+    @property
+    def timestamp(self):
+        return decode_timestamp(self._timestamp)
+
+
 class GoonPugActionEvent(generic_events.BaseEvent):
 
     """GoonPUG triggered action event"""
@@ -41,12 +148,124 @@ class GoonPugActionEvent(generic_events.BaseEvent):
         msg = u'GoonPUG triggered "%s"' % (self.action)
         return ' '.join([super(GoonPugActionEvent, self).__unicode__(), msg])
 
+    @classmethod
+    def from_re_match(cls, match):
+        return cls(decode_timestamp(match.group('timestamp')),
+                   match.group('action'))
+
+
+class PlayerRound(object):
+
+    """A single player's stats for the current round"""
+
+    fields = ('current_side', 'kills', 'assists', 'deaths', 'defuses',
+              'plants', 'tks', 'clutch_v1', 'clutch_v2', 'clutch_v3',
+              'clutch_v4', 'clutch_v5', 'k1', 'k2', 'k3', 'k4', 'k5',
+              'damage', 'health', 'clutch')
+    __slots__ = fields + ('rws',)
+
+    def __init__(self, side):
+        self.current_side = side
+        self.kills = self.assists = self.deaths = 0
+        self.defuses = self.plants = self.tks = 0
+        self.clutch_v1 = self.clutch_v2 = self.clutch_v3 = 0
+        self.clutch_v4 = self.clutch_v5 = 0
+        self.k1 = self.k2 = self.k3 = self.k4 = self.k5 = 0
+        self.damage = 0
+        self.health = 100
+        self.clutch = 0
+        # only set once the round has a winner
+        self.rws = None
+
+    def to_dict(self):
+        d = dict((field, getattr(self, field)) for field in self.fields)
+        if self.rws is not None:
+            d['rws'] = self.rws
+        return d
+
+
+class PlayerWeapon(object):
+
+    """A single player's stats with one weapon for the current match map"""
+
+    fields = ('headshots', 'hits', 'damage', 'kills', 'deaths')
+    __slots__ = fields
+
+    def __init__(self):
+        self.headshots = self.hits = self.damage = 0
+        self.kills = self.deaths = 0
+
+    def to_dict(self):
+        return dict((field, getattr(self, field)) for field in self.fields)
+
+
+# Literal text which every line of an event type must contain, in the order
+# the keywords are checked by GoonPugParser.parse_line. Only the regexes for
+# keywords actually present in a line are run, so attack and kill spam is
+# checked first and lines we don't handle never reach a regex at all.
+#
+# Keywords are byte strings since log lines are not decoded before parsing.
+EVENT_KEYWORDS = [
+    (' attacked ', GoonPugAttackEvent),
+    (' killed ', GoonPugKillEvent),
+    (' assisted killing ', csgo_events.CsgoAssistEvent),
+    ('World triggered "', generic_events.WorldActionEvent),
+    ('Team "', generic_events.RoundEndTeamEvent),
+    ('Team "', generic_events.TeamActionEvent),
+    ('GoonPUG triggered "', GoonPugActionEvent),
+    ('triggered "', generic_events.PlayerActionEvent),
+    ('switched from team <', csgo_events.SwitchTeamEvent),
+    ('committed suicide with "', generic_events.SuicideEvent),
+    ('connected, address "', generic_events.ConnectionEvent),
+    ('entered the game', generic_events.EnterGameEvent),
+    ('disconnected', generic_events.DisconnectionEvent),
+    ('Kick: "', generic_events.KickEvent),
+    (' map "', generic_events.ChangeMapEvent),
+    ('Log file ', generic_events.LogFileEvent),
+]
+
+
+def _sizeof(obj, seen=None):
+    """Approximate the memory used by obj and everything it references"""
+    if seen is None:
+        seen = set()
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        for key, value in list(obj.items()):
+            size += _sizeof(key, seen) + _sizeof(value, seen)
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        for item in list(obj):
+            size += _sizeof(item, seen)
+    elif hasattr(obj, '__slots__'):
+        for name in obj.__slots__:
+            size += _sizeof(getattr(obj, name, None), seen)
+    return size
+
+
+# Event types which are handled while no match is live. Everything else
+# (kills, attacks, round results and so on) is ignored between matches
+# without even running its regex, since none of it ends up in any stats.
+IDLE_EVENTS = frozenset([
+    generic_events.LogFileEvent,
+    generic_events.ChangeMapEvent,
+    generic_events.ConnectionEvent,
+    generic_events.EnterGameEvent,
+    csgo_events.SwitchTeamEvent,
+    GoonPugActionEvent,
+])
+
 
 class GoonPugParser(object):
 
     """GoonPUG log parser class"""
 
-    def __init__(self, verbose=False):
+    # number of recently connected players to remember names and ips for
+    max_seen_players = 1024
+
+    def __init__(self, verbose=False, sink=None):
         self.event_handlers = {
             generic_events.LogFileEvent: self.handle_log_file,
             generic_events.ChangeMapEvent: self.handle_change_map,
@@ -59,16 +278,103 @@ class GoonPugParser(object):
             generic_events.TeamActionEvent: self.handle_team_action,
             generic_events.WorldActionEvent: self.handle_world_action,
             generic_events.RoundEndTeamEvent: self.handle_round_end_team,
-            csgo_events.CsgoKillEvent: self.handle_kill,
-            csgo_events.CsgoAttackEvent: self.handle_attack,
+            GoonPugKillEvent: self.handle_kill,
+            GoonPugAttackEvent: self.handle_attack,
             csgo_events.CsgoAssistEvent: self.handle_assist,
             csgo_events.SwitchTeamEvent: self.handle_switch_team,
             GoonPugActionEvent: self.handle_goonpug_action,
         }
-        self.seen_players = {}
+        self.seen_players = collections.OrderedDict()
+        self.cts = set()
+        self.ts = set()
+        self.matches_finished = 0
+        self.matches_skipped = 0
+        self.match_live = False
+        self.match_invalid = None
+        self.closed_round = None
+        self.rounds_sent = set()
+        # set at round and match boundaries, see snapshot()
+        self.snapshot_due = False
         self._compile_regexes()
         self._reset_matches()
         self.verbose = verbose
+        self.sink = sink
+
+    def checkpoint(self):
+        """Return the state needed to resume parsing outside a live match
+
+        Only valid between matches, everything match related is dropped.
+
+        """
+        return {
+            'current_server': getattr(self, 'current_server', None),
+            'current_map': getattr(self, 'current_map', None),
+            'cts': set(self.cts),
+            'ts': set(self.ts),
+            'seen_players': self.seen_players.copy(),
+            'matches_finished': self.matches_finished,
+            'matches_skipped': self.matches_skipped,
+        }
+
+    def snapshot(self):
+        """Return a checkpoint() which also covers any match in progress
+
+        Meant to be taken when snapshot_due is set, i.e. right after a
+        round starts or a match ends, when the previous round has been sent
+        and the current one is still (nearly) empty. The match state is not
+        copied, so it must be serialized before the next line is parsed.
+
+        """
+        state = self.checkpoint()
+        state.update({
+            'current_match': self.current_match,
+            'current_match_map': self.current_match_map,
+            'current_round': self.current_round,
+            'closed_round': self.closed_round,
+            'live_cts': self.live_cts,
+            'live_ts': self.live_ts,
+            'match_live': self.match_live,
+            'match_invalid': self.match_invalid,
+            'rounds_sent': self.rounds_sent,
+        })
+        return state
+
+    def restore(self, state):
+        """Resume from a checkpoint() or snapshot() of an earlier parser"""
+        for attr in ['current_server', 'current_map']:
+            if state[attr] is not None:
+                setattr(self, attr, state[attr])
+        self.cts = set(state['cts'])
+        self.ts = set(state['ts'])
+        self.seen_players = state['seen_players'].copy()
+        self.matches_finished = state['matches_finished']
+        self.matches_skipped = state['matches_skipped']
+        if 'current_match' not in state:
+            return
+        for attr in ['current_match', 'current_match_map', 'current_round',
+                     'closed_round', 'live_cts', 'live_ts', 'match_live',
+                     'match_invalid', 'rounds_sent']:
+            setattr(self, attr, state[attr])
+        self.player_match_weapons = \
+            self.current_match_map['player_match_weapons']
+        self.player_rounds = self.current_round['player_rounds']
+
+    def memory_stats(self):
+        """Return approximate sizes of this parser's state
+
+        Safe to call from another thread, but not cheap. Only meant for
+        periodic stats output.
+
+        """
+        return {
+            'seen_players': len(self.seen_players),
+            'player_rounds': len(self.player_rounds),
+            'player_match_weapons': len(self.player_match_weapons),
+            'bytes': sum(_sizeof(obj) for obj in [
+                self.seen_players, self.current_match,
+                self.current_match_map, self.current_round,
+                self.closed_round, self.rounds_sent, self.cts, self.ts]),
+        }
 
     def _reset_matches(self):
         self.matches = []
@@ -87,6 +393,8 @@ class GoonPugParser(object):
             'player_match_weapons': {},
             'player_matches': {},
         }
+        self.player_match_weapons = \
+            self.current_match_map['player_match_weapons']
         self.current_round = {}
         self._reset_current_round()
         self.current_round['round_number'] = 0
@@ -104,63 +412,95 @@ class GoonPugParser(object):
             'kills': [],
         }
         self.current_round.update(defaults)
+        self.player_rounds = self.current_round['player_rounds']
+        self.live_cts = set()
+        self.live_ts = set()
 
     def new_player_weapon(self):
-        weapon = {
-            'headshots': 0,
-            'hits': 0,
-            'damage': 0,
-            'kills': 0,
-            'deaths': 0,
-        }
-        return weapon
+        return PlayerWeapon()
 
     def new_player_round(self, side):
-        player_round = {
-            'current_side': side,
-            'kills': 0,
-            'assists': 0,
-            'deaths': 0,
-            'defuses': 0,
-            'plants': 0,
-            'tks': 0,
-            'clutch_v1': 0,
-            'clutch_v2': 0,
-            'clutch_v3': 0,
-            'clutch_v4': 0,
-            'clutch_v5': 0,
-            'k1': 0,
-            'k2': 0,
-            'k3': 0,
-            'k4': 0,
-            'k5': 0,
-            'damage': 0,
-            'health': 100,
-            'clutch': 0,
-        }
-        return player_round
+        return PlayerRound(side)
 
     def _compile_regexes(self):
-        """Add event types"""
-        self.event_types = []
-        for cls in self.event_handlers.keys():
-            regex = re.compile(cls.regex)
-            self.event_types.append((regex, cls))
+        """Build the keyword dispatch tables for the handled event types
+
+        Handled event types without an entry in EVENT_KEYWORDS are tried
+        against every line, after the keyword dispatch. A second, smaller
+        pair of tables covering only IDLE_EVENTS is used while no match is
+        live.
+
+        """
+        regexes = dict((cls, re.compile(cls.regex))
+                       for cls in self.event_handlers)
+        self.dispatch_table, self.event_types = \
+            self._build_dispatch(regexes, self.event_handlers)
+        self.idle_dispatch_table, self.idle_event_types = \
+            self._build_dispatch(regexes, [cls for cls in self.event_handlers
+                                           if cls in IDLE_EVENTS])
+
+    def _build_dispatch(self, regexes, handled):
+        dispatch_table = []
+        event_types = []
+        keywords = {}
+        dispatched = set()
+        for keyword, cls in EVENT_KEYWORDS:
+            if cls not in handled:
+                continue
+            if keyword not in keywords:
+                keywords[keyword] = []
+                dispatch_table.append((keyword, keywords[keyword]))
+            keywords[keyword].append((regexes[cls], cls))
+            dispatched.add(cls)
+        for cls in handled:
+            if cls not in dispatched:
+                event_types.append((regexes[cls], cls))
+        return dispatch_table, event_types
 
     def parse_line(self, line):
-        """Parse a single log line"""
+        """Parse a single log line
+
+        Returns the event class the line was handled as, or None if it did
+        not match any event handled in the parser's current state.
+
+        """
         line = line.strip()
         if self.verbose:
             print line
-        for (regex, cls) in self.event_types:
+        if not line.startswith('L '):
+            return None
+        if self.match_live:
+            dispatch_table = self.dispatch_table
+            event_types = self.event_types
+        else:
+            dispatch_table = self.idle_dispatch_table
+            event_types = self.idle_event_types
+        for keyword, keyword_types in dispatch_table:
+            if keyword in line:
+                for (regex, cls) in keyword_types:
+                    match = regex.match(line)
+                    if match:
+                        return self._handle_match(cls, match)
+        for (regex, cls) in event_types:
             match = regex.match(line)
             if match:
-                event = cls.from_re_match(match)
-                handler = self.event_handlers[type(event)]
-                handler(event)
-                return
+                return self._handle_match(cls, match)
+        return None
+
+    def _handle_match(self, cls, match):
+        event = cls.from_re_match(match)
+        handler = self.event_handlers[type(event)]
+        handler(event)
+        return cls
 
     def _start_match(self, timestamp):
+        if self.match_live and self.rounds_sent:
+            # the last match was abandoned without an End_Match (restarted
+            # or its map aborted), so its streamed rounds have to go
+            print 'abandoning match with %d rounds sent' % \
+                len(self.rounds_sent)
+            self.matches_skipped += 1
+            self._discard_match()
         central = pytz.timezone('US/Central')
         timestamp = central.localize(timestamp).astimezone(pytz.utc)
         self._reset_current_match()
@@ -171,36 +511,108 @@ class GoonPugParser(object):
         self.current_match_map['start_time'] = timestamp
         self.current_match['start_time'] = timestamp
         self.current_match_map['period'] = 1
+        self.match_live = True
+        self.match_invalid = None
+        self.closed_round = None
+        self.rounds_sent = set()
 
     def _end_match(self, event):
+        if not self.match_live:
+            return
+        self._send_closed_round()
+        self.match_live = False
+        self.snapshot_due = True
         match_map = copy.copy(self.current_match_map)
         self.current_match['match_maps'].append(match_map)
+        if self.match_invalid is not None:
+            print 'skipping invalid match with %d players' % \
+                self.match_invalid
+            self.matches_skipped += 1
+            self._discard_match()
+            return
+        self.matches_finished += 1
+        match = self._match_payload()
+        match['streamed_rounds'] = len(self.rounds_sent)
+        self._submit('match', match)
+
+    def _discard_match(self):
+        """Tell the API to delete the rounds sent for the current match"""
+        if self.rounds_sent:
+            self._submit('match', {
+                'server': self.current_match['server'],
+                'start_time': self.current_match['start_time'],
+                'discard': True,
+            })
+            self.rounds_sent = set()
+
+    def _send_closed_round(self):
+        """Submit the last round which ended, if any
+
+        A round is only sent once the next round starts (or the match
+        ends), since kills after Round_End still count towards it.
+
+        """
+        round = self.closed_round
+        self.closed_round = None
+        if round is None or not self.match_live \
+                or self.match_invalid is not None:
+            return
+        if len(round['player_rounds']) < 9:
+            # stop sending rounds, the match is discarded at End_Match
+            self.match_invalid = len(round['player_rounds'])
+            return
+        round = dict(round)
+        round['player_rounds'] = dict(
+            (steam_id, player_round.to_dict())
+            for steam_id, player_round in round['player_rounds'].items())
+        map_number = len(self.current_match['match_maps'])
+        self._submit('round', {
+            'server': self.current_match['server'],
+            'start_time': self.current_match['start_time'],
+            'map_number': map_number,
+            'map_name': self.current_match_map['map_name'],
+            'round': round,
+        })
+        self.rounds_sent.add((map_number, round['round_number']))
+
+    def _submit(self, kind, payload):
+        if self.sink is None:
+            from django.conf import settings
+            self.sink = HttpSink(settings.GOONPUG_API_URL)
+        self.sink.put(kind, payload)
+
+    def _match_payload(self):
+        """Return the finished match, without its (already sent) rounds"""
+        match = dict(self.current_match)
+        match['match_maps'] = []
         for match_map in self.current_match['match_maps']:
-            for round in match_map['rounds']:
-                if len(round['player_rounds']) < 9:
-                    print 'skipping invalid match with %d players' % \
-                        len(round['player_rounds'])
-                    return
-        payload = json.dumps(self.current_match, cls=DjangoJSONEncoder)
-        r = requests.post('%s/pugmatch/' % settings.GOONPUG_API_URL,
-                          data=payload,
-                          headers={'content-type': 'application/json'})
-        print r.text
+            match_map = dict(match_map)
+            match_map['rounds'] = []
+            match_map['player_match_weapons'] = dict(
+                (steam_id, dict((weapon, player_weapon.to_dict())
+                                for weapon, player_weapon in weapons.items()))
+                for steam_id, weapons
+                in match_map['player_match_weapons'].items())
+            match['match_maps'].append(match_map)
+        return match
 
     def _start_round(self):
+        self._send_closed_round()
+        self.snapshot_due = True
         self._reset_current_round()
         self.current_round['round_number'] += 1
+        player_rounds = self.player_rounds
         for steam_id in self.cts:
-            self.current_round['player_rounds'][steam_id] = \
-                self.new_player_round(Match.SIDE_CT)
+            player_rounds[steam_id] = self.new_player_round(constants.SIDE_CT)
         for steam_id in self.ts:
-            self.current_round['player_rounds'][steam_id] = \
-                self.new_player_round(Match.SIDE_T)
+            player_rounds[steam_id] = self.new_player_round(constants.SIDE_T)
+        self.live_cts = set(self.cts)
+        self.live_ts = set(self.ts)
 
     def _end_round(self, event):
         rounds_played = self.current_round['round_number']
-        round = copy.copy(self.current_round)
-        self.current_match_map['rounds'].append(round)
+        self._send_closed_round()
+        self.closed_round = copy.copy(self.current_round)
         if rounds_played == 0:
             self.current_match_map['period'] = 1
         elif rounds_played < 30 and (rounds_played % 15) == 0:
@@ -208,38 +620,84 @@ class GoonPugParser(object):
         elif rounds_played >= 30 and (rounds_played % 6) == 0:
             self.current_match_map['period'] += 1
 
+    def _player_round(self, steam_id, team):
+        """Return a player's PlayerRound, creating it if needed
+
+        Returns None for players who are not on CT or T.
+
+        """
+        player_round = self.player_rounds.get(steam_id)
+        if player_round is None:
+            if team == 'CT':
+                side = constants.SIDE_CT
+            elif team == 'TERRORIST':
+                side = constants.SIDE_T
+            else:
+                return None
+            player_round = self.new_player_round(side)
+            self.player_rounds[steam_id] = player_round
+            self._update_alive(steam_id)
+        return player_round
+
+    def _player_weapon(self, steam_id, weapon):
+        """Return a player's PlayerWeapon for weapon, creating it if needed"""
+        weapons = self.player_match_weapons.get(steam_id)
+        if weapons is None:
+            weapons = self.player_match_weapons[steam_id] = {}
+        player_weapon = weapons.get(weapon)
+        if player_weapon is None:
+            player_weapon = weapons[weapon] = self.new_player_weapon()
+        return player_weapon
+
+    def _update_alive(self, steam_id):
+        """Update the live player sets after a player's team or health
+        changes
+
+        A player is live if they are on a team and have a PlayerRound with
+        health left this round.
+
+        """
+        player_round = self.player_rounds.get(steam_id)
+        alive = player_round is not None and player_round.health > 0
+        for team, live in [(self.cts, self.live_cts),
+                           (self.ts, self.live_ts)]:
+            if alive and steam_id in team:
+                live.add(steam_id)
+            else:
+                live.discard(steam_id)
+
     def _sfui_notice(self, winning_team, defused=False, exploded=False,
-                     win_type=Round.WIN_TYPE_NORMAL):
+                     win_type=constants.WIN_TYPE_NORMAL):
         if winning_team == u'TERRORIST':
             self.current_round['t_win'] = True
-            side = Match.SIDE_T
+            side = constants.SIDE_T
         elif winning_team == u'CT':
             self.current_round['ct_win'] = True
-            side = Match.SIDE_CT
+            side = constants.SIDE_CT
         else:
             # don't do anything with rws if it's a tie
             return
 
         team_damage = 0
         team_player_rounds = []
-        for player_round in self.current_round['player_rounds'].values():
-            if player_round['current_side'] == side:
-                team_damage += player_round['damage']
+        for player_round in self.player_rounds.values():
+            if player_round.current_side == side:
+                team_damage += player_round.damage
                 team_player_rounds.append(player_round)
             else:
-                player_round['clutch'] = 0
-                player_round['rws'] = 0.0
-
-            if player_round['kills'] == 1:
-                player_round['k1'] = 1
-            elif player_round['kills'] == 2:
-                player_round['k2'] = 1
-            elif player_round['kills'] == 3:
-                player_round['k3'] = 1
-            elif player_round['kills'] == 4:
-                player_round['k4'] = 1
-            elif player_round['kills'] == 5:
-                player_round['k5'] = 1
+                player_round.clutch = 0
+                player_round.rws = 0.0
+
+            if player_round.kills == 1:
+                player_round.k1 = 1
+            elif player_round.kills == 2:
+                player_round.k2 = 1
+            elif player_round.kills == 3:
+                player_round.k3 = 1
+            elif player_round.kills == 4:
+                player_round.k4 = 1
+            elif player_round.kills == 5:
+                player_round.k5 = 1
 
         if defused or exploded:
             multi = 70.0
@@ -248,39 +706,38 @@ class GoonPugParser(object):
 
         for player_round in team_player_rounds:
             try:
-                player_round['rws'] = multi * (player_round['damage']
-                                               / team_damage)
+                player_round.rws = multi * (player_round.damage
+                                            / team_damage)
             except ZeroDivisionError:
-                player_round['rws'] = 0.0
-            if defused and player_round['defuses']:
-                player_round['rws'] += 30.0
-            if exploded and player_round['plants']:
-                player_round['rws'] += 30.0
-
-            if player_round['clutch'] == 1:
-                player_round['clutch_v1'] = 1
-            elif player_round['clutch'] == 2:
-                player_round['clutch_v2'] = 1
-            elif player_round['clutch'] == 3:
-                player_round['clutch_v3'] = 1
-            elif player_round['clutch'] == 4:
-                player_round['clutch_v4'] = 1
-            elif player_round['clutch'] == 5:
-                player_round['clutch_v5'] = 1
+                player_round.rws = 0.0
+            if defused and player_round.defuses:
+                player_round.rws += 30.0
+            if exploded and player_round.plants:
+                player_round.rws += 30.0
+
+            if player_round.clutch == 1:
+                player_round.clutch_v1 = 1
+            elif player_round.clutch == 2:
+                player_round.clutch_v2 = 1
+            elif player_round.clutch == 3:
+                player_round.clutch_v3 = 1
+            elif player_round.clutch == 4:
+                player_round.clutch_v4 = 1
+            elif player_round.clutch == 5:
+                player_round.clutch_v5 = 1
 
     def handle_log_file(self, event):
         if event.started:
             self.ts = set()
             self.cts = set()
-            pattern = (r'.*L(?P<ip>\d+_\d+_\d+_\d+)_'
-                       r'(?P<port>\d+)_(?P<time>\d+)_000.log')
-            m = re.match(pattern, event.filename)
-            if m:
+            self.live_ts = set()
+            self.live_cts = set()
+            server = parse_log_filename(event.filename)
+            if server:
                 # TODO: If we support anything besides pugs this shouldn't be
                 # reset
                 self.match = {}
-                ip = m.group('ip').replace('_', '.')
-                port = int(m.group('port'))
+                ip, port = server
                 self.current_server = {'ip': ip, 'port': port}
 
     def handle_change_map(self, event):
@@ -292,48 +749,50 @@ class GoonPugParser(object):
                 mapname = m.group('workshop_name')
             self.current_map = mapname
 
+    def _seen_player(self, steam_id):
+        """Return the seen_players entry for steam_id
+
+        seen_players is kept in least recently seen order, and trimmed to
+        max_seen_players so a long running parser doesn't remember everyone
+        who has ever connected.
+
+        """
+        player = self.seen_players.pop(steam_id, None)
+        if player is None:
+            player = {}
+            while len(self.seen_players) >= self.max_seen_players:
+                self.seen_players.popitem(last=False)
+        self.seen_players[steam_id] = player
+        return player
+
     def handle_connection(self, event):
-        steam_id = event.player.steam_id.id64()
-        if steam_id not in self.seen_players:
-            self.seen_players[steam_id] = {}
+        player = self._seen_player(event.player.steam_id.id64())
         if event.address:
-            self.seen_players[steam_id]['ip'] = event.address[0]
+            player['ip'] = event.address[0]
 
     def handle_enter_game(self, event):
-        steam_id = event.player.steam_id.id64()
-        if steam_id not in self.seen_players:
-            self.seen_players[steam_id] = {}
-        self.seen_players[steam_id]['name'] = event.player.name
+        player = self._seen_player(event.player.steam_id.id64())
+        player['name'] = event.player.name
 
     def _check_clutch(self):
-        live_ts = []
-        live_cts = []
-        for player in self.cts:
-            if player in self.current_round['player_rounds'] and \
-                    self.current_round['player_rounds'][player]['health'] > 0:
-                live_cts.append(player)
-        for player in self.ts:
-            if player in self.current_round['player_rounds'] and \
-                    self.current_round['player_rounds'][player]['health'] > 0:
-                live_ts.append(player)
-
-        if len(live_ts) == 1:
-            player = live_ts[0]
-            clutch = len(live_cts)
-        elif len(live_cts) == 1:
-            player = live_cts[0]
-            clutch = len(live_ts)
+        if len(self.live_ts) == 1:
+            player = next(iter(self.live_ts))
+            clutch = len(self.live_cts)
+        elif len(self.live_cts) == 1:
+            player = next(iter(self.live_cts))
+            clutch = len(self.live_ts)
         else:
             return
-        player_round = self.current_round['player_rounds'][player]
-        if clutch > player_round['clutch']:
-            player_round['clutch'] = clutch
+        player_round = self.player_rounds[player]
+        if clutch > player_round.clutch:
+            player_round.clutch = clutch
 
     def handle_suicide(self, event):
         steam_id = event.player.steam_id.id64()
-        player_round = self.current_round['player_rounds'][steam_id]
-        player_round['deaths'] += 1
-        player_round['health'] = 0
+        player_round = self.player_rounds[steam_id]
+        player_round.deaths += 1
+        player_round.health = 0
+        self._update_alive(steam_id)
         kill = {
             'killer': steam_id,
             'killer_team': event.player.team,
@@ -354,22 +813,22 @@ class GoonPugParser(object):
 
     def handle_player_action(self, event):
         steam_id = event.player.steam_id.id64()
-        if steam_id in self.current_round['player_rounds']:
-            player_round = self.current_round['player_rounds'][steam_id]
+        player_round = self.player_rounds.get(steam_id)
+        if player_round is not None:
             if event.action == "Planted_The_Bomb":
-                player_round['plants'] += 1
+                player_round.plants += 1
             elif event.action == "Defused_The_Bomb":
-                player_round['defuses'] += 1
+                player_round.defuses += 1
 
     def handle_team_action(self, event):
         if event.action == u"SFUI_Notice_Bomb_Defused":
             self._sfui_notice(event.team, defused=True,
-                              win_type=Round.WIN_TYPE_DEFUSED)
+                              win_type=constants.WIN_TYPE_DEFUSED)
         elif event.action == u"SFUI_Notice_Target_Bombed":
             self._sfui_notice(event.team, exploded=True,
-                              win_type=Round.WIN_TYPE_EXPLODED)
+                              win_type=constants.WIN_TYPE_EXPLODED)
         elif event.action == u"SFUI_Notice_Target_Saved":
-            self._sfui_notice(event.team, win_type=Round.WIN_TYPE_SAVED)
+            self._sfui_notice(event.team, win_type=constants.WIN_TYPE_SAVED)
         elif event.action == u"SFUI_Notice_Terrorists_Win" \
                 or event.action == u"SFUI_Notice_CTs_Win":
             self._sfui_notice(event.team)
@@ -401,62 +860,30 @@ class GoonPugParser(object):
                 self.current_match_map['score_1'] = event.score
 
     def handle_kill(self, event):
-        killer_id = event.player.steam_id.id64()
-        victim_id = event.target.steam_id.id64()
-        if killer_id not in self.current_round['player_rounds']:
-            if event.player.team == 'CT':
-                self.current_round['player_rounds'][killer_id] = \
-                    self.new_player_round(Match.SIDE_CT)
-            elif event.player.team == 'TERRORIST':
-                self.current_round['player_rounds'][killer_id] = \
-                    self.new_player_round(Match.SIDE_T)
-            else:
-                return
-        if victim_id not in self.current_round['player_rounds']:
-            if event.target.team == 'CT':
-                self.current_round['player_rounds'][victim_id] = \
-                    self.new_player_round(Match.SIDE_CT)
-            elif event.target.team == 'TERRORIST':
-                self.current_round['player_rounds'][victim_id] = \
-                    self.new_player_round(Match.SIDE_T)
-            else:
-                return
+        killer_id = event.player_id
+        victim_id = event.target_id
+        killer_round = self._player_round(killer_id, event.player_team)
+        if killer_round is None:
+            return
+        victim_round = self._player_round(victim_id, event.target_team)
+        if victim_round is None:
+            return
 
-        killer_round = self.current_round['player_rounds'][killer_id]
-        victim_round = self.current_round['player_rounds'][victim_id]
-        killer_round['kills'] += 1
-        if event.player.team == event.target.team:
-            killer_round['tks'] += 1
-        victim_round['deaths'] += 1
+        killer_round.kills += 1
+        if event.player_team == event.target_team:
+            killer_round.tks += 1
+        victim_round.deaths += 1
 
         weapon = event.weapon
-        if killer_id not in self.current_match_map['player_match_weapons']:
-            self.current_match_map['player_match_weapons'][killer_id] = {}
-        killer_weapons = \
-            self.current_match_map['player_match_weapons'][killer_id]
-        if weapon not in killer_weapons:
-            killer_weapons[weapon] = self.new_player_weapon()
-
-        if victim_id not in self.current_match_map['player_match_weapons']:
-            self.current_match_map['player_match_weapons'][victim_id] = {}
-        victim_weapons = \
-            self.current_match_map['player_match_weapons'][victim_id]
-        if weapon not in victim_weapons:
-            victim_weapons[weapon] = self.new_player_weapon()
-
-        killer_weapons = \
-            self.current_match_map['player_match_weapons'][killer_id]
-        victim_weapons = \
-            self.current_match_map['player_match_weapons'][victim_id]
-        killer_weapons[event.weapon]['kills'] += 1
+        self._player_weapon(killer_id, weapon).kills += 1
         # headshots is updated in handle_attack
-        victim_weapons[event.weapon]['deaths'] += 1
+        self._player_weapon(victim_id, weapon).deaths += 1
         kill = {
             'killer': killer_id,
-            'killer_team': event.player.team,
+            'killer_team': event.player_team,
             'victim': victim_id,
-            'victim_team': event.target.team,
-            'weapon': event.weapon,
+            'victim_team': event.target_team,
+            'weapon': weapon,
             'headshot': event.headshot,
         }
         self.current_round['kills'].append(kill)
@@ -464,72 +891,43 @@ class GoonPugParser(object):
 
     def handle_attack(self, event):
         # ignore ff
-        if event.player.team == event.target.team:
+        if event.player_team == event.target_team:
             return
 
-        attacker_id = event.player.steam_id.id64()
-        victim_id = event.target.steam_id.id64()
-        if attacker_id not in self.current_round['player_rounds']:
-            if event.player.team == 'CT':
-                self.current_round['player_rounds'][attacker_id] = \
-                    self.new_player_round(Match.SIDE_CT)
-            elif event.player.team == 'TERRORIST':
-                self.current_round['player_rounds'][attacker_id] = \
-                    self.new_player_round(Match.SIDE_T)
-            else:
-                return
-        if victim_id not in self.current_round['player_rounds']:
-            if event.target.team == 'CT':
-                self.current_round['player_rounds'][victim_id] = \
-                    self.new_player_round(Match.SIDE_CT)
-            elif event.target.team == 'TERRORIST':
-                self.current_round['player_rounds'][victim_id] = \
-                    self.new_player_round(Match.SIDE_T)
-            else:
-                return
-        attacker_round = self.current_round['player_rounds'][attacker_id]
-        victim_round = self.current_round['player_rounds'][victim_id]
+        attacker_id = event.player_id
+        victim_id = event.target_id
+        attacker_round = self._player_round(attacker_id, event.player_team)
+        if attacker_round is None:
+            return
+        victim_round = self._player_round(victim_id, event.target_team)
+        if victim_round is None:
+            return
 
-        if event.health > 0:
+        health = event.health
+        if health > 0:
             damage = event.damage
         else:
             # target is dead, we have to adjust for overkill damage
-            damage = victim_round['health']
-        victim_round['health'] = event.health
-        attacker_round['damage'] += damage
+            damage = victim_round.health
+        was_alive = victim_round.health > 0
+        victim_round.health = health
+        if was_alive != (health > 0):
+            self._update_alive(victim_id)
+        attacker_round.damage += damage
 
         weapon = event.weapon
-        if attacker_id not in self.current_match_map['player_match_weapons']:
-            self.current_match_map['player_match_weapons'][attacker_id] = {}
-        attacker_weapons = \
-            self.current_match_map['player_match_weapons'][attacker_id]
-        if weapon not in attacker_weapons:
-            attacker_weapons[weapon] = self.new_player_weapon()
-
-        if victim_id not in self.current_match_map['player_match_weapons']:
-            self.current_match_map['player_match_weapons'][victim_id] = {}
-        victim_weapons = \
-            self.current_match_map['player_match_weapons'][victim_id]
-        if weapon not in victim_weapons:
-            victim_weapons[weapon] = self.new_player_weapon()
-
-        attacker_weapons[weapon]['damage'] += damage
-        attacker_weapons[weapon]['hits'] += 1
+        attacker_weapon = self._player_weapon(attacker_id, weapon)
+        self._player_weapon(victim_id, weapon)
+        attacker_weapon.damage += damage
+        attacker_weapon.hits += 1
         if event.hitgroup == 'head':
-            attacker_weapons[weapon]['headshots'] += 1
+            attacker_weapon.headshots += 1
 
     def handle_assist(self, event):
         steam_id = event.player.steam_id.id64()
-        if steam_id not in self.current_round['player_rounds']:
-            if event.player.team == 'CT':
-                self.current_round['player_rounds'][steam_id] = \
-                    self.new_player_round(Match.SIDE_CT)
-            elif event.player.team == 'TERRORIST':
-                self.current_round['player_rounds'][steam_id] = \
-                    self.new_player_round(Match.SIDE_T)
-            else:
-                return
-        self.current_round['player_rounds'][steam_id]['assists'] += 1
+        player_round = self._player_round(steam_id, event.player.team)
+        if player_round is not None:
+            player_round.assists += 1
 
     def handle_switch_team(self, event):
         steam_id = event.player.steam_id.id64()
@@ -544,16 +942,17 @@ class GoonPugParser(object):
 
         if event.new_team == 'CT':
             self.cts.add(steam_id)
-            if steam_id not in self.current_round['player_rounds']:
-                self.current_round['player_rounds'][steam_id] = \
-                    self.new_player_round(Match.SIDE_CT)
+            if steam_id not in self.player_rounds:
+                self.player_rounds[steam_id] = \
+                    self.new_player_round(constants.SIDE_CT)
         elif event.new_team == 'TERRORIST':
             self.ts.add(steam_id)
-            if steam_id not in self.current_round['player_rounds']:
-                self.current_round['player_rounds'][steam_id] = \
-                    self.new_player_round(Match.SIDE_T)
-        elif steam_id in self.current_round['player_rounds']:
-            self.current_round['player_rounds'][steam_id]['health'] = 0
+            if steam_id not in self.player_rounds:
+                self.player_rounds[steam_id] = \
+                    self.new_player_round(constants.SIDE_T)
+        elif steam_id in self.player_rounds:
+            self.player_rounds[steam_id].health = 0
+        self._update_alive(steam_id)
 
 
 def parse_match_log(data):
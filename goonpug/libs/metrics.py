@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2013 Peter Rowlands
+# All rights reserved.
+"""goonpugd runtime metrics
+
+Counters are kept by whatever they describe (workers, dispatchers, the
+outbox sender) and collected into a single JSON document on request. A
+MetricsServer serves that document over HTTP, bound to localhost by
+default, so it can be polled by monitoring or just curled.
+
+"""
+
+from __future__ import division, absolute_import
+
+import BaseHTTPServer
+import bisect
+import json
+import SocketServer
+import threading
+import traceback
+
+
+class LatencyHistogram(object):
+
+    """Histogram of durations, with fixed buckets in seconds"""
+
+    bounds = (0.000001, 0.0000025, 0.000005, 0.00001, 0.000025, 0.00005,
+              0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025,
+              0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+    __slots__ = ('counts', 'count', 'sum')
+
+    def __init__(self):
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, seconds):
+        self.counts[bisect.bisect_left(self.bounds, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+
+    def to_dict(self):
+        """Return cumulative bucket counts keyed by upper bound in ms"""
+        buckets = []
+        total = 0
+        for bound, n in zip(self.bounds + (None,), self.counts):
+            total += n
+            if bound is None:
+                buckets.append(['+Inf', total])
+            else:
+                buckets.append([bound * 1000, total])
+        return {'count': self.count, 'sum': self.sum, 'buckets': buckets}
+
+
+class _MetricsHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        if self.path.split('?')[0] not in ('/', '/metrics'):
+            self.send_error(404)
+            return
+        try:
+            body = json.dumps(self.server.collect(), sort_keys=True,
+                              indent=2)
+        except Exception:
+            traceback.print_exc()
+            self.send_error(500)
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class MetricsServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+
+    """HTTP server which returns collect() as JSON for GET /metrics"""
+
+    daemon_threads = True
+
+    def __init__(self, address, collect):
+        BaseHTTPServer.HTTPServer.__init__(self, address, _MetricsHandler)
+        self.collect = collect
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.serve_forever,
+                                       name='goonpugd-metrics')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
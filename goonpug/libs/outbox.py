@@ -0,0 +1,259 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2013 Peter Rowlands
+# All rights reserved.
+"""Durable outbox for finished match payloads
+
+The parser only ever writes payloads to a local spool directory, which is
+cheap and never blocks on the web tier. A background OutboxSender delivers
+the queued entries to the GoonPUG API in batches, and only deletes an entry
+once the API has acknowledged it.
+
+"""
+
+from __future__ import division, absolute_import
+
+import itertools
+import os
+import threading
+import time
+import traceback
+
+import requests
+
+from .metrics import LatencyHistogram
+from .payloads import encode_payload, gzip_body
+
+
+class Outbox(object):
+
+    """On-disk FIFO of payloads waiting to be submitted
+
+    Each entry is a single JSON file (in the compact payload format) named
+    so that sorting the directory listing gives submission order. Entries
+    are written to a temporary file and renamed into place, so a crash
+    never leaves a partial entry behind.
+
+    """
+
+    endpoints = {
+        'match': 'pugmatch/',
+        'round': 'pugmatch/round/',
+    }
+
+    def __init__(self, path):
+        self.path = path
+        self.failed_path = os.path.join(path, 'failed')
+        for p in [self.path, self.failed_path]:
+            if not os.path.isdir(p):
+                os.makedirs(p)
+        self._seq = itertools.count()
+        self.wakeup = threading.Event()
+
+    def put(self, kind, payload):
+        """Queue a payload of the given kind for delivery"""
+        if kind not in self.endpoints:
+            raise ValueError('Unknown outbox entry kind: %s' % kind)
+        data = encode_payload(kind, payload)
+        name = '%013d-%05d-%06d.%s.json' % (int(time.time() * 1000),
+                                            os.getpid(), next(self._seq),
+                                            kind)
+        tmp = os.path.join(self.path, '.%s.tmp' % name)
+        with open(tmp, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.rename(tmp, os.path.join(self.path, name))
+        self.wakeup.set()
+        return name
+
+    def entries(self):
+        """Return the names of all queued entries, oldest first"""
+        return sorted(name for name in os.listdir(self.path)
+                      if name.endswith('.json') and not name.startswith('.'))
+
+    def kind(self, name):
+        return name.rsplit('.', 2)[1]
+
+    def queued_at(self, name):
+        """Return the unix time an entry was queued at"""
+        return int(name.split('-', 1)[0]) / 1000
+
+    def read(self, name):
+        with open(os.path.join(self.path, name), 'rb') as f:
+            return f.read()
+
+    def remove(self, name):
+        os.remove(os.path.join(self.path, name))
+
+    def fail(self, name):
+        """Move an entry which the API refused out of the way"""
+        os.rename(os.path.join(self.path, name),
+                  os.path.join(self.failed_path, name))
+
+    def __len__(self):
+        return len(self.entries())
+
+
+class OutboxSender(threading.Thread):
+
+    """Background thread which delivers outbox entries to the API
+
+    Consecutive entries of the same kind are POSTed together as a gzipped
+    JSON list.
+    Connection errors and 5xx responses are retried with exponential
+    backoff. A 4xx response means the API will never accept the payload, so
+    the batch is retried one entry at a time and any entry which is still
+    refused is moved to the outbox's failed directory instead of blocking
+    everything queued behind it.
+
+    """
+
+    def __init__(self, outbox, api_url, batch_size=20, poll_interval=1.0,
+                 min_backoff=1.0, max_backoff=300.0, timeout=30.0):
+        super(OutboxSender, self).__init__(name='goonpugd-outbox')
+        self.daemon = True
+        self.outbox = outbox
+        self.api_url = api_url.rstrip('/')
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.backoff = 0
+        self.sent = 0
+        self.failed = 0
+        self.retries = 0
+        # time taken by each POST, and from queueing to acknowledgement for
+        # each entry
+        self.post_latency = LatencyHistogram()
+        self.delivery_latency = LatencyHistogram()
+        self._stop = threading.Event()
+
+    def stop(self):
+        self._stop.set()
+        self.outbox.wakeup.set()
+
+    def drain(self, timeout=30.0):
+        """Wait up to timeout seconds for the outbox to empty
+
+        Returns the number of entries still queued.
+
+        """
+        deadline = time.time() + timeout
+        while len(self.outbox) and time.time() < deadline \
+                and self.is_alive():
+            time.sleep(0.1)
+        return len(self.outbox)
+
+    def run(self):
+        while not self._stop.is_set():
+            try:
+                sent = self.send_batch()
+            except Exception:
+                traceback.print_exc()
+                sent = False
+            if sent is None:
+                # nothing queued
+                self.outbox.wakeup.wait(self.poll_interval)
+                self.outbox.wakeup.clear()
+            elif sent:
+                self.backoff = 0
+            else:
+                self._stop.wait(self.retry_later())
+
+    def retry_later(self):
+        """Double the backoff after a failed delivery and return it"""
+        self.retries += 1
+        self.backoff = min(max(self.backoff * 2, self.min_backoff),
+                           self.max_backoff)
+        return self.backoff
+
+    def next_batch(self):
+        entries = self.outbox.entries()
+        if not entries:
+            return None, []
+        kind = self.outbox.kind(entries[0])
+        batch = []
+        for name in entries[:self.batch_size]:
+            if self.outbox.kind(name) != kind:
+                break
+            batch.append(name)
+        return kind, batch
+
+    def post(self, kind, names):
+        body = gzip_body('[%s]' % ','.join(self.outbox.read(name)
+                                            for name in names))
+        url = '%s/%s' % (self.api_url, self.outbox.endpoints[kind])
+        start = time.time()
+        try:
+            return self.session.post(
+                url, data=body, timeout=self.timeout,
+                headers={'content-type': 'application/json',
+                         'content-encoding': 'gzip'})
+        finally:
+            self.post_latency.observe(time.time() - start)
+
+    def delivered(self, name):
+        self.outbox.remove(name)
+        self.delivery_latency.observe(time.time() -
+                                      self.outbox.queued_at(name))
+        self.sent += 1
+
+    def send_batch(self):
+        """Try to deliver the oldest batch of entries
+
+        Returns None if the outbox is empty, True if the batch was
+        delivered (or set aside) and False if it should be retried later.
+
+        """
+        kind, batch = self.next_batch()
+        if not batch:
+            return None
+        try:
+            r = self.post(kind, batch)
+        except requests.RequestException as e:
+            print u'goonpugd: outbox delivery failed: %s' % e
+            return False
+        if 200 <= r.status_code < 300:
+            for name in batch:
+                self.delivered(name)
+            return True
+        elif 400 <= r.status_code < 500 and r.status_code not in (408, 429):
+            if len(batch) > 1:
+                return all([self.send_one(kind, name) for name in batch])
+            self.set_aside(batch[0], r)
+            return True
+        print u'goonpugd: outbox delivery failed: HTTP %d' % r.status_code
+        return False
+
+    def send_one(self, kind, name):
+        try:
+            r = self.post(kind, [name])
+        except requests.RequestException as e:
+            print u'goonpugd: outbox delivery failed: %s' % e
+            return False
+        if 200 <= r.status_code < 300:
+            self.delivered(name)
+            return True
+        elif 400 <= r.status_code < 500 and r.status_code not in (408, 429):
+            self.set_aside(name, r)
+            return True
+        return False
+
+    def set_aside(self, name, response):
+        print u'goonpugd: API refused %s (HTTP %d): %s' % (
+            name, response.status_code, response.text)
+        self.outbox.fail(name)
+        self.failed += 1
+
+    def stats(self):
+        return {
+            'queued': len(self.outbox),
+            'sent': self.sent,
+            'failed': self.failed,
+            'retries': self.retries,
+            'backoff': self.backoff,
+            'post_latency': self.post_latency.to_dict(),
+            'delivery_latency': self.delivery_latency.to_dict(),
+        }
@@ -0,0 +1,273 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2013 Peter Rowlands
+# All rights reserved.
+"""Wire encoding for parser payloads
+
+Encodes datetimes exactly as Django's DjangoJSONEncoder does (which is what
+the API expects), without needing Django to be importable.
+
+Payloads are sent to the API in a compact columnar form, which is what
+compact_payload returns. Steam IDs and weapon names are listed once per
+payload in the players and weapons tables and referred to by index, and
+rounds, player rounds, kills and weapon stats are arrays of counters in the
+order of the *_FIELDS tuples below instead of objects repeating every key::
+
+    {"format": "compact-1", "players": [steamid, ...], "weapons": [...],
+     ... the usual match or round keys ...}
+
+    round:        [round_number, score_a, score_b, flags, player_rounds,
+                   kills]
+    player round: [player, current_side, kills, ..., damage(, rws)]
+    kill:         [killer, killer_team, victim, victim_team, headshot,
+                   weapon]
+    weapon stats: [player, weapon, headshots, hits, damage, kills, deaths]
+
+where flags is a bitmask of ROUND_FLAGS and teams are indexes into TEAMS
+(or the team name itself, for a team which isn't in TEAMS).
+expand_payload turns either form back into the plain one. Request bodies
+are also gzipped; together that makes a match and its rounds about a tenth
+of their plain JSON size.
+
+"""
+
+from __future__ import division, absolute_import
+
+import cStringIO
+import datetime
+import decimal
+import gzip
+import hashlib
+import json
+import struct
+import zlib
+
+
+COMPACT_FORMAT = 'compact-1'
+
+ROUND_FLAGS = ('bomb_planted', 'bomb_defused', 'bomb_exploded', 'ct_win',
+               't_win')
+
+PLAYER_ROUND_FIELDS = ('current_side', 'kills', 'assists', 'deaths',
+                       'defuses', 'plants', 'tks', 'clutch_v1', 'clutch_v2',
+                       'clutch_v3', 'clutch_v4', 'clutch_v5', 'k1', 'k2',
+                       'k3', 'k4', 'k5', 'damage')
+
+WEAPON_FIELDS = ('headshots', 'hits', 'damage', 'kills', 'deaths')
+
+TEAMS = ('CT', 'TERRORIST')
+
+# refuse gzipped bodies which inflate to more than this
+MAX_INFLATED_SIZE = 64 * 1024 * 1024
+
+
+class PayloadEncoder(json.JSONEncoder):
+
+    """JSONEncoder which handles datetimes, dates and decimals"""
+
+    def default(self, o):
+        if isinstance(o, datetime.datetime):
+            r = o.isoformat()
+            if o.microsecond:
+                r = r[:23] + r[26:]
+            if r.endswith('+00:00'):
+                r = r[:-6] + 'Z'
+            return r
+        elif isinstance(o, datetime.date):
+            return o.isoformat()
+        elif isinstance(o, decimal.Decimal):
+            return str(o)
+        return super(PayloadEncoder, self).default(o)
+
+
+def encode_payload(kind, payload):
+    """Return payload as compact JSON, ready to be sent to the API"""
+    return json.dumps(compact_payload(kind, payload), cls=PayloadEncoder,
+                      separators=(',', ':'))
+
+
+def payload_fingerprint(payload):
+    """Return a SHA-1 hex digest identifying a match or round payload
+
+    Equal payloads get the same fingerprint whether they are plain or
+    compact, whatever order their keys are in and whether their steamid
+    keys are ints or strings.
+
+    """
+    data = json.dumps(expand_payload(payload), cls=PayloadEncoder,
+                      sort_keys=True, separators=(',', ':'))
+    return hashlib.sha1(data).hexdigest()
+
+
+def gzip_body(data, level=6):
+    buf = cStringIO.StringIO()
+    f = gzip.GzipFile(fileobj=buf, mode='wb', compresslevel=level)
+    f.write(data)
+    f.close()
+    return buf.getvalue()
+
+
+def gunzip_body(data, max_size=MAX_INFLATED_SIZE):
+    """Inflate a gzipped request body
+
+    Raises ValueError if the body is not valid gzip data or would inflate
+    to more than max_size bytes.
+
+    """
+    f = gzip.GzipFile(fileobj=cStringIO.StringIO(data), mode='rb')
+    try:
+        body = f.read(max_size + 1)
+    except (IOError, EOFError, struct.error, zlib.error) as e:
+        raise ValueError('bad gzip body: %s' % e)
+    if len(body) > max_size:
+        raise ValueError('gzip body inflates to more than %d bytes'
+                         % max_size)
+    return body
+
+
+class _Table(object):
+
+    """List of distinct values, numbered in the order they were added"""
+
+    def __init__(self):
+        self.values = []
+        self._index = {}
+
+    def __call__(self, value):
+        i = self._index.get(value)
+        if i is None:
+            i = self._index[value] = len(self.values)
+            self.values.append(value)
+        return i
+
+
+def compact_payload(kind, payload):
+    """Return the compact form of a match or round payload"""
+    if payload.get('discard'):
+        return payload
+    players = _Table()
+    weapons = _Table()
+    compact = dict(payload)
+    if kind == 'round':
+        compact['round'] = _compact_round(payload['round'], players, weapons)
+    elif kind == 'match':
+        compact['match_maps'] = [
+            _compact_match_map(match_map, players, weapons)
+            for match_map in payload['match_maps']]
+    else:
+        raise ValueError('Unknown payload kind: %s' % kind)
+    compact['format'] = COMPACT_FORMAT
+    compact['players'] = players.values
+    compact['weapons'] = weapons.values
+    return compact
+
+
+def _compact_match_map(match_map, players, weapons):
+    compact = dict(match_map)
+    compact['rounds'] = [_compact_round(round, players, weapons)
+                         for round in match_map['rounds']]
+    compact['player_match_weapons'] = [
+        [players(int(steam_id)), weapons(weapon)] +
+        [stats[field] for field in WEAPON_FIELDS]
+        for steam_id, player_weapons
+        in match_map['player_match_weapons'].items()
+        for weapon, stats in player_weapons.items()]
+    return compact
+
+
+def _compact_round(round, players, weapons):
+    flags = 0
+    for i, flag in enumerate(ROUND_FLAGS):
+        if round[flag]:
+            flags |= 1 << i
+    player_rounds = []
+    for steam_id, player_round in round['player_rounds'].items():
+        row = [players(int(steam_id))]
+        row.extend(player_round[field] for field in PLAYER_ROUND_FIELDS)
+        if player_round.get('rws') is not None:
+            row.append(player_round['rws'])
+        player_rounds.append(row)
+    kills = [[players(int(kill['killer'])), _compact_team(kill['killer_team']),
+              players(int(kill['victim'])), _compact_team(kill['victim_team']),
+              int(bool(kill['headshot'])), weapons(kill['weapon'])]
+             for kill in round['kills']]
+    return [round['round_number'], round['score_a'], round['score_b'], flags,
+            player_rounds, kills]
+
+
+def _compact_team(team):
+    # kills on Unassigned or Spectator (or no team at all) happen too
+    if team in TEAMS:
+        return TEAMS.index(team)
+    return team
+
+
+def expand_payload(data):
+    """Return the plain form of a (possibly compact) match or round payload
+
+    Plain payloads are returned as they are. Raises ValueError (or
+    KeyError, IndexError or TypeError) for malformed compact ones.
+
+    """
+    if not isinstance(data, dict) or 'format' not in data:
+        return data
+    if data['format'] != COMPACT_FORMAT:
+        raise ValueError('Unknown payload format: %s' % data['format'])
+    players = data['players']
+    weapons = data['weapons']
+    plain = dict(data)
+    for key in ['format', 'players', 'weapons']:
+        del plain[key]
+    if 'round' in data:
+        plain['round'] = _expand_round(data['round'], players, weapons)
+    else:
+        plain['match_maps'] = [
+            _expand_match_map(match_map, players, weapons)
+            for match_map in data['match_maps']]
+    return plain
+
+
+def _expand_match_map(match_map, players, weapons):
+    plain = dict(match_map)
+    plain['rounds'] = [_expand_round(round, players, weapons)
+                       for round in match_map['rounds']]
+    player_match_weapons = {}
+    for row in match_map['player_match_weapons']:
+        player_weapons = player_match_weapons.setdefault(players[row[0]], {})
+        player_weapons[weapons[row[1]]] = dict(zip(WEAPON_FIELDS, row[2:]))
+    plain['player_match_weapons'] = player_match_weapons
+    return plain
+
+
+def _expand_round(row, players, weapons):
+    round_number, score_a, score_b, flags, player_rounds, kills = row
+    round = {
+        'round_number': round_number,
+        'score_a': score_a,
+        'score_b': score_b,
+        'player_rounds': {},
+        'kills': [],
+    }
+    for i, flag in enumerate(ROUND_FLAGS):
+        round[flag] = bool(flags & (1 << i))
+    n = len(PLAYER_ROUND_FIELDS)
+    for player_row in player_rounds:
+        player_round = dict(zip(PLAYER_ROUND_FIELDS, player_row[1:n + 1]))
+        if len(player_row) > n + 1:
+            player_round['rws'] = player_row[n + 1]
+        round['player_rounds'][players[player_row[0]]] = player_round
+    for killer, killer_team, victim, victim_team, headshot, weapon in kills:
+        round['kills'].append({
+            'killer': players[killer],
+            'killer_team': _expand_team(killer_team),
+            'victim': players[victim],
+            'victim_team': _expand_team(victim_team),
+            'headshot': bool(headshot),
+            'weapon': weapons[weapon],
+        })
+    return round
+
+
+def _expand_team(team):
+    if isinstance(team, int):
+        return TEAMS[team]
+    return team
@@ -0,0 +1,202 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2013 Peter Rowlands
+# All rights reserved.
+"""Offline log replay
+
+Streams log files (plain, gzip or bz2 compressed, or stdin) through a
+GoonPugParser as fast as the parser can go, ignoring the wall clock entirely,
+and keeps enough counters to report parser throughput on real traffic. Only a
+chunk of each file is held in memory at a time.
+
+"""
+
+from __future__ import division, absolute_import
+
+import bz2
+import collections
+import glob
+import os
+import sys
+import time
+import zlib
+
+
+LOG_SUFFIXES = ('.log', '.log.gz', '.log.bz2')
+
+
+def expand_paths(paths):
+    """Expand globs and directories in paths to the log files they name
+
+    Files inside a directory are returned in name order, which for both
+    srcds logs and goonpugd spool files is also chronological order. '-'
+    is passed through and means stdin. Raises IOError if a path does not
+    exist or a glob matches nothing.
+
+    """
+    files = []
+    for path in paths:
+        if path == '-':
+            files.append(path)
+        elif not os.path.exists(path) and glob.has_magic(path):
+            matches = sorted(glob.glob(path))
+            if not matches:
+                raise IOError('No log files match %s' % path)
+            files.extend(expand_paths(matches))
+        elif not os.path.exists(path):
+            raise IOError('No such file or directory: %s' % path)
+        elif os.path.isdir(path):
+            found = []
+            for dirpath, dirnames, filenames in os.walk(path):
+                dirnames.sort()
+                found.extend(os.path.join(dirpath, name)
+                             for name in sorted(filenames)
+                             if name.endswith(LOG_SUFFIXES))
+            files.extend(found)
+        else:
+            files.append(path)
+    return files
+
+
+class GzipReader(object):
+
+    """Reader for a gzip file which may end part way through a member
+
+    gzip.GzipFile raises at the end of such a file and throws away what it
+    had already decompressed, but this is what a goonpugd spool file looks
+    like while it is being written (or after goonpugd was killed). Reads
+    return everything up to the truncation instead.
+
+    """
+
+    def __init__(self, path):
+        self.file = open(path, 'rb')
+        self.decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+
+    def read(self, size):
+        """Return some decompressed data, or '' at the end of the file"""
+        while True:
+            raw = self.file.read(size)
+            if not raw:
+                return ''
+            data = []
+            try:
+                while raw:
+                    data.append(self.decompressor.decompress(raw))
+                    # the rest belongs to the next gzip member
+                    raw = self.decompressor.unused_data
+                    if raw:
+                        self.decompressor = zlib.decompressobj(
+                            16 + zlib.MAX_WBITS)
+            except zlib.error as e:
+                raise IOError('bad gzip data: %s' % e)
+            data = ''.join(data)
+            if data:
+                return data
+
+    def close(self):
+        self.file.close()
+
+
+def open_log(path):
+    if path.endswith('.gz'):
+        return GzipReader(path)
+    elif path.endswith('.bz2'):
+        return bz2.BZ2File(path, 'rb')
+    return open(path, 'rb')
+
+
+def read_lines(path, chunk_size=1024 * 1024):
+    """Yield the lines in a (possibly compressed) log file
+
+    Reads in large chunks since line-at-a-time reads from a GzipFile are
+    very slow. A truncated file (e.g. the current spool file of a goonpugd
+    which was killed) yields everything up to the point of truncation.
+
+    stdin ('-') is read a line at a time instead, so that lines piped in
+    from a live server are parsed as soon as they arrive.
+
+    """
+    if path == '-':
+        for line in iter(sys.stdin.readline, ''):
+            yield line
+        return
+    f = open_log(path)
+    try:
+        tail = ''
+        while True:
+            try:
+                chunk = f.read(chunk_size)
+            except (IOError, EOFError) as e:
+                print u'goonpugd: %s: %s' % (path, e)
+                break
+            if not chunk:
+                break
+            lines = (tail + chunk).split('\n')
+            tail = lines.pop()
+            for line in lines:
+                yield line
+        if tail:
+            yield tail
+    finally:
+        f.close()
+
+
+class MatchCounter(object):
+
+    """Sink which only counts what it is given"""
+
+    def __init__(self):
+        self.counts = collections.Counter()
+
+    def put(self, kind, payload):
+        self.counts[kind] += 1
+
+
+class LogReplay(object):
+
+    """Replays log lines through a parser and counts what it saw"""
+
+    def __init__(self, parser):
+        self.parser = parser
+        self.events = collections.Counter()
+        self.lines = 0
+        self.unmatched = 0
+        self.files = 0
+        self.elapsed = 0.0
+
+    def feed(self, lines):
+        parse_line = self.parser.parse_line
+        events = self.events
+        start = time.time()
+        n = 0
+        unmatched = 0
+        for line in lines:
+            n += 1
+            cls = parse_line(line)
+            if cls is None:
+                unmatched += 1
+            else:
+                events[cls.__name__] += 1
+        self.elapsed += time.time() - start
+        self.lines += n
+        self.unmatched += unmatched
+
+    def replay(self, paths):
+        for path in expand_paths(paths):
+            self.files += 1
+            self.feed(read_lines(path))
+
+    def print_summary(self, prefix=u'goonpugd'):
+        if self.elapsed:
+            rate = self.lines / self.elapsed
+        else:
+            rate = 0
+        print u'%s: parsed %d lines from %d files in %.2fs ' \
+            u'(%d lines/sec)' % (prefix, self.lines, self.files,
+                                 self.elapsed, rate)
+        print u'%s: %d matches produced, %d skipped' % (
+            prefix, self.parser.matches_finished, self.parser.matches_skipped)
+        print u'%s: events:' % prefix
+        for name, count in sorted(self.events.items()):
+            print u'  %s: %d' % (name, count)
+        print u'  unmatched: %d' % self.unmatched
@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2013 Peter Rowlands
+# All rights reserved.
+"""Output sinks for parsed matches
+
+A sink is anything with a put(kind, payload) method, where kind is 'round'
+or 'match' (see Outbox.endpoints) and payload is what GoonPugParser built
+for it. The parser hands every finished round and match to its sink and
+never cares what happens to it next.
+
+Besides the ones here, Outbox (durable queue delivered to the API by an
+OutboxSender) and the counting/collecting stand-ins used for replays and
+imports are sinks too.
+
+"""
+
+from __future__ import division, absolute_import
+
+import json
+import os
+import sys
+import threading
+
+import requests
+
+from .outbox import Outbox
+from .payloads import PayloadEncoder, encode_payload, gzip_body
+
+
+SINKS = ('outbox', 'http', 'file', 'db')
+
+
+class HttpSink(object):
+
+    """POSTs each payload to the GoonPUG API as soon as it is put
+
+    Raises if the API can't be reached or refuses the payload, so whatever
+    was being parsed is lost. Use an Outbox unless that's acceptable.
+
+    """
+
+    def __init__(self, api_url, timeout=30.0):
+        self.api_url = api_url.rstrip('/')
+        self.timeout = timeout
+
+    def put(self, kind, payload):
+        data = gzip_body(encode_payload(kind, payload))
+        r = requests.post('%s/%s' % (self.api_url, Outbox.endpoints[kind]),
+                          data=data, timeout=self.timeout,
+                          headers={'content-type': 'application/json',
+                                   'content-encoding': 'gzip'})
+        r.raise_for_status()
+        print r.text
+
+
+class FileSink(object):
+
+    """Appends each payload to a file as a line of JSON
+
+    Each line is {"kind": ..., "payload": ...}. Writing to '-' (stdout) or
+    a scratch file makes for a dry run which shows what would have been
+    submitted, in the plain rather than the compact payload format. The
+    file is opened in append mode on first use in each process and every
+    line is a single write, so shard processes can share one file.
+
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _open(self):
+        if self._file is None or self._pid != os.getpid():
+            if self.path == '-':
+                self._file = sys.stdout
+            else:
+                self._file = open(self.path, 'ab')
+            self._pid = os.getpid()
+        return self._file
+
+    def put(self, kind, payload):
+        line = json.dumps({'kind': kind, 'payload': payload},
+                          cls=PayloadEncoder) + '\n'
+        with self._lock:
+            f = self._open()
+            f.write(line)
+            f.flush()
+
+    def close(self):
+        if self._file is not None and self._file is not sys.stdout:
+            self._file.close()
+        self._file = None
+
+
+class DatabaseSink(object):
+
+    """Ingests each payload straight into the database, in process
+
+    Runs the same code as the API views, and the deserialization and stats
+    tasks they queue are run synchronously, so nothing is JSON encoded or
+    goes through the web tier or the celery broker. Only for a goonpugd which
+    runs next to the database, since the parser waits on every write.
+
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+
+    def put(self, kind, payload):
+        # the ORM is only loaded once there is something to store
+        from ..apps.core.views import create_pug_match, create_pug_round
+        # one server's payloads at a time, so that rounds and matches from
+        # different servers never race to create the same players
+        with self._lock:
+            if kind == 'match':
+                create_pug_match(payload, eager=True)
+            elif kind == 'round':
+                create_pug_round(payload, eager=True)
+            else:
+                raise ValueError('Unknown sink entry kind: %s' % kind)
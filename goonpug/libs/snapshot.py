@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2013 Peter Rowlands
+# All rights reserved.
+"""Parser state snapshots
+
+goonpugd writes a snapshot of each game server's parser at every round
+boundary (and when it shuts down), so that a restarted daemon can pick up an
+in-progress match where it left off instead of losing it. Snapshots are laid
+out as::
+
+    <snapshot dir>/<ip>_<port>.pickle
+
+goonpugd --follow keeps each log directory's read position together with
+its parser's state in the same way, keyed by directory instead of server
+(see follow.py).
+
+Only the latest snapshot for each server is kept. They are written to a
+temporary file and renamed into place, so a crash leaves either the old
+snapshot or the new one, never a partial one. They are not fsynced, since a
+snapshot lost to a power cut costs no more than not having one.
+
+"""
+
+from __future__ import division, absolute_import
+
+import cPickle as pickle
+import os
+import time
+import traceback
+
+from .spool import server_dirname
+
+
+class SnapshotStore(object):
+
+    """Directory holding the latest parser snapshot for each game server"""
+
+    def __init__(self, path, max_age=6 * 3600):
+        self.path = path
+        self.max_age = max_age
+        if not os.path.isdir(path):
+            os.makedirs(path)
+
+    def filename(self, key):
+        """Return the snapshot file for an (ip, port) address or other key"""
+        if isinstance(key, tuple):
+            key = server_dirname(key)
+        return os.path.join(self.path, '%s.pickle' % key)
+
+    def save(self, address, state):
+        filename = self.filename(address)
+        tmp = '%s.tmp' % filename
+        with open(tmp, 'wb') as f:
+            pickle.dump(state, f, pickle.HIGHEST_PROTOCOL)
+        os.rename(tmp, filename)
+
+    def load(self, address):
+        """Return the snapshot for address, or None
+
+        Snapshots older than max_age seconds (if set) are ignored, since
+        the match they were taken in is long over.
+
+        """
+        filename = self.filename(address)
+        try:
+            if self.max_age is not None and \
+                    time.time() - os.path.getmtime(filename) > self.max_age:
+                return None
+            with open(filename, 'rb') as f:
+                return pickle.load(f)
+        except (IOError, OSError):
+            return None
+        except Exception:
+            print u'goonpugd: ignoring unreadable snapshot %s' % filename
+            traceback.print_exc()
+            return None
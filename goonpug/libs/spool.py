@@ -0,0 +1,193 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2013 Peter Rowlands
+# All rights reserved.
+"""Raw log spool
+
+Every line goonpugd receives is appended to a compressed spool file before it
+is parsed, so a match can always be re-parsed later from what the game server
+actually sent.
+
+Spool files are laid out as::
+
+    <spool dir>/<ip>_<port>/<YYYYmmdd-HHMMSS>.log.gz
+
+where the timestamp is the (UTC) time the file was opened. A server's spool
+is rotated once it grows past max_bytes or gets older than max_age seconds,
+so the files for one server cover consecutive, non-overlapping time ranges.
+
+"""
+
+from __future__ import division, absolute_import
+
+import calendar
+import gzip
+import os
+import time
+import zlib
+
+
+TIMESTAMP_FORMAT = '%Y%m%d-%H%M%S'
+SUFFIX = '.log.gz'
+
+
+def server_dirname(address):
+    return '%s_%d' % (address[0], address[1])
+
+
+def parse_server_dirname(name):
+    """Return the (ip, port) for a spool server directory name"""
+    ip, port = name.rsplit('_', 1)
+    return (ip, int(port))
+
+
+def parse_spool_filename(name):
+    """Return the unix time a spool file was opened at"""
+    return calendar.timegm(time.strptime(name[:-len(SUFFIX)],
+                                         TIMESTAMP_FORMAT))
+
+
+class ServerSpool(object):
+
+    """Buffered, rotating gzip spool for a single game server
+
+    Not thread safe, each spool should only be written to by the worker
+    thread which owns its server.
+
+    """
+
+    def __init__(self, path, max_bytes=64 * 1024 * 1024, max_age=3600,
+                 buffer_size=64 * 1024, flush_interval=1.0,
+                 compresslevel=6):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.buffer_size = buffer_size
+        self.flush_interval = flush_interval
+        self.compresslevel = compresslevel
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        self.file = None
+        self.filename = None
+        self.opened = 0
+        self.written = 0
+        self.buffer = []
+        self.buffered = 0
+        self.last_flush = time.time()
+        self.lines = 0
+
+    def _open(self, now):
+        name = time.strftime(TIMESTAMP_FORMAT, time.gmtime(now)) + SUFFIX
+        self.filename = os.path.join(self.path, name)
+        # Append mode, so a restart within the same second just adds another
+        # gzip member to the existing file
+        self.file = gzip.GzipFile(self.filename, 'ab', self.compresslevel)
+        self.opened = now
+        self.written = 0
+
+    def write(self, line):
+        """Buffer a single raw log line"""
+        # UDP log packets are NUL terminated
+        line = line.rstrip('\x00\r\n') + '\n'
+        self.buffer.append(line)
+        self.buffered += len(line)
+        self.lines += 1
+        if self.buffered >= self.buffer_size:
+            self.flush()
+
+    def flush(self, sync=True):
+        """Write out buffered lines, rotating first if needed
+
+        With sync set the compressor is flushed too, so everything written
+        so far can be read back even if the daemon dies before the file is
+        closed.
+
+        """
+        now = time.time()
+        self.last_flush = now
+        if not self.buffer:
+            return
+        if self.file is not None and (
+                self.written >= self.max_bytes
+                or now - self.opened >= self.max_age):
+            # the buffered lines go to the next file
+            self.file.close()
+            self.file = None
+        if self.file is None:
+            self._open(now)
+        data = ''.join(self.buffer)
+        self.buffer = []
+        self.buffered = 0
+        self.file.write(data)
+        self.written += len(data)
+        if sync:
+            self.file.flush(zlib.Z_SYNC_FLUSH)
+
+    def maybe_flush(self):
+        """Flush if the buffer has been sitting around for too long"""
+        if self.buffer and \
+                time.time() - self.last_flush >= self.flush_interval:
+            self.flush()
+
+    def close(self):
+        if self.buffer:
+            self.flush(sync=False)
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+class LogSpool(object):
+
+    """Spool directory holding a ServerSpool per game server"""
+
+    def __init__(self, path, **kwargs):
+        self.path = path
+        self.spool_kwargs = kwargs
+
+    def open(self, address):
+        return ServerSpool(os.path.join(self.path, server_dirname(address)),
+                           **self.spool_kwargs)
+
+    def servers(self):
+        """Return the (ip, port) of every server with spooled logs"""
+        if not os.path.isdir(self.path):
+            return []
+        servers = []
+        for name in sorted(os.listdir(self.path)):
+            try:
+                servers.append(parse_server_dirname(name))
+            except ValueError:
+                continue
+        return servers
+
+    def files(self, address, start=None, end=None):
+        """Return the spool files for a server, oldest first
+
+        If start and/or end (unix times) are given, only files which may
+        contain lines logged between start and end are returned.
+
+        """
+        path = os.path.join(self.path, server_dirname(address))
+        if not os.path.isdir(path):
+            return []
+        opened = []
+        for name in os.listdir(path):
+            if not name.endswith(SUFFIX):
+                continue
+            try:
+                opened.append((parse_spool_filename(name), name))
+            except ValueError:
+                continue
+        opened.sort()
+        files = []
+        for i, (t, name) in enumerate(opened):
+            if i + 1 < len(opened):
+                closed = opened[i + 1][0]
+            else:
+                closed = None
+            if end is not None and t > end:
+                break
+            if start is not None and closed is not None and closed < start:
+                continue
+            files.append(os.path.join(path, name))
+        return files
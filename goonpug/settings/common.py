@@ -259,6 +259,20 @@ setup_loader()
 ########## END CELERY CONFIGURATION
 
 
+########## GOONPUGD CONFIGURATION
+# Directory where goonpugd queues finished matches until the API accepts them
+GOONPUGD_OUTBOX_DIR = normpath(join(SITE_ROOT, 'var', 'outbox'))
+
+# Directory where goonpugd keeps compressed copies of every received log line,
+# one subdirectory per game server. Set to None to disable spooling.
+GOONPUGD_SPOOL_DIR = normpath(join(SITE_ROOT, 'var', 'spool'))
+
+# Directory where goonpugd saves each game server's parser state at every
+# round, so that matches in progress survive a restart. Set to None to disable.
+GOONPUGD_SNAPSHOT_DIR = normpath(join(SITE_ROOT, 'var', 'snapshots'))
+########## END GOONPUGD CONFIGURATION
+
+
 ########## WSGI CONFIGURATION
 # See: https://docs.djangoproject.com/en/dev/ref/settings/#wsgi-application
 WSGI_APPLICATION = 'wsgi.application'